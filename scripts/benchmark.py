@@ -0,0 +1,360 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from pathlib import Path
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pypinyin
+from pypinyin.phrases_dict import phrases_dict
+
+import merge_texts
+import extract_words
+from executor_backend import available_cpus, positive_int
+
+# 预设的语料规模（总行数）
+SIZES = {
+    "small": 20_000,
+    "medium": 200_000,
+    "large": 1_200_000,
+}
+
+# 合成语料的文件数，第一个文件单独占 LARGEST_FILE_SHARE 的行数，其余按 1/k 递减分配
+CORPUS_FILE_NUM = 40
+LARGEST_FILE_SHARE = 0.35
+
+# 各类行的占比
+LINE_KINDS = [
+    ("simplified", 0.78),
+    ("traditional", 0.05),
+    ("punctuated", 0.06),
+    ("english", 0.03),
+    ("number", 0.02),
+    ("mixed", 0.02),
+    ("comment", 0.015),
+    ("empty", 0.01),
+    ("japanese", 0.015),
+]
+
+# 比较结果时吞吐量下降超过这个比例视为性能回退
+REGRESSION_THRESHOLD = 0.10
+
+COMMON_CHARS = [chr(code) for code in range(0x4e00, 0x9fa6)]
+PUNCTUATIONS = ["，", "、", "。", "！", "？", "；", "：", " ", ",", ".", "·"]
+BRACKETS = [("《", "》"), ("【", "】"), ("（", "）")]
+ENGLISH_WORDS = ["hello", "world", "Python", "GPU", "iPhone", "ZIP", "rime", "fcitx", "TCP", "HTTP"]
+KANA = [chr(code) for code in range(0x3041, 0x3097)] + [chr(code) for code in range(0x30a1, 0x30fb)]
+
+
+def make_vocabulary(rng: random.Random, size: int) -> List[str]:
+    """以 pypinyin 自带的词组为基础生成词表，部分词条由两个词组拼接而成，偶尔混入随机汉字"""
+    phrases = sorted(phrases_dict)
+    vocabulary = []
+    for _ in range(size):
+        roll = rng.random()
+        if roll < 0.6:
+            vocabulary.append(rng.choice(phrases))
+        elif roll < 0.95:
+            vocabulary.append(rng.choice(phrases) + rng.choice(phrases))
+        else:
+            vocabulary.append("".join(rng.choice(COMMON_CHARS) for _ in range(rng.randint(2, 4))))
+    return vocabulary
+
+
+def make_line(rng: random.Random, kind: str, vocabulary: List[str], traditional_chars: List[str]) -> str:
+    word = rng.choice(vocabulary)
+    if kind == "simplified":
+        return word
+    if kind == "traditional":
+        chars = list(word)
+        for _ in range(rng.randint(1, len(chars))):
+            chars[rng.randrange(len(chars))] = rng.choice(traditional_chars)
+        return "".join(chars)
+    if kind == "punctuated":
+        left, right = rng.choice(BRACKETS)
+        parts = [rng.choice(vocabulary) for _ in range(rng.randint(2, 4))]
+        return left + rng.choice(PUNCTUATIONS).join(parts) + right
+    if kind == "english":
+        return rng.choice(ENGLISH_WORDS) + (str(rng.randint(0, 99)) if rng.random() < 0.3 else "")
+    if kind == "number":
+        return str(rng.randint(0, 10 ** 6)) if rng.random() < 0.7 else f"{rng.random() * 100:.2f}"
+    if kind == "mixed":
+        return rng.choice(ENGLISH_WORDS) + word if rng.random() < 0.5 else f"{rng.randint(1, 99)}{word}"
+    if kind == "comment":
+        return rng.choice(["#", "//", "=", "*"]) + " " + word
+    if kind == "empty":
+        return rng.choice(["", " ", "\t"])
+    if kind == "japanese":
+        return "".join(rng.choice(KANA) for _ in range(rng.randint(2, 6))) + word
+    raise ValueError(kind)
+
+
+def file_line_counts(total_lines: int) -> List[int]:
+    """按偏斜分布计算每个文件的行数，模拟 text/从书籍中提取的 这类超大文件"""
+    largest = int(total_lines * LARGEST_FILE_SHARE)
+    weights = [1 / k for k in range(1, CORPUS_FILE_NUM)]
+    rest = total_lines - largest
+    counts = [largest] + [int(rest * w / sum(weights)) for w in weights]
+    counts[-1] += total_lines - sum(counts)
+    return counts
+
+
+def generate_corpus(out_dir: Path, total_lines: int, seed: int = 0) -> Tuple[List[Path], Path]:
+    """生成合成语料，返回词库文本文件列表和一个供 extract_words 使用的段落文本文件"""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, max(1000, total_lines // 2))
+    traditional_chars = sorted(merge_texts.T2S_TRIGGER_CHARS or []) or COMMON_CHARS
+    kinds = [kind for kind, _ in LINE_KINDS]
+    weights = [weight for _, weight in LINE_KINDS]
+
+    txt_files = []
+    for index, count in enumerate(file_line_counts(total_lines)):
+        file_path = out_dir / "text" / f"分类{index % 8}" / f"文件{index}.txt"
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            for kind in rng.choices(kinds, weights, k=count):
+                f.write(make_line(rng, kind, vocabulary, traditional_chars) + "\n")
+        txt_files.append(file_path)
+
+    book_path = out_dir / "books" / "book.txt"
+    book_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(book_path, 'w', encoding='utf-8') as f:
+        for _ in range(max(10, total_lines // 200)):
+            sentences = []
+            for _ in range(rng.randint(2, 6)):
+                sentences.append("".join(rng.choice(vocabulary) for _ in range(rng.randint(3, 10))) + rng.choice("。！？"))
+            f.write("".join(sentences) + "\n\n")
+    return txt_files, book_path
+
+
+def reference_remove_punctuation(line: str) -> str:
+    """引入 LineNormalizer 之前删除符号的写法，逐个 str.replace"""
+    for char in merge_texts.NORMALIZE_DELETE_CHARS:
+        line = line.replace(char, "")
+    return line
+
+
+def reference_normalize(line_strip: str) -> Tuple[str, int]:
+    """
+    引入 LineNormalizer 之前 load_lines 中规范化一行的完整调用链，作为性能和结果一致性的参照。
+
+    line_strip 为已经 strip 且分类为有效的行。依次为: 删除符号、再次 strip 并分类、按标点分割，
+    每段删除空格和 oo、删除符号、繁转简、用 KEEP_REGEX 过滤，取最后一个有效的段。
+    """
+    line = reference_remove_punctuation(line_strip).strip()
+    if merge_texts.classify_line(line) is not merge_texts.LineCategory.VALID:
+        return "", 0
+    line = reference_remove_punctuation(line)
+    segments = merge_texts.PUNCTUATION_RE.split(line)
+    total_long_sentence_num = len(segments) if len(segments) > 1 else 0
+    final_str = ""
+    for segment in segments:
+        segment = segment.strip()
+        if segment:
+            segment = segment.strip().replace(" ", "").replace("oo", "").replace("oo", "")
+            segment = reference_remove_punctuation(segment)
+            segment = merge_texts.to_simplified(segment)
+            chinese_only_segment = "".join(merge_texts.KEEP_REGEX.findall(segment))
+            if chinese_only_segment and merge_texts.check_valid_line(chinese_only_segment):
+                final_str = chinese_only_segment
+    return final_str, total_long_sentence_num
+
+
+def normalizer_mismatches(lines: List[str]) -> List[Tuple[str, Tuple[str, int], Tuple[str, int]]]:
+    """LineNormalizer 与参照实现结果不同的行: (行, 参照结果, LineNormalizer 的结果)"""
+    mismatches = []
+    for line in lines:
+        expected = reference_normalize(line)
+        actual = merge_texts.LINE_NORMALIZER.normalize(line)
+        if actual != expected:
+            mismatches.append((line, expected, actual))
+    return mismatches
+
+
+def measure(func: Callable, repeat: int):
+    """多次运行取最短耗时，同时屏蔽被测函数的打印输出"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def parallel_load(txt_files: List[Path], workers: int) -> int:
+    """用指定进程数完成读取阶段，返回得到的行数"""
+    shard_size = merge_texts.compute_shard_size(txt_files, workers)
+    batches = merge_texts.split_into_batch(merge_texts.split_into_shards(txt_files, shard_size), shard_size)
+    lines_num = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(merge_texts.load_batch_files, batches):
+            lines_num += sum(len(lines) for _, lines, _ in results)
+    return lines_num
+
+
+def run_size(size_name: str, total_lines: int, work_dir: Path, repeat: int, workers_list: List[int], end_to_end: bool) -> List[Dict]:
+    results = []
+
+    def record(name: str, items: int, seconds: float, **extra):
+        entry = {
+            "size": size_name,
+            "benchmark": name,
+            "items": items,
+            "seconds": round(seconds, 6),
+            "items_per_second": round(items / seconds, 2) if seconds > 0 else None,
+        }
+        entry.update(extra)
+        results.append(entry)
+        print(f"[{size_name}] {name}: {items} 项, {seconds:.3f} s, {entry['items_per_second']} 项/秒")
+
+    corpus_dir = work_dir / size_name
+    print(f"[{size_name}] 生成 {total_lines} 行的合成语料: {corpus_dir}")
+    txt_files, book_path = generate_corpus(corpus_dir, total_lines)
+    total_bytes = sum(os.path.getsize(f) for f in txt_files)
+
+    shards = [(f, 0, os.path.getsize(f)) for f in txt_files]
+    seconds, loaded = measure(lambda: merge_texts.load_batch_files(shards), repeat)
+    record("load_batch_files", total_lines, seconds, bytes=total_bytes)
+
+    raw_lines = []
+    for f in txt_files:
+        with open(f, 'r', encoding='utf-8') as infile:
+            raw_lines.extend(line.strip() for line in infile)
+    seconds, _ = measure(lambda: [merge_texts.process_line(line) for line in raw_lines], repeat)
+    record("process_line", len(raw_lines), seconds)
+
+    valid_lines = [line for line in raw_lines if merge_texts.classify_line(line) is merge_texts.LineCategory.VALID]
+    seconds, _ = measure(lambda: [reference_normalize(line) for line in valid_lines], repeat)
+    record("normalize:reference", len(valid_lines), seconds)
+    seconds, _ = measure(lambda: [merge_texts.LINE_NORMALIZER.normalize(line) for line in valid_lines], repeat)
+    mismatches = normalizer_mismatches(valid_lines)
+    record("normalize:LineNormalizer", len(valid_lines), seconds, mismatches=len(mismatches))
+    for line, expected, actual in mismatches[:10]:
+        print(f"[{size_name}] 错误：LineNormalizer 与参照实现的结果不同: {line!r} 参照 {expected!r}，实际 {actual!r}")
+
+    line_counts = Counter(line for _, lines, _ in loaded for line in lines)
+    unique_lines = sorted(line_counts)
+    seconds, pinyin_lists = measure(lambda: [merge_texts.string_to_pinyin_list(line) for line in unique_lines], 1)
+    record("string_to_pinyin_list", len(unique_lines), seconds)
+
+    seconds, _ = measure(lambda: [merge_texts.pinyin_to_xiaohe(p) for p in pinyin_lists], repeat)
+    record("pinyin_to_xiaohe", len(pinyin_lists), seconds)
+
+    lines_with_pinyin = [(line, p, line_counts[line]) for line, p in zip(unique_lines, pinyin_lists) if p]
+    max_count = max(line_counts.values(), default=1)
+    output_dir = corpus_dir / "output"
+    output_dir.mkdir(exist_ok=True)
+    prefix = str(output_dir / "bench")
+    for name in merge_texts.OUTPUT_FORMATS:
+        seconds, _ = measure(lambda: merge_texts.write_output_files(prefix, lines_with_pinyin, [name], max_count), repeat)
+        record(f"write:{name}", len(lines_with_pinyin), seconds)
+    all_formats = list(merge_texts.OUTPUT_FORMATS)
+    seconds, _ = measure(lambda: merge_texts.write_output_files(prefix, lines_with_pinyin, all_formats, max_count), repeat)
+    record("write:all", len(lines_with_pinyin), seconds)
+
+    seconds, words = measure(lambda: extract_words.extract_dictionary_words(book_path), 1)
+    record("extract_dictionary_words", os.path.getsize(book_path), seconds, unit="bytes", words=len(words or ()))
+
+    for workers in workers_list:
+        seconds, _ = measure(lambda: parallel_load(txt_files, workers), 1)
+        record("parallel_load", total_lines, seconds, workers=workers)
+
+    if end_to_end:
+        script = Path(__file__).with_name("merge_texts.py")
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(script), str(corpus_dir / "text"), prefix,
+                        "--enable_rime", "--enable_rime_flypy", "--enable_shouxing", "--enable_qqpinyin"],
+                       check=True, stdout=subprocess.DEVNULL)
+        record("merge_texts.py", total_lines, time.perf_counter() - start)
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare_results(current: List[Dict], baseline_path: str) -> int:
+    """与之前的结果比较，打印吞吐量变化，返回回退的项数"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    def key(entry):
+        return entry["size"], entry["benchmark"], entry.get("workers")
+
+    baseline_map = {key(entry): entry for entry in baseline["results"]}
+    regressions = 0
+    for entry in current:
+        old = baseline_map.get(key(entry))
+        if not old or not old.get("items_per_second") or not entry.get("items_per_second"):
+            continue
+        ratio = entry["items_per_second"] / old["items_per_second"]
+        flag = ""
+        if ratio < 1 - REGRESSION_THRESHOLD:
+            flag = "  <-- 回退"
+            regressions += 1
+        print(f"{entry['size']:>8} {entry['benchmark']:<28} {old['items_per_second']:>14} -> {entry['items_per_second']:>14} ({ratio:.2f}x){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='生成合成语料并测量 merge_texts.py / extract_words.py 各阶段的吞吐量。')
+    parser.add_argument('--sizes', nargs='+', default=["small"], choices=list(SIZES), help='语料规模')
+    parser.add_argument('--workers', nargs='+', type=positive_int, default=[1, available_cpus()], help='对比读取阶段使用的进程数，默认为 1 和可用的 CPU 数')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最短耗时')
+    parser.add_argument('--end_to_end', action='store_true', help='额外测量完整运行 merge_texts.py 的时间')
+    parser.add_argument('--work_dir', type=str, default=None, help='合成语料目录，默认使用临时目录')
+    parser.add_argument('--output', type=str, default="bench_results.json", help='结果 JSON 文件路径')
+    parser.add_argument('--compare', type=str, default=None, help='与之前的结果 JSON 比较，有回退时返回非零退出码')
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        if args.work_dir:
+            work_dir = Path(args.work_dir)
+            work_dir.mkdir(parents=True, exist_ok=True)
+        else:
+            work_dir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="merge_bench_")))
+        results = []
+        for size_name in args.sizes:
+            results.extend(run_size(size_name, SIZES[size_name], work_dir, args.repeat,
+                                    sorted(set(args.workers)), args.end_to_end))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "available_cpus": available_cpus(),
+            "pypinyin": pypinyin.__version__,
+        },
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+    mismatched = sum(entry.get("mismatches", 0) for entry in results)
+    if mismatched:
+        print(f"错误：共 {mismatched} 行 LineNormalizer 与参照实现的结果不同")
+    if args.compare:
+        sys.exit(1 if compare_results(results, args.compare) or mismatched else 0)
+    if mismatched:
+        sys.exit(1)
@@ -0,0 +1,119 @@
+import os
+import shutil
+import pickle
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from line_store import FrontCodedStore
+
+# 读取文件时的块大小
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(file_path: Path) -> str:
+    """计算文件内容的 sha256"""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FileCache:
+    """
+    按文件内容哈希缓存每个文件的处理结果（规范化后的行及其出现次数、统计信息和拼音）。
+
+    规范化后的行以 FrontCodedStore 的序列化数据保存。
+
+    缓存条目保存在 `cache_dir/<version>/` 下，`version` 由调用方根据处理代码和依赖版本生成，
+    版本变化时旧的缓存目录会被整体删除；同一版本内，文件修改后留下的旧条目由 sweep() 清理。
+    """
+
+    def __init__(self, cache_dir: str, version: str):
+        self.root = Path(cache_dir)
+        self.version = version
+        self.entry_dir = self.root / version
+        self.hits: Dict[Path, dict] = {}
+        self.pending: Dict[Path, str] = {}
+        self.pending_results: Dict[Path, tuple] = {}
+        # 本次运行查找过的所有键，命中的和即将写入的条目都在其中
+        self.used_keys: Set[str] = set()
+        self._prune_stale_versions()
+        self.entry_dir.mkdir(parents=True, exist_ok=True)
+
+    def _prune_stale_versions(self):
+        """删除与当前版本不一致的缓存目录"""
+        if not self.root.is_dir():
+            return
+        for child in self.root.iterdir():
+            if child.is_dir() and child.name != self.version:
+                shutil.rmtree(child, ignore_errors=True)
+
+    def _entry_path(self, key: str) -> Path:
+        return self.entry_dir / key[:2] / f"{key}.pkl"
+
+    def lookup(self, file_path: Path) -> Optional[dict]:
+        """查找文件对应的缓存条目，未命中时记录为待处理文件"""
+        key = file_digest(file_path)
+        self.used_keys.add(key)
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.pending[file_path] = key
+            return None
+        self.hits[file_path] = entry
+        return entry
+
+    def record(self, file_path: Path, store: bytes, statics: List[int]):
+        """记录待处理文件的处理结果，拼音在 save 时补齐"""
+        self.pending_results[file_path] = (store, statics)
+
+    def known_pinyin(self) -> Dict[str, List[str]]:
+        """汇总所有命中缓存的拼音"""
+        pinyin_map = {}
+        for entry in self.hits.values():
+            pinyin_map.update(entry["pinyin"])
+        return pinyin_map
+
+    def save(self, pinyin_map: Dict[str, List[str]]) -> int:
+        """将本次新处理的文件写入缓存，返回写入的条目数"""
+        saved = 0
+        for file_path, (store, statics) in self.pending_results.items():
+            key = self.pending[file_path]
+            entry = {
+                "store": store,
+                "statics": statics,
+                "pinyin": {line: pinyin_map[line] for line in FrontCodedStore(store).keys() if line in pinyin_map},
+            }
+            entry_path = self._entry_path(key)
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry_path)
+            saved += 1
+        self.pending_results.clear()
+        return saved
+
+    def sweep(self) -> int:
+        """删除本次运行没有用到的条目（如文件修改前的内容对应的条目）和残留的临时文件，返回删除的文件数"""
+        removed = 0
+        for bucket in self.entry_dir.iterdir():
+            if not bucket.is_dir():
+                continue
+            for entry_path in bucket.iterdir():
+                if entry_path.suffix == ".pkl" and entry_path.stem in self.used_keys:
+                    continue
+                try:
+                    entry_path.unlink()
+                    removed += 1
+                except OSError:
+                    pass
+            try:
+                bucket.rmdir()
+            except OSError:
+                pass
+        return removed
@@ -0,0 +1,109 @@
+import lzma
+import time
+import queue
+import zipfile
+import threading
+from pathlib import Path
+from typing import Optional, TextIO, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:  # zstd 压缩为可选功能，需要 pip install zstandard
+    zstandard = None
+
+# 压缩格式: 名称 -> 文件扩展名，zip 替换原扩展名，其余追加在原文件名之后
+COMPRESSIONS = {
+    "zip": ".zip",
+    "xz": ".xz",
+    "zst": ".zst",
+}
+# 压缩级别，zip 与 zip -9 一致
+ZIP_LEVEL = 9
+XZ_PRESET = 6
+ZSTD_LEVEL = 12
+# 每个压缩线程最多排队的数据块数，写入方超前太多时阻塞，限制内存占用
+COMPRESS_QUEUE_CHUNKS = 8
+
+
+def compression_error(compression: Optional[str]) -> Optional[str]:
+    """检查压缩格式是否可用，不可用时返回错误信息"""
+    if compression == "zst" and zstandard is None:
+        return "zst 压缩需要安装 zstandard (pip install zstandard)"
+    return None
+
+
+def compressed_path(path: str, compression: str) -> str:
+    """压缩后的文件路径，如 a_rime.txt -> a_rime.zip / a_rime.txt.xz"""
+    if compression == "zip":
+        return str(Path(path).with_suffix(COMPRESSIONS[compression]))
+    return path + COMPRESSIONS[compression]
+
+
+class CompressedWriter:
+    """
+    直接写入压缩文件的文本写入器。
+
+    write() 只把数据块放入有界队列，由每个文件独立的后台线程编码并压缩写出。
+    zlib、lzma 和 zstd 压缩时都会释放 GIL，多个输出文件的压缩可以并行进行，
+    也与主线程生成下一批数据并行。zip 文件内只包含一个与原文本文件同名的成员。
+    """
+
+    def __init__(self, path: str, compression: str):
+        self.path = compressed_path(path, compression)
+        if compression == "zip":
+            archive = zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=ZIP_LEVEL)
+            # 直接传成员名时时间戳为 1980-01-01，这里与 zip 命令一样使用写出时的本地时间，
+            # 传入 ZipInfo 时 ZipFile 的压缩方式和级别不会生效，需要在 ZipInfo 上设置
+            member = zipfile.ZipInfo(Path(path).name, time.localtime()[:6])
+            member.compress_type = zipfile.ZIP_DEFLATED
+            member._compresslevel = ZIP_LEVEL
+            self._stream = archive.open(member, 'w', force_zip64=True)
+            self._closers = [self._stream.close, archive.close]
+        elif compression == "xz":
+            self._stream = lzma.open(self.path, 'wb', preset=XZ_PRESET)
+            self._closers = [self._stream.close]
+        elif compression == "zst":
+            self._stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(self.path, 'wb'))
+            self._closers = [self._stream.close]
+        else:
+            raise ValueError(f"不支持的压缩格式: {compression}")
+        self._queue = queue.Queue(COMPRESS_QUEUE_CHUNKS)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=f"compress-{Path(path).name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._stream.write(data.encode('utf-8'))
+            except BaseException as e:
+                self._error = e
+
+    def write(self, data: str):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(data)
+
+    def close(self):
+        """等待后台线程写完剩余数据并关闭文件，压缩过程中的错误在这里抛出"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        for close in self._closers:
+            close()
+        self._closers = []
+        if self._error is not None:
+            raise self._error
+
+
+def open_output(path: str, compression: Optional[str] = None) -> Tuple[Union[TextIO, CompressedWriter], str]:
+    """打开一个输出文件，返回 (可写入 str 的文件对象, 实际文件路径)"""
+    if compression is None:
+        return open(path, 'w', encoding='utf-8'), path
+    writer = CompressedWriter(path, compression)
+    return writer, writer.path
@@ -0,0 +1,225 @@
+import sys
+import mmap
+import time
+import heapq
+import struct
+import argparse
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from line_store import FrontCodedStore, StoreBuilder
+from external_sort import merge_runs, reduce_runs, write_run
+
+# 文件头: 魔数, 词条数, 按词查找的 store 字节数, 按拼音查找的 store 字节数
+INDEX_HEADER = struct.Struct("<4sIQQ")
+INDEX_MAGIC = b"DIX1"
+# 键内各字段的分隔符，词和拼音中都不会出现
+FIELD_SEP = "\t"
+# 查询时可以使用的音节分隔符
+PINYIN_SEPS = str.maketrans("", "", "' ")
+# 命令行前缀查询默认返回的候选数
+DEFAULT_LIMIT = 20
+# 暂存的每个拼音键除字符本身外大约占用的内存（str 对象头和字典槽位），用于估计何时写出临时文件
+PENDING_KEY_OVERHEAD = 128
+
+# 一条查询结果: (词, 带 ' 分隔的拼音, 出现次数)
+Entry = Tuple[str, str, int]
+
+
+def normalize_pinyin(pinyin: str) -> str:
+    """去掉音节分隔符并转为小写，ni'hao、ni hao 和 nihao 视为同一个拼音"""
+    return pinyin.translate(PINYIN_SEPS).lower()
+
+
+class IndexBuilder:
+    """
+    在写出词库的同时收集 (词, 拼音列表, 出现次数)，生成查询索引。
+
+    按词查找的键为 词\\t拼音，按拼音查找的键为 小写的连写拼音\\t带分隔的拼音\\t词，都存放在 FrontCodedStore 中。
+    词按序到达，前者边收集边编码；后者需要重新排序，先暂存在内存中。
+    指定 max_memory（字节）时，暂存的拼音键超过上限就排序后写入临时文件，build() 时再归并，
+    外部排序模式下内存占用不随词库大小增长。
+    """
+
+    def __init__(self, max_memory: Optional[int] = None):
+        self._words = StoreBuilder()
+        self._pinyin_keys: Dict[str, int] = {}
+        self._pending_bytes = 0
+        self._max_memory = max_memory
+        self._run_dir = None
+        self._run_paths: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def add(self, word: str, pinyin_list: List[str], count: int):
+        quoted_pinyin = "'".join(pinyin_list)
+        self._words.add(f"{word}{FIELD_SEP}{quoted_pinyin}", count)
+        key = f"{''.join(pinyin_list).lower()}{FIELD_SEP}{quoted_pinyin}{FIELD_SEP}{word}"
+        self._pinyin_keys[key] = count
+        if self._max_memory is not None:
+            self._pending_bytes += len(key) + PENDING_KEY_OVERHEAD
+            if self._pending_bytes >= self._max_memory:
+                self._spill()
+
+    def _spill(self):
+        """把暂存的拼音键排序后写入临时文件"""
+        if self._run_dir is None:
+            self._run_dir = tempfile.TemporaryDirectory(prefix="dict_index_")
+        self._run_paths.append(write_run(self._pinyin_keys, self._run_dir.name))
+        self._pinyin_keys = {}
+        self._pending_bytes = 0
+
+    def _sorted_pinyin_keys(self) -> Iterator[Tuple[str, int]]:
+        if not self._run_paths:
+            yield from ((key, self._pinyin_keys[key]) for key in sorted(self._pinyin_keys))
+            return
+        if self._pinyin_keys:
+            self._spill()
+        yield from merge_runs(reduce_runs(self._run_paths, self._run_dir.name))
+
+    def tap(self, lines_with_pinyin: Iterable[Tuple[str, List[str], int]]) -> Iterator[Tuple[str, List[str], int]]:
+        """原样产出 (行, 拼音列表, 出现次数)，同时加入索引，用于挂在写文件的数据流上"""
+        for line, pinyin_list, count in lines_with_pinyin:
+            self.add(line, pinyin_list, count)
+            yield line, pinyin_list, count
+
+    def build(self) -> bytes:
+        pinyin = StoreBuilder()
+        try:
+            for key, count in self._sorted_pinyin_keys():
+                pinyin.add(key, count)
+        finally:
+            self._pinyin_keys = {}
+            self._run_paths = []
+            if self._run_dir is not None:
+                self._run_dir.cleanup()
+                self._run_dir = None
+        words_data = self._words.build()
+        pinyin_data = pinyin.build()
+        header = INDEX_HEADER.pack(INDEX_MAGIC, len(self._words), len(words_data), len(pinyin_data))
+        # 两个 store 的长度都是 8 的倍数，文件头之后的数据保持 8 字节对齐
+        return b"".join((header, b"\0" * (-INDEX_HEADER.size % 8), words_data, pinyin_data))
+
+    def write(self, path: str) -> int:
+        """写出索引文件，返回文件字节数"""
+        data = self.build()
+        with open(path, 'wb') as f:
+            f.write(data)
+        return len(data)
+
+
+class DictIndex:
+    """
+    用 mmap 打开的词库查询索引，不把词库载入内存。
+
+    按词、按完整拼音、按拼音前缀查询，每次查询只需二分查找块头并解码一两个块。
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, words_len, _ = INDEX_HEADER.unpack_from(self._mmap, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} 不是有效的词库索引")
+        words_start = INDEX_HEADER.size + (-INDEX_HEADER.size % 8)
+        self._words = FrontCodedStore(self._mmap, words_start)
+        self._pinyin = FrontCodedStore(self._mmap, words_start + words_len)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def __contains__(self, word: str) -> bool:
+        return next(self._words.iter_prefix_raw(f"{word}{FIELD_SEP}".encode('utf-8')), None) is not None
+
+    def lookup_word(self, word: str) -> List[Entry]:
+        """查询词的拼音和出现次数，词不存在时返回空列表"""
+        entries = []
+        for key, count in self._words.iter_prefix(f"{word}{FIELD_SEP}"):
+            _, quoted_pinyin = key.split(FIELD_SEP)
+            entries.append((word, quoted_pinyin, count))
+        return entries
+
+    def _iter_pinyin(self, prefix: str) -> Iterator[Entry]:
+        for key, count in self._pinyin.iter_prefix(prefix):
+            _, quoted_pinyin, word = key.split(FIELD_SEP)
+            yield word, quoted_pinyin, count
+
+    def lookup_pinyin(self, pinyin: str) -> List[Entry]:
+        """查询拼音完全相同的词，按出现次数从高到低排列"""
+        entries = list(self._iter_pinyin(f"{normalize_pinyin(pinyin)}{FIELD_SEP}"))
+        return sorted(entries, key=lambda entry: entry[2], reverse=True)
+
+    def complete(self, prefix: str, limit: Optional[int] = DEFAULT_LIMIT) -> List[Entry]:
+        """查询拼音以 prefix 开头的词，按出现次数从高到低取前 limit 个，模拟输入法的候选词"""
+        entries = self._iter_pinyin(normalize_pinyin(prefix))
+        if limit is None:
+            return sorted(entries, key=lambda entry: entry[2], reverse=True)
+        return heapq.nlargest(limit, entries, key=lambda entry: entry[2])
+
+    def close(self):
+        self._words = self._pinyin = None
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def print_entries(entries: List[Entry]):
+    for word, quoted_pinyin, count in entries:
+        print(f"{word} {quoted_pinyin} {count}")
+
+
+def check_coverage(index: DictIndex, words_file: str, show_missing: bool):
+    """统计词表文件中被词库收录的词数"""
+    with open(words_file, 'r', encoding='utf-8') as f:
+        words = [line.strip() for line in f if line.strip()]
+    start = time.perf_counter()
+    missing = [word for word in words if word not in index]
+    elapsed = time.perf_counter() - start
+    covered = len(words) - len(missing)
+    print(f"收录 {covered} / {len(words)} 个词，覆盖率 {covered / len(words):.2%}" if words else "词表为空")
+    if words:
+        print(f"平均每次查询 {elapsed / len(words) * 1e6:.1f} 微秒")
+    if show_missing:
+        for word in missing:
+            print(word)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='查询 merge_texts.py --query_index 生成的词库索引。')
+    parser.add_argument('index', type=str, help='索引文件路径')
+    parser.add_argument('--word', type=str, nargs='+', default=[], help='查询词是否收录及其拼音')
+    parser.add_argument('--pinyin', type=str, nargs='+', default=[], help="查询完整拼音对应的词，音节之间可以用 ' 或空格分隔，也可以连写")
+    parser.add_argument('--prefix', type=str, nargs='+', default=[], help='查询拼音以此开头的候选词')
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help='前缀查询返回的候选词个数')
+    parser.add_argument('--coverage', type=str, default=None, help='每行一个词的词表文件，统计被词库收录的比例')
+    parser.add_argument('--show_missing', action='store_true', help='统计覆盖率时列出未收录的词')
+
+    args = parser.parse_args()
+
+    with DictIndex(args.index) as index:
+        print(f"索引中共有 {len(index)} 个词")
+        found = True
+        for word in args.word:
+            entries = index.lookup_word(word)
+            found = found and bool(entries)
+            if entries:
+                print_entries(entries)
+            else:
+                print(f"未收录: {word}")
+        for pinyin in args.pinyin:
+            entries = index.lookup_pinyin(pinyin)
+            found = found and bool(entries)
+            if entries:
+                print_entries(entries)
+            else:
+                print(f"没有拼音为 {pinyin} 的词")
+        for prefix in args.prefix:
+            print_entries(index.complete(prefix, args.limit))
+        if args.coverage:
+            check_coverage(index, args.coverage, args.show_missing)
+    sys.exit(0 if found else 1)
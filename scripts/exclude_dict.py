@@ -0,0 +1,141 @@
+import os
+import heapq
+import bisect
+import hashlib
+from array import array
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional
+
+# 每个词只保存 8 字节的 blake2b 摘要，误判概率可以忽略；摘要存放在排好序的 array('Q') 中，百万词的排除表约 8MB
+DIGEST_BYTES = 8
+# 排除表缓存格式版本，修改解析规则或摘要算法时需要递增
+EXCLUDE_CACHE_FORMAT = "2"
+# rime 词库 (*.dict.yaml) 中 YAML 头与词条之间的分隔行
+RIME_HEADER_END = "..."
+# 读取文件时的块大小
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def word_digest(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=DIGEST_BYTES).digest(), 'little')
+
+
+def pick_word(fields: List[str]) -> str:
+    """从一行的各列中取出词: 第一个含非 ASCII 字符的列，兼容 拼音在前 的 QQ 拼音格式，否则为第一列"""
+    for field in fields:
+        if not field.isascii():
+            return field
+    return fields[0]
+
+
+def iter_dict_words(dict_path: str) -> Iterator[str]:
+    """
+    读取词库文件中的词，支持以下格式:
+
+    - rime 词库 (*.yaml): 跳过 ... 之前的 YAML 头，之后每行 词\\t编码\\t权重；没有 ... 行时从头解析整个文件
+    - fcitx5 / 手心等文本词库: 每行 词 拼音 权重，或 QQ 拼音的 拼音 词 权重
+    - 纯词表: 每行一个词
+
+    空行和 # 开头的注释行会被跳过。
+    """
+    with open(dict_path, 'r', encoding='utf-8', errors='ignore') as f:
+        lines = f
+        if dict_path.endswith(".yaml"):
+            header = []
+            for line in f:
+                if line.rstrip() == RIME_HEADER_END:
+                    header = None
+                    break
+                header.append(line)
+            if header is not None:
+                print(f"Warning：{dict_path} 中没有 YAML 头的结束行 {RIME_HEADER_END}，按不带 YAML 头的词库解析")
+                lines = header
+        for line in lines:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            yield pick_word(fields)
+
+
+def dict_digests(dict_path: str, normalize: Callable[[str], str] = None) -> array:
+    """词库文件中所有词的摘要，排序去重，指定 normalize 时先规范化每个词，规范化后为空的词丢弃"""
+    words = iter_dict_words(dict_path)
+    if normalize is not None:
+        words = filter(None, map(normalize, words))
+    return array('Q', sorted({word_digest(word) for word in words}))
+
+
+def file_key(dict_path: str, version: str = "") -> str:
+    """按文件内容、缓存格式版本和规范化规则的版本生成缓存文件名"""
+    h = hashlib.sha256(f"{EXCLUDE_CACHE_FORMAT}:{version}".encode('utf-8'))
+    with open(dict_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_digests(dict_path: str, cache_dir: Optional[str] = None, normalize: Callable[[str], str] = None, version: str = "") -> array:
+    """
+    读取词库文件的摘要表，指定 cache_dir 时按文件内容缓存，内容未变化的词库直接读取缓存。
+
+    version 标识 normalize 的规则，规则变化时缓存失效。
+    """
+    if cache_dir is None:
+        return dict_digests(dict_path, normalize)
+    cache_path = Path(cache_dir) / f"{file_key(dict_path, version)}.bin"
+    digests = array('Q')
+    try:
+        with open(cache_path, 'rb') as f:
+            digests.frombytes(f.read())
+        return digests
+    except OSError:
+        pass
+    digests = dict_digests(dict_path, normalize)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        digests.tofile(f)
+    os.replace(tmp_path, cache_path)
+    return digests
+
+
+def merge_digests(digest_arrays: List[array]) -> array:
+    """归并多个排好序的摘要表，去掉重复的摘要"""
+    if len(digest_arrays) == 1:
+        return digest_arrays[0]
+    merged = array('Q')
+    previous = None
+    for digest in heapq.merge(*digest_arrays):
+        if digest != previous:
+            merged.append(digest)
+            previous = digest
+    return merged
+
+
+class ExcludeSet:
+    """
+    需要从输出中排除的词的集合，如 rime / libime 自带词库中已有的词。
+
+    每个词以 8 字节摘要表示，不保存词本身。所有摘要存放在一个排好序的 array('Q') 中，查询时二分查找，
+    每个词只占 8 字节，而放进 Python 的整数集合每个词约占 70 字节。
+    摘要表按词库文件内容缓存为紧凑的二进制文件，再次加载时只需读入文件，多个词库的摘要表线性归并。
+    词库中的词需要先经过与语料行相同的规范化（如繁转简），否则繁体词库中的词永远不会与规范化后的行匹配，
+    见 from_files() 的 normalize 参数。
+    """
+
+    def __init__(self, digests: Iterable[int] = ()):
+        self._digests = array('Q', sorted(set(digests)))
+
+    @classmethod
+    def from_files(cls, dict_paths: List[str], cache_dir: Optional[str] = None, normalize: Callable[[str], str] = None, version: str = "") -> "ExcludeSet":
+        exclude = cls()
+        exclude._digests = merge_digests([load_digests(dict_path, cache_dir, normalize, version) for dict_path in dict_paths])
+        return exclude
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def __contains__(self, word: str) -> bool:
+        digest = word_digest(word)
+        i = bisect.bisect_left(self._digests, digest)
+        return i < len(self._digests) and self._digests[i] == digest
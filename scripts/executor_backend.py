@@ -0,0 +1,225 @@
+import os
+import sys
+import math
+import time
+import signal
+import argparse
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from profiling import Profiler
+
+# 可选的执行后端，auto 按可用 CPU 数和预计工作量自动选择
+BACKENDS = ("auto", "serial", "threads", "processes")
+# 启动执行器的大致开销（秒），预计并行节省的时间不超过它时直接在主进程中串行执行。
+# 进程池按启动方式区分: fork 出的进程直接继承已加载的词典，spawn / forkserver 需要在每个进程中重新导入模块
+POOL_STARTUP_SECONDS = {"threads": 0.01, "fork": 0.05, "spawn": 2.0, "forkserver": 2.0}
+# 单个任务的耗时范围（秒）：太短时提交和传回结果的开销占比过高，太长时负载不均衡、进度也不及时
+MIN_TASK_SECONDS = 0.05
+MAX_TASK_SECONDS = 2.0
+# 工作量足够时每个工作者平均分到的任务数，任务越多负载越均衡
+TASKS_PER_WORKER = 4
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+
+def _read_cpu_max(directory: Path) -> Optional[float]:
+    """cgroup v2 的 cpu.max: "配额 周期"，配额为 max 表示不限制"""
+    try:
+        quota, period = (directory / "cpu.max").read_text().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_cfs_quota(directory: Path) -> Optional[float]:
+    """cgroup v1 的 cpu.cfs_quota_us / cpu.cfs_period_us，配额为 -1 表示不限制"""
+    try:
+        quota = int((directory / "cpu.cfs_quota_us").read_text())
+        period = int((directory / "cpu.cfs_period_us").read_text())
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """
+    当前进程所在 cgroup（及其各级父 cgroup）限制的 CPU 核数，取最严格的一级，没有限制或无法读取时返回 None。
+
+    容器中 /proc/self/cgroup 里的路径可能不在挂载点下，此时只检查挂载点本身。
+    """
+    try:
+        lines = Path("/proc/self/cgroup").read_text().splitlines()
+    except OSError:
+        return None
+    limits = []
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        if controllers == "":
+            roots, read_quota = [CGROUP_ROOT, CGROUP_ROOT / "unified"], _read_cpu_max
+        elif "cpu" in controllers.split(","):
+            roots, read_quota = [CGROUP_ROOT / "cpu", CGROUP_ROOT / "cpu,cpuacct", CGROUP_ROOT / controllers], _read_cfs_quota
+        else:
+            continue
+        for root in roots:
+            directory = root / path.lstrip("/")
+            if not directory.is_dir():
+                directory = root
+            while True:
+                quota = read_quota(directory)
+                if quota is not None:
+                    limits.append(quota)
+                if directory == root or directory == directory.parent:
+                    break
+                directory = directory.parent
+    return min(limits) if limits else None
+
+
+def available_cpus() -> int:
+    """
+    当前进程实际可用的 CPU 数，代替 os.cpu_count()。
+
+    同时考虑 CPU 亲和性（taskset、cpuset）和 cgroup 的 CPU 配额（docker --cpus、k8s limits），
+    配额不是整数时向上取整。
+    """
+    if hasattr(os, "process_cpu_count"):
+        cpus = os.process_cpu_count()
+    elif hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count()
+    cpus = cpus or 1
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def positive_int(value: str) -> int:
+    """argparse 的 type，用于 --workers 等必须至少为 1 的参数"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} 不是整数")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"必须至少为 1，得到 {number}")
+    return number
+
+
+def is_free_threaded() -> bool:
+    """是否运行在关闭了 GIL 的 CPython (3.13t 等) 上，此时线程可以真正并行执行 Python 代码"""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def startup_seconds(backend: str, mp_context=None) -> float:
+    """启动执行器的大致开销，进程池按 mp_context（默认为 multiprocessing 的默认启动方式）估计"""
+    if backend != "processes":
+        return POOL_STARTUP_SECONDS.get(backend, 0.0)
+    method = (mp_context or multiprocessing.get_context()).get_start_method()
+    return POOL_STARTUP_SECONDS.get(method, POOL_STARTUP_SECONDS["spawn"])
+
+
+def choose_backend(requested: str, workers: int, estimated_seconds: Optional[float] = None, mp_context=None) -> str:
+    """
+    确定执行后端。requested 不为 auto 时原样返回。
+
+    auto 时只有一个工作者、或预计的工作量并行后省下的时间抵不上启动执行器的开销时串行执行；
+    否则在 free-threaded 构建上使用线程，其余情况使用进程。
+    """
+    if requested != "auto":
+        return requested
+    if workers <= 1:
+        return "serial"
+    backend = "threads" if is_free_threaded() else "processes"
+    if estimated_seconds is not None and estimated_seconds * (1 - 1 / workers) <= startup_seconds(backend, mp_context):
+        return "serial"
+    return backend
+
+
+class SerialExecutor(Executor):
+    """在调用 submit() 的线程中立即执行任务，接口与进程池相同，调用方不必区分是否并行"""
+
+    def __init__(self, initializer: Callable = None, initargs: tuple = ()):
+        if initializer is not None:
+            initializer(*initargs)
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        return future
+
+
+def _init_pool_worker(initializer: Optional[Callable]):
+    """
+    进程池工作进程忽略 SIGINT，Ctrl+C 只由主进程处理: 主进程取消排队的任务、等正在执行的任务结束后释放其结果。
+    否则工作进程可能在持有任务队列的锁时被中断，其余工作进程永远拿不到锁，进程池无法关闭。
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer()
+
+
+def open_executor(backend: str, workers: int, mp_context=None, initializer: Callable = None) -> Executor:
+    """按后端名创建执行器，mp_context 只对进程池有效，进程池的工作进程忽略 SIGINT"""
+    if backend == "serial":
+        return SerialExecutor(initializer)
+    if backend == "threads":
+        return ThreadPoolExecutor(max_workers=workers, initializer=initializer)
+    if backend == "processes":
+        return ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=_init_pool_worker, initargs=(initializer,))
+    raise ValueError(f"未知的执行后端 {backend}")
+
+
+class ChunkPlanner:
+    """
+    根据实测的单位成本（处理每个字节或每行的秒数）决定任务块的大小。
+
+    seconds_per_item 为初始估计值，measure() 每收到一个任务的实际耗时就更新为累计的平均成本。
+    块的大小首先保证每个工作者分到 TASKS_PER_WORKER 个任务，再限制每个任务的预计耗时
+    在 MIN_TASK_SECONDS 和 MAX_TASK_SECONDS 之间，最后限制在 [min_items, max_items] 内。
+    """
+
+    def __init__(self, workers: int, seconds_per_item: float, min_items: int = 1, max_items: Optional[int] = None):
+        assert workers >= 1, f"工作者数必须至少为 1: {workers}"
+        self.workers = workers
+        self.seconds_per_item = seconds_per_item
+        self.min_items = min_items
+        self.max_items = max_items
+        self._items = 0
+        self._seconds = 0.0
+
+    def measure(self, items: int, seconds: float):
+        if items <= 0 or seconds <= 0:
+            return
+        self._items += items
+        self._seconds += seconds
+        self.seconds_per_item = self._seconds / self._items
+
+    def estimated_seconds(self, items: int) -> float:
+        return items * self.seconds_per_item
+
+    def chunk_size(self, total_items: int) -> int:
+        """total_items 为剩余的工作量，返回下一个任务块的大小"""
+        size = -(-total_items // (self.workers * TASKS_PER_WORKER))
+        size = max(size, math.ceil(MIN_TASK_SECONDS / self.seconds_per_item))
+        size = min(size, max(1, int(MAX_TASK_SECONDS / self.seconds_per_item)))
+        if self.max_items is not None:
+            size = min(size, self.max_items)
+        return max(size, self.min_items)
+
+    def calibrate(self, profiler: Profiler, items: int, func: Callable, *args) -> Future:
+        """
+        在主进程中执行一个任务并用它的耗时校准单位成本，返回已经完成的 Future，
+        与提交到执行器的任务一样用 profiler.result() 取出结果。
+        """
+        start = time.perf_counter()
+        future = profiler.submit(SerialExecutor(), func, *args)
+        self.measure(items, time.perf_counter() - start)
+        return future
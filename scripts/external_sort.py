@@ -0,0 +1,60 @@
+import os
+import heapq
+import tempfile
+from typing import Dict, Iterator, List, Tuple
+
+# 一次归并最多同时打开的临时文件数，超过时先分组归并成更大的临时文件
+MERGE_FAN_IN = 64
+# 临时文件中行与出现次数之间的分隔符，规范化后的行中不会出现空白字符
+COUNT_SEP = "\t"
+
+
+def write_run(counts: Dict[str, int], run_dir: str) -> str:
+    """将 行 -> 出现次数 按行排序后写入临时文件，返回文件路径（行中不能包含换行符，读取时从最后一个制表符处分出次数）"""
+    fd, path = tempfile.mkstemp(suffix=".run", dir=run_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
+        for line in sorted(counts):
+            f.write(f"{line}{COUNT_SEP}{counts[line]}\n")
+    return path
+
+
+def iter_run(path: str) -> Iterator[Tuple[str, int]]:
+    """按行读取临时文件，产出 (行, 出现次数)"""
+    with open(path, 'r', encoding='utf-8', newline='\n') as f:
+        for row in f:
+            line, _, count = row[:-1].rpartition(COUNT_SEP)
+            yield line, int(count)
+
+
+def merge_runs(paths: List[str]) -> Iterator[Tuple[str, int]]:
+    """对多个已排序的临时文件做 k 路归并，相同的行只输出一次并累加出现次数"""
+    previous = None
+    total = 0
+    for line, count in heapq.merge(*(iter_run(path) for path in paths)):
+        if line == previous:
+            total += count
+            continue
+        if previous is not None:
+            yield previous, total
+        previous = line
+        total = count
+    if previous is not None:
+        yield previous, total
+
+
+def merge_runs_to_file(paths: List[str], run_dir: str) -> str:
+    """将多个临时文件归并成一个新的临时文件，并删除输入文件"""
+    fd, out_path = tempfile.mkstemp(suffix=".run", dir=run_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
+        for line, count in merge_runs(paths):
+            f.write(f"{line}{COUNT_SEP}{count}\n")
+    for path in paths:
+        os.remove(path)
+    return out_path
+
+
+def reduce_runs(paths: List[str], run_dir: str, fan_in: int = MERGE_FAN_IN) -> List[str]:
+    """临时文件过多时分组预归并，直到可以一次打开全部文件"""
+    while len(paths) > fan_in:
+        paths = [merge_runs_to_file(paths[i:i + fan_in], run_dir) for i in range(0, len(paths), fan_in)]
+    return paths
@@ -3,11 +3,18 @@ import jieba
 import jieba.analyse
 import re
 import os
-from typing import Set, List
+import gc
+import sys
+import multiprocessing
+from typing import Iterator, Set, List, Tuple
 import jieba.posseg as pseg # 导入词性标注模块
-from concurrent.futures import ProcessPoolExecutor, as_completed # Use ProcessPoolExecutor
+from concurrent.futures import as_completed, wait, FIRST_COMPLETED
 from pathlib import Path
 from opencc import OpenCC
+from profiling import Profiler
+from shm_transport import PackedStrings, SharedStrings, export_strings, release_unread
+from text_input import Span, iter_paragraph_split, read_span_paragraphs
+from executor_backend import BACKENDS, ChunkPlanner, available_cpus, choose_backend, open_executor, positive_int
 
 
 MIN_WORD_LENGTH = 2
@@ -19,6 +26,14 @@ EXTENSIONS = ['.txt', '.md']
 ALLOW_POS = ('n', 'v', 'vn', 'vg', 'vs', 'nr', 'ns', 'nt', 'nz','a','c')
 LCUT_OPS = ('n', 'ns','nr','nt','nz','v', 'vn')
 
+# 单个进程中 jieba 分词每字节的大致耗时（秒），用于在第一个任务完成前估计工作量和任务块大小，之后按实测值调整
+EXTRACT_SECONDS_PER_BYTE = 3.5e-5
+# 任务块的字节数范围，在按耗时计算出的大小之外再做限制，避免块被切得过碎、单块占用内存过大
+MIN_CHUNK_BYTES = 1 << 12
+MAX_CHUNK_BYTES = 1 << 22
+# 每个进程最多同时排队的任务块数，限制驻留在内存中的段落
+MAX_PENDING_PER_WORKER = 2
+
 # 创建全局转换器（避免重复创建）
 try:
     cc_t2s = OpenCC('t2s')
@@ -103,119 +118,194 @@ def process_paragraphs(paragraphs: List[str], use_rank=False) -> Set[str]:
         local_dictionary_words.update(process_paragraph(paragraph, use_rank))
     return local_dictionary_words
 
-def extract_dictionary_words(input_filepath, use_rank=False) -> Set[str]:
+def process_spans_shared(spans: List[Span], use_rank=False) -> Tuple[SharedStrings, int]:
     """
-    读取文本文件，使用 jieba 分词，提取常见的、适合做词典的词语，
-    去重后存入新文件，每行一个词。
+    在工作进程中读取一个任务块的各段文件内容并提取词语，返回 (共享内存中的词语, 段落数)。
 
-    Args:
-        input_filepath (str): 输入的 txt 文件路径。
-        output_filepath (str): 输出的词语文件路径。
+    段落直接从 mmap 解码，主进程只传递文件偏移量；词语打包写入共享内存，主进程不再逐个反序列化集合中的字符串，
+    而是整块解码后并入总的词语集合。
+    """
+    local_dictionary_words = set()
+    paragraph_count = 0
+    for span in spans:
+        try:
+            paragraphs = read_span_paragraphs(span)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"读取文件 '{span[0]}' [{span[1]}, {span[2]}) 时出错：{e}")
+            continue
+        paragraph_count += len(paragraphs)
+        local_dictionary_words.update(process_paragraphs(paragraphs, use_rank))
+    return export_strings(local_dictionary_words), paragraph_count
+
+def preload_jieba():
+    """
+    在主进程中加载 jieba 的词典、HMM 和词性表。
+
+    之后 fork 出的工作进程直接继承已加载的模型，以写时复制方式共享内存页，
+    不再各自花几秒钟重新构建。gc.freeze() 把这些对象移出垃圾回收的扫描范围，
+    避免子进程中的 GC 改写对象头而触发页面复制。
+    """
+    jieba.initialize()
+    gc.collect()
+    gc.freeze()
+
+def preload_context(preload: bool):
+    """预加载模型后用于 fork 工作进程的启动方式上下文，不预加载或不支持 fork 时返回 None（使用默认启动方式）"""
+    if preload and sys.platform != "darwin" and "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+def worker_pool_options(preload: bool):
+    """
+    返回创建进程池所需的 (启动方式上下文, 工作进程初始化函数)。
+
+    支持 fork 时在主进程预加载模型后 fork 工作进程；不支持时（Windows、macOS）
+    工作进程启动时立即从 jieba 的序列化词典缓存加载模型，而不是在处理第一个任务时才加载。
+    preload 为 False 时保持 jieba 默认的惰性加载。
+    """
+    if not preload:
+        return None, None
+    mp_context = preload_context(preload)
+    if mp_context is not None:
+        preload_jieba()
+        return mp_context, None
+    return None, jieba.initialize
+
+def total_file_bytes(file_paths: List[Path]) -> int:
+    """所有文件的总字节数，无法访问的文件不计入"""
+    total_bytes = 0
+    for file_path in file_paths:
+        try:
+            total_bytes += os.path.getsize(file_path)
+        except OSError:
+            pass
+    return total_bytes
+
+def iter_span_chunks(file_paths: List[Path], planner: ChunkPlanner, remaining_bytes: int, profiler: Profiler) -> Iterator[List[Span]]:
     """
+    依次在段落边界处切分所有文件，把各段按字节数装成任务块，一个块可以包含多个文件的内容。
+
+    主进程只用 mmap 查找段落分隔符，不解码文件内容，任务块中只有 (文件, 起始字节, 结束字节)。
+    文件是边提交边切分的，每开始一个新块都按 planner 当前的单位成本和剩余字节数重新计算块的大小。
+    """
+    chunk = []
+    chunk_size = 0
+    chunk_bytes = planner.chunk_size(remaining_bytes)
+    for file_path in file_paths:
+        print(f"正在读取文件: {file_path}")
+        try:
+            file_size = os.path.getsize(file_path)
+        except FileNotFoundError:
+            print(f"错误：找不到输入文件 '{file_path}'")
+            continue
+        except OSError as e:
+            print(f"读取文件 '{file_path}' 时出错：{e}")
+            continue
+        span_count = 0
+        spans = iter_paragraph_split(file_path, lambda: chunk_bytes - chunk_size)
+        try:
+            while True:
+                with profiler.stage("read"):
+                    span = next(spans, None)
+                if span is None:
+                    break
+                span_count += 1
+                chunk.append(span)
+                chunk_size += span[2] - span[1]
+                if chunk_size >= chunk_bytes:
+                    yield chunk
+                    remaining_bytes -= chunk_size
+                    chunk = []
+                    chunk_size = 0
+                    chunk_bytes = planner.chunk_size(max(remaining_bytes, 0))
+        except OSError as e:
+            print(f"读取文件 '{file_path}' 时出错：{e}")
+        finally:
+            spans.close()
+        print(f"文件大小 {file_size} 字节，切分为 {span_count} 段")
+    if chunk:
+        yield chunk
+
+def extract_words_from_paths(file_paths: List[Path], use_rank=False, profiler: Profiler = None, preload=True, backend: str = "auto", workers: int = None) -> Set[str]:
+    """
+    用一个执行器处理所有文件，提取常见的、适合做词典的词语。
+
+    所有文件在段落边界处按字节数切成任务块，组成一个全局任务队列提交给同一个执行器，
+    每个工作进程只初始化一次 jieba，小文件不再单独承担进程池的启动开销。
+    任务块只包含文件偏移量，由工作进程自己读取，在途任务块数有上限，内存占用与文件总大小无关。
+
+    backend 为 auto 时按总字节数估计工作量，并行省下的时间抵不上启动进程池的开销时直接在主进程中串行处理；
+    块的大小按已完成任务实测的每字节耗时不断调整。workers 默认为当前进程实际可用的 CPU 数（考虑 cgroup 配额）。
+    """
+    if profiler is None:
+        profiler = Profiler("extract_words")
+    workers = workers or available_cpus()
+    total_bytes = total_file_bytes(file_paths)
+    planner = ChunkPlanner(workers, EXTRACT_SECONDS_PER_BYTE, MIN_CHUNK_BYTES, MAX_CHUNK_BYTES)
+    backend = choose_backend(backend, workers, planner.estimated_seconds(total_bytes), preload_context(preload))
+    if backend == "serial":
+        planner.workers = workers = 1
+    print(f"可用 {workers} 个 CPU 核心，共 {total_bytes} 字节，使用 {backend} 执行，"
+          f"初始任务块大小约 {planner.chunk_size(total_bytes)} 字节。")
+
     dictionary_words = set()
+    pending = {}
+    processed_count = 0
+    paragraph_count = 0
+
+    def collect(done):
+        nonlocal processed_count, paragraph_count
+        for future in done:
+            try:
+                (handle, chunk_len), task = profiler.result_with_task(future, lambda result: result[1])
+                with PackedStrings(handle) as packed:
+                    dictionary_words.update(packed.decode_all())
+                paragraph_count += chunk_len
+                planner.measure(pending[future], task["wall"])
+            except Exception as e:
+                print(f"\n获取任务结果时出错: {e}")
+            finally:
+                # 读取结果之后才移出 pending，中断时 release_unread() 仍能释放它
+                pending.pop(future)
+            processed_count += 1
+            print(f"\r已处理: {processed_count} 个任务块，{paragraph_count} 个段落", end="")
+
+    with profiler.stage("init"):
+        if backend == "processes":
+            mp_context, initializer = worker_pool_options(preload)
+        else:
+            # 串行和线程都直接使用主进程中的模型
+            mp_context, initializer = None, None
+            if preload:
+                jieba.initialize()
+
+    with profiler.stage("extract") as extract_stage, \
+            open_executor(backend, workers, mp_context, initializer) as executor:
+        # 出错或按 Ctrl+C 中断时，在关闭执行器之前释放还没有读取的结果
+        try:
+            for chunk in iter_span_chunks(file_paths, planner, total_bytes, profiler):
+                future = profiler.submit(executor, process_spans_shared, chunk, use_rank)
+                pending[future] = sum(end - start for _, start, end in chunk)
+                if len(pending) >= workers * MAX_PENDING_PER_WORKER:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            collect(as_completed(list(pending)))
+        finally:
+            release_unread(pending, lambda value: value[0][0])
+        extract_stage.lines = paragraph_count
+
+    print("\n处理完成。")
+    return dictionary_words
 
-    print(f"正在读取文件: {input_filepath}")
-    try:
-        # with open(input_filepath, 'r', encoding='utf-8') as infile:
-        #     for i, line in enumerate(infile):
-        #         # 去除行首尾空白
-        #         line = line.strip()
-        #         if not line:
-        #             continue
-
-        #         # 使用 jieba 精确模式分词
-        #         # lcut 返回列表
-        #         words = jieba.lcut(line)
-
-        #         for word in words:
-        #             word = word.strip() # 去除词语本身可能带有的空白
-
-        #             # --- 词语过滤条件 ---
-        #             # 1. 长度大于等于 MIN_WORD_LENGTH
-        #             # 2. 包含至少一个汉字 (通过正则判断)
-        #             # 3. 不是纯数字 (可选，jieba 通常会分开，但以防万一)
-        #             if len(word) >= MIN_WORD_LENGTH and \
-        #                CHINESE_WORD_REGEX.search(word) and \
-        #                not word.isdigit():
-        #                 dictionary_words.add(word)
-
-        #         if (i + 1) % 1000 == 0: # 每处理 1000 行给个提示
-        #             print(f"已处理 {i + 1} 行...")
-        with open(input_filepath, 'r', encoding='utf-8') as infile:
-            # 关键词提取通常需要整个文本内容
-            content = infile.read()
-        print("文件读取完毕，开始提取关键词/短语...")
-        
-        lines = content.split("\n\n")
-        total_lines = len(lines)
-        
-        print(f"找到 {total_lines} 个段落")
-        max_workers = os.cpu_count()
-        print(f"自动检测到 {max_workers} 个 CPU 核心。")
-
-        processed_count = 0
-        # --- Change Executor ---
-        # Executor = ThreadPoolExecutor
-        Executor = ProcessPoolExecutor # Use ProcessPoolExecutor
-        total_items = len(lines)
-        futures = {}
-
-        # IMPORTANT: Ensure the code using ProcessPoolExecutor is under `if __name__ == "__main__":`
-        with Executor(max_workers=max_workers) as executor:
-            # Submit all tasks
-            # Calculate base chunk size and remainder for even distribution
-            base_chunk_size = total_items // max_workers
-            remainder = total_items % max_workers
-            start_index = 0
-
-            print(f"基础块大小: {base_chunk_size}, 剩余项: {remainder}")
-            
-            
-            for i in range(max_workers):
-                # Distribute the remainder: the first 'remainder' chunks get 1 extra item
-                current_chunk_size = base_chunk_size + (1 if i < remainder else 0)
-                end_index = start_index + current_chunk_size
-
-                # Slice the list to get the chunk for this worker
-                # Ensure end_index doesn't exceed total_items (shouldn't with this logic)
-                chunk_of_lines = lines[start_index:end_index]
-
-                # Only submit if the chunk is not empty
-                if chunk_of_lines:
-                    print(f"提交块 {i}: 索引 {start_index} 到 {end_index-1} (大小: {len(chunk_of_lines)})")
-                    # Submit the entire chunk to the modified process_paragraphs function
-                    # The key 'i' helps map the future back to the chunk index if needed later
-                    futures[executor.submit(process_paragraphs, chunk_of_lines)] = i
-                else:
-                     print(f"块 {i} 为空，跳过提交。") # Should not happen with correct logic
-
-                # Move start_index for the next chunk
-                start_index = end_index
-            # --- End of Chunking and Submission Logic ---
-
-            print(f"已提交 {len(futures)} 个任务块，等待结果...")
-            total_tasks = len(futures)
-
-            for future in as_completed(futures):
-                try:
-                    result_set = future.result() # Get the set returned by the worker process
-                    dictionary_words.update(result_set) # Merge results in the main process
-                except Exception as e:
-                    task_index = futures[future]
-                    print(f"\n获取任务 {task_index} 结果时出错: {e}")
-
-                processed_count += 1
-                # Update progress
-                print(f"\r已处理: {processed_count}/{total_tasks} ({processed_count/total_tasks:.1%})", end="")
-
-        print("\n并行处理完成。") # Newline after progress indicator
-    except FileNotFoundError:
-        print(f"错误：找不到输入文件 '{input_filepath}'")
-        return
-    except Exception as e:
-        print(f"读取或处理文件时出错：{e}")
-        return
+def extract_dictionary_words(input_filepath, use_rank=False, profiler: Profiler = None) -> Set[str]:
+    """
+    读取单个文本文件，使用 jieba 分词，提取常见的、适合做词典的词语并去重。
 
+    Args:
+        input_filepath (str): 输入的 txt 文件路径。
+        use_rank (bool): 是否使用 TextRank 提取关键词。
+    """
+    dictionary_words = extract_words_from_paths([Path(input_filepath)], use_rank, profiler)
     print(f"分词和筛选完成，共找到 {len(dictionary_words)} 个不重复的候选词语。")
     return dictionary_words
         
@@ -257,7 +347,7 @@ def list_files(directory: str) -> List[Path]:
     return txt_files
 
 
-def extract_words_from_files(input_dir: str, output_file: str, use_rank=False):
+def extract_words_from_files(input_dir: str, output_file: str, use_rank=False, profiler: Profiler = None, preload=True, backend: str = "auto", workers: int = None):
     """
     从指定目录下的所有 txt 文件中提取词语，并写入到输出文件中。
 
@@ -265,6 +355,8 @@ def extract_words_from_files(input_dir: str, output_file: str, use_rank=False):
         input_dir (str): 输入的 txt 文件目录路径。
         output_file (str): 输出的词语文件路径。
     """
+    if profiler is None:
+        profiler = Profiler("extract_words")
     print(f"开始处理目录: {input_dir}")
     txt_files = list_files(input_dir)
     print(f"找到 {len(txt_files)} 个文件")
@@ -272,18 +364,17 @@ def extract_words_from_files(input_dir: str, output_file: str, use_rank=False):
         print("错误：在指定目录下未找到 .txt 文件。")
         return
 
-    all_words = set()
-    for txt_file in txt_files:
-        print(f"正在处理文件: {txt_file}")
-        words = extract_dictionary_words(txt_file)
-        if words:
-            all_words.update(words)
+    all_words = extract_words_from_paths(txt_files, use_rank, profiler, preload, backend, workers)
     print(f"找到 {len(all_words)} 个不重复的候选词语。")
-    all_words = {to_simplified(word) for word in list(all_words)}
-    all_words = {word.strip() for word in all_words}
-    all_words = set(all_words)
+    with profiler.stage("simplify") as simplify_stage:
+        simplify_stage.lines = len(all_words)
+        all_words = {to_simplified(word) for word in list(all_words)}
+        all_words = {word.strip() for word in all_words}
+        all_words = set(all_words)
     print(f"转换为简体中文后，共找到 {len(all_words)} 个不重复的候选词语。")
-    write_to_file(all_words, output_file)
+    with profiler.stage("write") as write_stage:
+        write_stage.lines = len(all_words)
+        write_to_file(all_words, output_file)
 
 # --- 主程序 ---
 if __name__ == "__main__":
@@ -293,8 +384,19 @@ if __name__ == "__main__":
     args_parser.add_argument("input_dir", type=str, help="输入的 txt 文件目录路径。")
     args_parser.add_argument("output_file", type=str, help="输出的词语文件路径。")
     args_parser.add_argument("--use_rank", action="store_true", help="是否使用 TextRank 提取关键词。")
+    args_parser.add_argument("--no_preload", action="store_true", help="不在主进程中预加载 jieba 模型，由每个工作进程各自惰性加载。")
+    args_parser.add_argument("--executor", choices=BACKENDS, default="auto", help="执行后端，auto 按可用 CPU 数和文件总大小选择，工作量很小时不启动进程池。")
+    args_parser.add_argument("--workers", type=positive_int, default=None, help="工作者数量，默认为当前进程实际可用的 CPU 数（考虑 CPU 亲和性和 cgroup 配额）。")
+    args_parser.add_argument("--profile", action="store_true", help="在每个工作进程中运行 cProfile，并把合并后的统计数据写入性能报告。")
+    args_parser.add_argument("--report", type=str, default=None, help="性能报告 (JSON) 的输出路径，指定 --profile 时默认为 <输出文件>.profile.json。")
     args = args_parser.parse_args()
 
-    extract_words_from_files(args.input_dir, args.output_file, args.use_rank)
+    profiler = Profiler("extract_words", args.profile)
+    extract_words_from_files(args.input_dir, args.output_file, args.use_rank, profiler, not args.no_preload, args.executor, args.workers)
+
+    report_path = args.report or (f"{args.output_file}.profile.json" if args.profile else None)
+    if report_path:
+        for path in profiler.write(report_path):
+            print(f"写入性能报告 {path}")
 
     
\ No newline at end of file
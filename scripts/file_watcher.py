@@ -0,0 +1,201 @@
+import os
+import sys
+import time
+import ctypes
+import select
+import struct
+import ctypes.util
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+# 轮询模式下两次扫描之间的间隔（秒）
+POLL_INTERVAL = 0.5
+# 收到第一个事件后继续等待这么久没有新事件才返回，把编辑器保存时的多次写入合并为一次
+DEBOUNCE_SECONDS = 0.2
+# 只关心这种后缀的文件
+WATCH_SUFFIX = ".txt"
+
+# inotify 事件掩码，见 <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+# struct inotify_event 的固定部分: wd, mask, cookie, len
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_READ_SIZE = 1 << 16
+
+
+def is_watched_file(path: Path) -> bool:
+    return path.name.lower().endswith(WATCH_SUFFIX)
+
+
+def iter_watched_files(root: Path) -> Iterator[Path]:
+    """与 merge_texts.find_txt_files 相同的规则递归查找 txt 文件"""
+    for dirpath, _, files in os.walk(root):
+        for file in files:
+            path = Path(dirpath) / file
+            if is_watched_file(path):
+                yield path
+
+
+class PollingWatcher:
+    """定期扫描目录下所有 txt 文件的修改时间和大小，适用于任何平台"""
+
+    def __init__(self, root: str, interval: float = POLL_INTERVAL):
+        self.root = Path(root)
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot = {}
+        for path in iter_watched_files(self.root):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """阻塞到有文件变化（新增、修改或删除）并稳定下来，返回变化的文件，超时返回空集合"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed = set()
+        while True:
+            time.sleep(self.interval)
+            snapshot = self._scan()
+            diff = {path for path in snapshot.keys() | self._snapshot.keys()
+                    if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if diff:
+                changed |= diff
+            elif changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    通过 ctypes 调用 Linux inotify 监视目录树，文件保存后立即得到通知，不需要反复扫描。
+
+    每个子目录单独添加监视，新建的子目录会自动加入；事件队列溢出时退化为整棵目录树都视为变化。
+    子目录被删除或移走时目录本身已经不能遍历，因此同时记录目录树中已知的 txt 文件，
+    把原路径下的文件都报告为变化（在调用方看来就是被删除），并移除这部分子树的监视。
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self._dirs: Dict[int, Path] = {}
+        self._files: Set[Path] = set()
+        self._add_tree(self.root)
+
+    def _add_dir(self, directory: Path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {directory} 失败")
+        self._dirs[wd] = directory
+
+    def _add_tree(self, root: Path) -> Set[Path]:
+        """监视 root 及其所有子目录，返回其中的 txt 文件"""
+        self._add_dir(root)
+        for dirpath, dirnames, _ in os.walk(root):
+            for dirname in dirnames:
+                self._add_dir(Path(dirpath) / dirname)
+        files = set(iter_watched_files(root))
+        self._files |= files
+        return files
+
+    def _remove_tree(self, root: Path) -> Set[Path]:
+        """停止监视已被删除或移走的 root 及其子目录，返回原来位于其中的 txt 文件"""
+        for wd, directory in list(self._dirs.items()):
+            if directory == root or root in directory.parents:
+                # 目录已被删除时内核已经移除了监视，调用失败可以忽略
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._dirs[wd]
+        files = {path for path in self._files if root in path.parents}
+        self._files -= files
+        return files
+
+    def _read_events(self) -> Set[Path]:
+        changed = set()
+        try:
+            data = os.read(self._fd, INOTIFY_READ_SIZE)
+        except BlockingIOError:
+            return changed
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, name_len = INOTIFY_EVENT.unpack_from(data, pos)
+            pos += INOTIFY_EVENT.size
+            name = data[pos:pos + name_len].rstrip(b"\0")
+            pos += name_len
+            if mask & IN_Q_OVERFLOW:
+                # 已知的文件中可能有已经不存在的，一并报告
+                changed |= self._files
+                self._files = set(iter_watched_files(self.root))
+                changed |= self._files
+                continue
+            directory = self._dirs.get(wd)
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            if directory is None or not name:
+                continue
+            path = directory / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # 新目录中可能已经有文件，全部视为新增
+                    changed |= self._add_tree(path)
+                elif mask & (IN_MOVED_FROM | IN_DELETE):
+                    # 移出目录树或重命名前的路径，其中的文件全部视为删除
+                    changed |= self._remove_tree(path)
+                continue
+            if is_watched_file(path):
+                if mask & (IN_MOVED_FROM | IN_DELETE):
+                    self._files.discard(path)
+                else:
+                    self._files.add(path)
+                changed.add(path)
+        return changed
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """阻塞到有文件变化（新增、修改或删除）并稳定下来，返回变化的文件，超时返回空集合"""
+        changed = set()
+        wait_time = timeout
+        while True:
+            ready, _, _ = select.select([self._fd], [], [], wait_time)
+            if not ready:
+                return changed
+            changed |= self._read_events()
+            if changed:
+                wait_time = DEBOUNCE_SECONDS
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def open_watcher(root: str, polling: bool = False):
+    """优先使用 inotify，不是 Linux 或 inotify 不可用时退化为轮询"""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            print(f"inotify 不可用 ({e})，改为每 {POLL_INTERVAL} 秒轮询一次")
+    return PollingWatcher(root)
@@ -0,0 +1,52 @@
+import re
+from typing import Callable, Pattern, Sequence, Tuple
+
+
+class LineNormalizer:
+    """
+    把一行文本规范化为词库中的一个词条，各步骤由规则声明，编译后每行只经过必要的几次复制:
+
+    1. 删除 delete_chars 中的符号（一张 str.translate 表，行中不含这些符号时不复制），两侧的文字直接相连；
+       revalidate 时删除后重新 strip 并用 is_valid 检查，删除符号可能让行变成注释或空行
+    2. 用 separator_re 一次切分成若干段
+    3. 每段依次删除 segment_deletes 中的字符串，再用 convert 转换（如繁转简）
+    4. 整段符合 keep_re 且 is_valid 的段为候选，多段时取最后一个候选
+
+    从最后一段往前处理，找到候选即停止，前面的段不必再做转换。
+    """
+
+    def __init__(self, delete_chars: str, separator_re: Pattern, segment_deletes: Sequence[str], keep_re: Pattern,
+                 convert: Callable[[str], str], is_valid: Callable[[str], bool]):
+        self._delete_table = str.maketrans("", "", delete_chars)
+        # 绝大多数行不含要删除的符号，先用正则判断，比逐字查 translate 表快得多
+        self._delete_re = re.compile(f"[{re.escape(delete_chars)}]") if delete_chars else None
+        self._split = separator_re.split
+        self._segment_deletes = tuple(segment_deletes)
+        self._keep = keep_re.fullmatch
+        self._convert = convert
+        self._is_valid = is_valid
+
+    def normalize(self, line: str, revalidate: bool = True) -> Tuple[str, int]:
+        """
+        规范化已经 strip 过且 is_valid 的行，返回 (词条, 长句计数)。
+
+        没有候选时词条为空字符串；长句计数为切分出的段数，只有一段时为 0。
+        """
+        if self._delete_re is not None and self._delete_re.search(line) is not None:
+            line = line.translate(self._delete_table)
+            if revalidate:
+                line = line.strip()
+                if not self._is_valid(line):
+                    return "", 0
+        segments = self._split(line)
+        long_sentence_num = len(segments) if len(segments) > 1 else 0
+        for segment in reversed(segments):
+            if not segment:
+                continue
+            for deleted in self._segment_deletes:
+                if deleted in segment:
+                    segment = segment.replace(deleted, "")
+            segment = self._convert(segment)
+            if self._keep(segment) and self._is_valid(segment):
+                return segment, long_sentence_num
+        return "", long_sentence_num
@@ -0,0 +1,240 @@
+import mmap
+import heapq
+import struct
+from array import array
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+# 文件头: 魔数, 块大小, 条目数, 数据区字节数, 块偏移表之前的填充字节数
+STORE_HEADER = struct.Struct("<4sIQQI")
+STORE_MAGIC = b"FCS1"
+# 每块的条目数，块内第一个条目完整存储，其余条目只存与前一条目不同的后缀
+# 块越大越省空间，但随机查找时需要顺序解码的条目越多
+STORE_BLOCK_SIZE = 32
+# 公共前缀长度用一个字节存储
+MAX_PREFIX_BYTES = 255
+
+_SMALL_VARINTS = [bytes((i,)) for i in range(0x80)]
+
+Buffer = Union[bytes, bytearray, mmap.mmap]
+
+
+def encode_varint(value: int) -> bytes:
+    """无符号整数的 LEB128 编码"""
+    if value < 0x80:
+        return _SMALL_VARINTS[value]
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varint(buf: Buffer, pos: int) -> Tuple[int, int]:
+    """从 pos 处解码一个 LEB128 整数，返回 (值, 下一个位置)"""
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class StoreBuilder:
+    """
+    按严格递增的顺序添加 (字符串, 次数)，生成 FrontCodedStore 的序列化数据。
+
+    字符串以 UTF-8 存储，UTF-8 的字节序与 Python 字符串的码位序一致。
+    每个条目为: 与前一条目的公共前缀字节数 (1 字节) + 后缀长度 (varint) + 后缀 + 次数 (varint)。
+    """
+
+    def __init__(self, block_size: int = STORE_BLOCK_SIZE):
+        self.block_size = block_size
+        self._data = bytearray()
+        self._offsets = array('Q')
+        self._previous = b""
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, key: str, count: int):
+        self.add_raw(key.encode('utf-8'), count)
+
+    def add_raw(self, raw: bytes, count: int):
+        """添加 UTF-8 编码的字符串，必须大于之前添加的所有字符串"""
+        previous = self._previous
+        if self._count and raw <= previous:
+            raise ValueError(f"字符串必须严格递增: {raw!r} <= {previous!r}")
+        if self._count % self.block_size == 0:
+            self._offsets.append(len(self._data))
+            prefix = 0
+        else:
+            limit = min(len(raw), len(previous), MAX_PREFIX_BYTES)
+            prefix = 0
+            while prefix < limit and raw[prefix] == previous[prefix]:
+                prefix += 1
+        data = self._data
+        data.append(prefix)
+        data += encode_varint(len(raw) - prefix)
+        data += raw[prefix:]
+        data += encode_varint(count)
+        self._previous = raw
+        self._count += 1
+
+    def build(self) -> bytes:
+        padding = -(STORE_HEADER.size + len(self._data)) % self._offsets.itemsize
+        header = STORE_HEADER.pack(STORE_MAGIC, self.block_size, self._count, len(self._data), padding)
+        return b"".join((header, self._data, b"\0" * padding, self._offsets.tobytes()))
+
+
+class FrontCodedStore:
+    """
+    按序存放不重复字符串及其次数的只读紧凑结构（front coding）。
+
+    排好序的相邻字符串通常共享很长的前缀，每个条目只存不同的后缀，一条几个汉字的行只占十几个字节，
+    而一个 Python str 对象加上集合中的槽位要一百多字节。数据保存在一段连续的缓冲区中，
+    也可以作为更大的 mmap 文件中的一段直接读取（见 dict_index.DictIndex），不必先载入内存。
+    迭代按序产出 (字符串, 次数)，get() 先二分查找块再在块内顺序解码。
+    """
+
+    def __init__(self, buffer: Buffer, start: int = 0):
+        """start 为数据在 buffer 中的起始位置，用于一个文件中存放多个 FrontCodedStore 的情况"""
+        magic, self.block_size, self._count, data_len, padding = STORE_HEADER.unpack_from(buffer, start)
+        if magic != STORE_MAGIC:
+            raise ValueError("不是有效的 FrontCodedStore 数据")
+        self._buffer = buffer
+        self._start = start
+        self._data_start = start + STORE_HEADER.size
+        self._data_end = self._data_start + data_len
+        offsets_start = self._data_end + padding
+        block_num = -(-self._count // self.block_size)
+        self._end = offsets_start + block_num * 8
+        self._offsets = memoryview(buffer)[offsets_start:self._end].cast('Q')
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return self._end - self._start
+
+    def iter_raw(self, start_block: int = 0) -> Iterator[Tuple[bytes, int]]:
+        """从指定块开始按序产出 (UTF-8 字符串, 次数)"""
+        buf = self._buffer
+        base = self._data_start
+        if start_block >= len(self._offsets):
+            return
+        pos = base + self._offsets[start_block]
+        end = self._data_end
+        previous = b""
+        while pos < end:
+            prefix = buf[pos]
+            length = buf[pos + 1]
+            pos += 2
+            if length >= 0x80:
+                length, pos = decode_varint(buf, pos - 1)
+            key = previous[:prefix] + buf[pos:pos + length]
+            pos += length
+            count = buf[pos]
+            pos += 1
+            if count >= 0x80:
+                count, pos = decode_varint(buf, pos - 1)
+            yield key, count
+            previous = key
+
+    def __iter__(self) -> Iterator[Tuple[str, int]]:
+        for key, count in self.iter_raw():
+            yield key.decode('utf-8'), count
+
+    def keys(self) -> Iterator[str]:
+        for key, _ in self.iter_raw():
+            yield key.decode('utf-8')
+
+    def _block_head(self, block: int) -> bytes:
+        """块内第一个条目没有公共前缀，直接读出完整字符串"""
+        pos = self._data_start + self._offsets[block] + 1
+        length, pos = decode_varint(self._buffer, pos)
+        return bytes(self._buffer[pos:pos + length])
+
+    def _find_block(self, raw: bytes) -> int:
+        """二分查找可能包含 raw 的块，即最后一个块头不大于 raw 的块"""
+        lo, hi = 0, len(self._offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._block_head(mid) <= raw:
+                lo = mid + 1
+            else:
+                hi = mid
+        return max(lo - 1, 0)
+
+    def get(self, key: str, default: Optional[int] = None) -> Optional[int]:
+        """查找字符串的次数，不存在时返回 default"""
+        raw = key.encode('utf-8')
+        for i, (candidate, count) in enumerate(self.iter_raw(self._find_block(raw))):
+            if candidate == raw:
+                return count
+            if candidate > raw or i + 1 >= self.block_size:
+                break
+        return default
+
+    def iter_prefix_raw(self, prefix: bytes) -> Iterator[Tuple[bytes, int]]:
+        """按序产出以 prefix 开头的 (UTF-8 字符串, 次数)"""
+        for candidate, count in self.iter_raw(self._find_block(prefix)):
+            if candidate.startswith(prefix):
+                yield candidate, count
+            elif candidate > prefix:
+                return
+
+    def iter_prefix(self, prefix: str) -> Iterator[Tuple[str, int]]:
+        """按序产出以 prefix 开头的 (字符串, 次数)"""
+        for candidate, count in self.iter_prefix_raw(prefix.encode('utf-8')):
+            yield candidate.decode('utf-8'), count
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def max_count(self) -> int:
+        return max((count for _, count in self.iter_raw()), default=0)
+
+
+def build_store(items: Iterable[Tuple[str, int]]) -> bytes:
+    """由按序排列的 (字符串, 次数) 生成序列化数据"""
+    builder = StoreBuilder()
+    for key, count in items:
+        builder.add(key, count)
+    return builder.build()
+
+
+def store_from_lines(lines: Iterable[str], keep: Callable[[str], bool] = None) -> bytes:
+    """统计每行出现的次数并生成序列化数据，keep 不为空时只保留 keep 返回 True 的行，每个不重复的行只检查一次"""
+    counts = {}
+    for line in lines:
+        counts[line] = counts.get(line, 0) + 1
+    keys = counts if keep is None else filter(keep, counts)
+    return build_store((line, counts[line]) for line in sorted(keys))
+
+
+def merge_stores(buffers: List[Buffer], keep: Callable[[str], bool] = None) -> bytes:
+    """k 路归并多个 FrontCodedStore，相同的字符串累加次数，keep 不为空时只保留 keep 返回 True 的字符串"""
+    builder = StoreBuilder()
+    previous = None
+    total = 0
+
+    def flush():
+        if previous is not None and (keep is None or keep(previous.decode('utf-8'))):
+            builder.add_raw(previous, total)
+
+    for key, count in heapq.merge(*(FrontCodedStore(buffer).iter_raw() for buffer in buffers)):
+        if key == previous:
+            total += count
+            continue
+        flush()
+        previous = key
+        total = count
+    flush()
+    return builder.build()
+
@@ -1,13 +1,34 @@
 import os
 import sys
 import re
+import math
 import argparse
 from pathlib import Path
 import pypinyin
 import time
+import hashlib
+import importlib.metadata
+import tempfile
+import contextlib
 from datetime import datetime
-from typing import List, Set, Tuple
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from enum import Enum
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from collections import Counter, deque
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from build_cache import FileCache
+from pinyin_cache import PinyinCache, lookup_many, open_readonly
+from external_sort import write_run, merge_runs, reduce_runs
+from shuangpin import SCHEMES, SHUANGPIN_TABLES, pinyin_to_shuangpin
+from profiling import Profiler
+from compressed_output import COMPRESSIONS, compression_error, open_output
+from dict_index import IndexBuilder
+from exclude_dict import ExcludeSet
+from line_store import FrontCodedStore, build_store, merge_stores, store_from_lines
+from file_watcher import open_watcher
+from shm_transport import PackedStrings, SharedStrings, export_strings, release_unread
+from text_input import decode_span, open_mapped
+from line_normalizer import LineNormalizer
+from executor_backend import BACKENDS, ChunkPlanner, SerialExecutor, available_cpus, choose_backend, open_executor, positive_int
 
 # 定义中英文标点符号的正则表达式
 # 中文标点：，。？！；：""（）【】《》、
@@ -15,13 +36,7 @@ from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_compl
 # PUNCTUATION_RE = re.compile(r'[\s,，.。？！；：""（）【】《》、,.?!;:\'"()\[\]<>]+')
 PUNCTUATION_RE = re.compile(r'[\s,.。？！；：，·""（）【】、,.?!;:\'"()\[\]<>]+')
 
-ONLY_ENGLISH_ALPHABET_RE = re.compile(r'^[a-zA-Z]+$')
-ONLY_NUMBER_RE = re.compile(r'^[0-9]+$')
-ONLY_FLOAT_NUMBER_RE = re.compile(r'^[0-9]+\.[0-9]+$')
-ONLY_ENGLISH_ALPHABET_AND_NUMBER_RE = re.compile(r'^[a-zA-Z0-9]+$')
-ONLY_ENGLISH_ALPHABET_AND_NUMBER_AND_PUNCTUATION_RE = re.compile(r'^[a-zA-Z0-9,.?!;:\'"()\[\]<>-\u2013\u2014\u2212]+$')
     # 定义只匹配中文字符的正则表达式
-NO_CHINESE_CHAR_RE = re.compile(r'^[^\u4e00-\u9fff]+$')
 CHINESE_CHAR_RE = re.compile(r'[\u4e00-\u9fff]+')
 
 #包含日文平假名和片假名
@@ -31,15 +46,42 @@ ONLY_CHINESE_CHAR_RE = re.compile(r'^[\u4e00-\u9fff]+$')
 
 CHINESE_PUNCTUATIONS = ["，", "。", "！", "？", "；", "：", "“", "”", "（", "）", "【", "】", "《", "》", "、"]
 
-COMMENT_LINE_STARTS = ["#", "&", "*", "-", "=", "//"]
+COMMENT_LINE_STARTS = ("#", "&", "*", "-", "=", "//")
+
+# 不含汉字的行的细分，按 数字、浮点数、纯英文、英文和数字 的优先级匹配整行
+NO_CHINESE_KIND_RE = re.compile(r'(?P<number>[0-9]+)|(?P<float>[0-9]+\.[0-9]+)|(?P<english>[a-zA-Z]+)|(?P<alnum>[a-zA-Z0-9]+)')
 
 KEEP_REGEX = re.compile(r'^[A-Za-z0-9\u4e00-\u9fff，]+$')
 
-start_time = 0
-read_time = 0
-set_time = 0
-valid_time = 0
-to_py_time = 0
+# 行的规范化规则，由 LineNormalizer 编译为一个处理阶段，见 process_line
+# 整行删除的符号，删除后两侧的文字直接相连，之后再按 PUNCTUATION_RE 分段
+NORMALIZE_DELETE_CHARS = "♂♀《》【】（）"
+# 每段中删除的字符串。删除一遍 "oo" 后每串连续的 o 至多剩一个，不会拼出新的 "oo"，与原先连续删除两遍等价
+SEGMENT_DELETE_STRINGS = ("oo",)
+
+# 每个进程平均分到的分片数，分片越多负载越均衡，但调度开销越大
+SHARDS_PER_WORKER = 4
+# 分片的最小字节数，避免小语料被切得过碎
+MIN_SHARD_SIZE = 1 << 18
+# 寻找行边界时每次读取的字节数
+LINE_ALIGN_CHUNK_SIZE = 1 << 12
+# 单位成本的初始估计，先在主进程中处理一小批数据，再按实测值决定是否并行和任务大小
+# 读取阶段处理每字节输入的秒数
+READ_SECONDS_PER_BYTE = 1e-6
+# 计算每行拼音的秒数
+PINYIN_SECONDS_PER_LINE = 7e-5
+# 用于校准的第一批数据的大小
+CALIBRATION_BYTES = 1 << 16
+CALIBRATION_LINES = 1000
+# 外部排序模式下，一个分片处理时占用的内存约为其字节数的这么多倍
+EXTERNAL_SHARD_MEMORY_FACTOR = 16
+# 外部排序模式下每个拼音任务包含的行数
+PINYIN_STREAM_BATCH_LINES = 4096
+# 决定文件缓存内容的源文件: 读取解码、规范化的实现和缓存中 FrontCodedStore 的序列化格式
+CACHE_SOURCE_FILES = ("merge_texts.py", "line_normalizer.py", "line_store.py", "text_input.py")
+# 可能提供 opencc 模块的发行包，按顺序查找已安装的版本
+OPENCC_DISTRIBUTIONS = ("opencc-python-reimplemented", "OpenCC", "opencc")
+
 from opencc import OpenCC
 # 创建全局转换器（避免重复创建）
 try:
@@ -49,9 +91,45 @@ except Exception as e:
     print("Please make sure you have installed 'opencc-python-reimplemented' and the dictionary files are accessible.")
     cc_t2s = None # 设置为 None，以便后续检查
 
+def build_t2s_triggers(converter) -> Tuple[frozenset, Tuple[str, ...]]:
+    """
+    收集转换器词典中所有可能被替换的内容：单字词条的字，以及不含任何单字词条的多字词条。
+    文本中不含这些字和词时，OpenCC 转换结果必然与原文相同。
+    """
+    chars = set()
+    phrases = []
+    dicts = [d for group in converter._dict_chain_data for d in group]
+    for _, _, map_dict in dicts:
+        chars.update(key for key in map_dict if len(key) == 1)
+    for _, _, map_dict in dicts:
+        for key in map_dict:
+            if len(key) > 1 and chars.isdisjoint(key):
+                phrases.append(key)
+    return frozenset(chars), tuple(phrases)
+
+try:
+    cc_t2s.convert("")
+    T2S_TRIGGER_CHARS, T2S_TRIGGER_PHRASES = build_t2s_triggers(cc_t2s)
+except Exception:
+    # 无法读取词典结构时总是走完整转换
+    T2S_TRIGGER_CHARS, T2S_TRIGGER_PHRASES = None, ()
+# 多字词条合成一个正则，一次扫描代替逐个 in 判断
+T2S_TRIGGER_PHRASE_RE = re.compile("|".join(map(re.escape, T2S_TRIGGER_PHRASES))) if T2S_TRIGGER_PHRASES else None
+
+def needs_t2s(text: str) -> bool:
+    """文本中是否含有可能被繁简转换改变的字或词"""
+    if T2S_TRIGGER_CHARS is None:
+        return True
+    if not T2S_TRIGGER_CHARS.isdisjoint(text):
+        return True
+    return T2S_TRIGGER_PHRASE_RE is not None and T2S_TRIGGER_PHRASE_RE.search(text) is not None
+
 def to_simplified(text: str) -> str:
     """将文本转换为简体中文，如果转换器初始化失败则返回原文"""
     if cc_t2s:
+        # 绝大多数文本本身就是简体，跳过 OpenCC 的分词和逐词查表
+        if not needs_t2s(text):
+            return text
         try:
             return cc_t2s.convert(text)
         except Exception as e:
@@ -60,69 +138,50 @@ def to_simplified(text: str) -> str:
     else:
         return text
 
-def remove_english_alphabet(line: str) -> str:
-    """删除行中的英文单词"""
-    return ONLY_ENGLISH_ALPHABET_RE.sub("", line)
-
-def remove_english_alphabet_and_number(line: str) -> str:
-    """删除行中的英文单词和数字"""
-    return ONLY_ENGLISH_ALPHABET_AND_NUMBER_RE.sub("", line)
-
-def remove_punctuation(line: str) -> str:
-    """删除行中的标点符号"""
-    res = line
-    # res =  PUNCTUATION_RE.sub("", line)
-    res = res.replace("♂", "")
-    res = res.replace("♀", "")
-    res = res.replace("《", "")
-    res = res.replace("》", "")
-    res = res.replace("【", "")
-    res = res.replace("】", "")
-    res = res.replace("（", "")
-    res = res.replace("）", "")
-    return res
-
-def remove_english_alphabet_and_number_and_punctuation(line: str) -> str:
-    """删除行中的英文单词、数字和标点符号"""
-    return ONLY_ENGLISH_ALPHABET_AND_NUMBER_AND_PUNCTUATION_RE.sub("", line)
-
-def remove_number(line: str) -> str:
-    """删除行中的数字"""
-    return ONLY_NUMBER_RE.sub("", line)
-
-def remove_float_number(line: str) -> str:
-    """删除行中的浮点数"""
-    return ONLY_FLOAT_NUMBER_RE.sub("", line)
+class LineCategory(Enum):
+    """行的分类，除 VALID 外都会被丢弃"""
+    COMMENT = "comment"
+    EMPTY = "empty"
+    ENGLISH = "english"
+    JAPANESE = "japanese"
+    NUMBER = "number"
+    FLOAT = "float"
+    ALNUM = "alnum"
+    NO_CHINESE = "no_chinese"
+    VALID = "valid"
+
+# 统计信息中各分类对应的下标，见 load_lines 中的 return_statics
+CATEGORY_STATIC_INDEX = {
+    LineCategory.COMMENT: 0,
+    LineCategory.EMPTY: 1,
+    LineCategory.ENGLISH: 2,
+    LineCategory.JAPANESE: 3,
+    LineCategory.NUMBER: 4,
+    LineCategory.FLOAT: 5,
+    LineCategory.ALNUM: 6,
+}
+
+def classify_line(line: str) -> LineCategory:
+    """
+    对已经 strip 过的行分类。
+
+    判断顺序与原先逐条正则检查的顺序一致：注释、空行、以假名开头、不含汉字时再区分纯英文/数字/浮点数/英文数字。
+    含汉字的行只需一次 CHINESE_CHAR_RE.search。
+    """
+    if line.startswith(COMMENT_LINE_STARTS):
+        return LineCategory.COMMENT
+    if not line:
+        return LineCategory.EMPTY
+    if HAVE_JAPANESE_CHAR_RE.match(line):
+        return LineCategory.JAPANESE
+    if CHINESE_CHAR_RE.search(line) is None:
+        match = NO_CHINESE_KIND_RE.fullmatch(line)
+        return LineCategory.NO_CHINESE if match is None else LineCategory[match.lastgroup.upper()]
+    return LineCategory.VALID
 
 def check_valid_line(line) -> bool:
     """检查行是否有效"""
-    line = line.strip()
-    if NO_CHINESE_CHAR_RE.match(line):
-        return False
-    if any(line.startswith(start) for start in COMMENT_LINE_STARTS):
-        return False
-    if line == "":
-        return False
-    if ONLY_ENGLISH_ALPHABET_RE.match(line):
-        return False
-    if ONLY_NUMBER_RE.match(line):
-        return False
-    if ONLY_FLOAT_NUMBER_RE.match(line):
-        return False
-    if ONLY_ENGLISH_ALPHABET_AND_NUMBER_RE.match(line):
-        return False
-    if ONLY_ENGLISH_ALPHABET_AND_NUMBER_AND_PUNCTUATION_RE.match(line):
-        return False
-    if HAVE_JAPANESE_CHAR_RE.match(line):
-        return False
-    line = remove_english_alphabet(line)
-    line = remove_english_alphabet_and_number(line)
-    line = remove_english_alphabet_and_number_and_punctuation(line)
-    line = remove_number(line)
-    line = remove_float_number(line)
-    if line == "":
-        return False
-    return True
+    return classify_line(line.strip()) is LineCategory.VALID
 
 def is_chinese_only(line) -> bool:
     """检查行是否只包含中文字符"""
@@ -131,11 +190,15 @@ def is_chinese_only(line) -> bool:
             return True
     return False
 
-def only_keep_chinese_chars(line) -> str:
-    """只保留中文字符"""
-#     chinese_chars = CHINESE_CHAR_RE.findall(line)
-    chinese_chars = KEEP_REGEX.findall(line)
-    return ''.join(chinese_chars)
+LINE_NORMALIZER = LineNormalizer(NORMALIZE_DELETE_CHARS, PUNCTUATION_RE, SEGMENT_DELETE_STRINGS, KEEP_REGEX,
+                                 to_simplified, check_valid_line)
+
+def normalize_dict_word(word: str) -> str:
+    """按 load_lines 中处理语料行的方式规范化排除词库中的词（删除符号、繁转简等），使其与规范化后的行可以比较"""
+    word = word.strip()
+    if classify_line(word) is not LineCategory.VALID:
+        return word
+    return LINE_NORMALIZER.normalize(word)[0]
 
 def find_txt_files(input_dir) -> List[Path]:
     """递归查找指定目录下的所有 .txt 文件"""
@@ -155,67 +218,7 @@ def string_to_pinyin_list(line: str) -> List[str]:
 
 def pinyin_to_xiaohe(pinyins: List[str]) -> List[str]:
     """将拼音列表转换为小鹤双拼编码列表"""
-    initial_map = {
-        **dict.fromkeys("bpmfdtngkhjqxrzcs", None),  # 占位
-        "b":"b","p":"p","m":"m","f":"f","d":"d","t":"t","n":"n","l":"l",
-        "g":"g","k":"k","h":"h","j":"j","q":"q","x":"x","r":"r",
-        "z":"z","c":"c","s":"s","y":"y","w":"w",
-        "zh":"v","ch":"i","sh":"u","":""  # "" 表示零声母
-    }
-
-    final_map = {
-        # 单韵母
-        "a":"a","o":"o","e":"e","i":"i","u":"u","v":"v",
-        # 双、三韵母
-        "ai":"d","ei":"w","ao":"c","ou":"z","an":"j","en":"f","ang":"h","eng":"g","er":"r",
-        "ong":"s","iong":"s",
-        "ia":"x","ua":"x","iao":"n","uai":"k","iai":"d",
-        "ian":"m","iang":"l","iang":"l","ing":"k",
-        "ie":"p","in":"b","iu":"q",
-        "uo":"o","ue":"t","ve":"t","ui":"v",
-        "uan":"r","uang":"l","uen":"y","un":"y",
-        # 只在 zhi/chi/shi/ri/zi/ci/si 中出现的特殊韵母
-        "i":"i","ng":"g"
-    }
-
-    multi_initials = ("zh", "ch", "sh")
-    abbreviations = {"iou":"iu", "uei":"ui", "uen":"un"}
-
-    codes = []
-    for syl in pinyins:
-        if ONLY_NUMBER_RE.match(syl):
-            codes.append(syl)
-            continue
-        if ONLY_ENGLISH_ALPHABET_RE.match(syl):
-            codes.append(syl)
-            continue
-        if ONLY_FLOAT_NUMBER_RE.match(syl):
-            codes.append(syl)
-            continue
-        if ONLY_ENGLISH_ALPHABET_AND_NUMBER_RE.match(syl):
-            codes.append(syl)
-            continue
-        try:
-                if syl in ("-", "—", "~", "~", "，", ".", "/", "、"):
-                    continue
-                s = syl.lower().replace("ü", "v").replace("u:", "v")
-                # 1) 切分
-                if s.startswith(multi_initials):
-                        ini, rest = s[:2], s[2:]
-                else:
-                        ini, rest = (s[0], s[1:]) if s[0] in initial_map and s[0] not in "aeo" else ("", s)
-                rest = abbreviations.get(rest, rest)  # 缩写
-
-                # 2) 映射
-
-                key1 = initial_map.get(ini, ini if ini else s[0])
-                key2 = final_map[rest]
-
-                codes.append(f"{key1}{key2}")
-        except Exception as e:
-            print(f"处理 {syl} 时出错: {e}")
-            continue
-    return codes
+    return pinyin_to_shuangpin(pinyins, "flypy")
 
 def clean_pinyin(pinyins: List[str]) -> List[str]:
     """清理拼音列表"""
@@ -233,116 +236,209 @@ def clean_pinyin(pinyins: List[str]) -> List[str]:
 def process_line(line: str) -> Tuple[str, int]:
     """处理单行文本，根据标点和空格分割，并只保留中文部分"""
     line = line.strip()
-    if not line:
-        return "", 0
-
-    if not check_valid_line(line):
-        return "", 0
-
-    if HAVE_JAPANESE_CHAR_RE.match(line):
+    if classify_line(line) is not LineCategory.VALID:
         return "", 0
+    # 单独调用时删除符号后不再 strip 和重新分类，与 load_lines 中的处理不同
+    return LINE_NORMALIZER.normalize(line, revalidate=False)
 
-    line = remove_punctuation(line)
-    
-    total_long_sentence_num = 0
-
-    # 统一使用正则表达式分割 (包含中英文标点和空格)
-    segments = PUNCTUATION_RE.split(line)
-    
-    final_str = ""
-    
-    if len(segments) > 1:
-        total_long_sentence_num += len(segments)
-
-    for segment in segments:
-        segment = segment.strip()
-        # 确保 segment 非空后再处理
-        if segment:
-            segment = segment.strip().replace(" ", "").replace("oo", "").replace("oo", "")
-            # 提取纯中文字符
-            segment = remove_punctuation(segment)
-            segment = to_simplified(segment)
-            chinese_only_segment = only_keep_chinese_chars(segment)
-            # 检查提取后的纯中文字符串是否有效，并添加到集合
-            if chinese_only_segment and check_valid_line(chinese_only_segment):
-                final_str = chinese_only_segment
-    return final_str, total_long_sentence_num
-
-def load_batch_files(txt_files: List[Path]) -> Tuple[List[str], List[int]]:
-    """合并文本文件""" 
+def load_lines(lines: Iterable[str]) -> Tuple[List[str], List[int]]:
+    """处理一组文本行，返回规范化后的行和统计信息"""
     unique_lines = []
-    comment_lines_num = 0
-    empty_lines_num = 0
-    english_lines_num = 0
-    japanese_lines_num = 0
-    number_lines_num = 0
-    float_number_lines_num = 0
-    english_and_number_lines_num = 0
+    # 前 7 项为各分类的行数，见 CATEGORY_STATIC_INDEX
+    return_statics = [0] * 9
     total_lines_num = 0
     total_long_sentence_num = 0
-    for file_path in txt_files:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as infile:
-                for line in infile:
-                    total_lines_num += 1
-                    line_strip = line.strip()
-                    if any(line_strip.startswith(start) for start in COMMENT_LINE_STARTS):
-                        comment_lines_num += 1
-                        continue
-                    if line_strip == "":
-                        empty_lines_num += 1
-                        continue
-                    if ONLY_ENGLISH_ALPHABET_RE.match(line_strip):
-                        english_lines_num += 1
-                        continue
-                    if HAVE_JAPANESE_CHAR_RE.match(line_strip):
-                        japanese_lines_num += 1
-                        continue
-                    if ONLY_NUMBER_RE.match(line_strip):
-                        number_lines_num += 1
-                        continue
-                    if ONLY_FLOAT_NUMBER_RE.match(line_strip):
-                        float_number_lines_num += 1
-                        continue
-                    if ONLY_ENGLISH_ALPHABET_AND_NUMBER_RE.match(line_strip):
-                        english_and_number_lines_num += 1
-                        continue
-                    line_strip = remove_punctuation(line_strip)
-                    # total_long_sentence_num += process_line(line_strip, unique_lines)
-                    final_str, long_sentence_num = process_line(line_strip)
-                    if final_str and len(final_str) > 0:
-                        unique_lines.append(final_str)
-                    total_long_sentence_num += long_sentence_num
-                    
-        except Exception as e:
-            print(f"处理文件 {file_path} 时出错: {e}")
-    
-    return_statics = [
-        comment_lines_num,
-        empty_lines_num,
-        english_lines_num,
-        japanese_lines_num,
-        number_lines_num,
-        float_number_lines_num,
-        english_and_number_lines_num,
-        total_lines_num,
-        total_long_sentence_num
-    ]
-    
+    for line in lines:
+        total_lines_num += 1
+        line_strip = line.strip()
+        category = classify_line(line_strip)
+        if category is not LineCategory.VALID:
+            # 不含汉字的其它行经过 process_line 也会被丢弃，且不计入任何统计
+            if category is not LineCategory.NO_CHINESE:
+                return_statics[CATEGORY_STATIC_INDEX[category]] += 1
+            continue
+        # 已经 strip 并分类，直接交给规范化阶段
+        final_str, long_sentence_num = LINE_NORMALIZER.normalize(line_strip)
+        if final_str:
+            unique_lines.append(final_str)
+        total_long_sentence_num += long_sentence_num
+
+    return_statics[7] = total_lines_num
+    return_statics[8] = total_long_sentence_num
+
     return unique_lines, return_statics
 
-def split_into_batch(txt_files: List[Path], batch_num:  int) -> List[List[Path]]:
-    """将 txt 文件列表分割成多个批次"""
-    txt_size = len(txt_files)
-    batch_size = txt_size // batch_num
-    if txt_size % batch_num != 0:
-        batch_size += 1
-    return [txt_files[i:i + batch_size] for i in range(0, txt_size, batch_size)]
+def read_range_lines(file_path: Path, start: int, end: int) -> List[str]:
+    """读取文件中 [start, end) 的字节并按行切分，直接从 mmap 解码，换行处理与文本模式一致"""
+    with open_mapped(file_path) as buf:
+        text = decode_span(buf, start, end)
+    lines = text.split('\n')
+    if lines and lines[-1] == "":
+        lines.pop()
+    return lines
+
+def load_file_range(file_path: Path, start: int, end: int) -> Tuple[List[str], List[int]]:
+    """处理文件中按行对齐的一段字节范围"""
+    try:
+        return load_lines(read_range_lines(file_path, start, end))
+    except Exception as e:
+        print(f"处理文件 {file_path} [{start}, {end}) 时出错: {e}")
+        return load_lines([])
+
+def load_batch_files(shards: List[Tuple[Path, int, int]]) -> List[Tuple[Tuple[Path, int, int], List[str], List[int]]]:
+    """逐个处理一批分片，按分片返回规范化后的行和统计信息"""
+    return [(shard, *load_file_range(*shard)) for shard in shards]
+
+def load_batch_stores(shards: List[Tuple[Path, int, int]]) -> List[Tuple[Tuple[Path, int, int], bytes, List[int]]]:
+    """
+    逐个处理一批分片，按分片返回 行 -> 出现次数 的 FrontCodedStore 序列化数据和统计信息。
+
+    每个分片在工作进程中完成去重、校验和排序，主进程只需线性归并。
+    """
+    results = []
+    for shard in shards:
+        shard_lines, shard_statics = load_file_range(*shard)
+        results.append((shard, store_from_lines(shard_lines, check_valid_line), shard_statics))
+    return results
+
+def align_to_line(infile, offset: int, file_size: int) -> int:
+    """将偏移量向后移动到下一行的开头"""
+    if offset >= file_size:
+        return file_size
+    infile.seek(offset - 1)
+    while True:
+        chunk = infile.read(LINE_ALIGN_CHUNK_SIZE)
+        if not chunk:
+            return file_size
+        pos = chunk.find(b'\n')
+        if pos != -1:
+            return infile.tell() - len(chunk) + pos + 1
+
+def split_ranges(ranges: List[Tuple[Path, int, int]], shard_size: int) -> List[Tuple[Path, int, int]]:
+    """将文件中按行对齐的字节范围切分成不超过 shard_size 字节（单行超长时除外）的分片"""
+    shards = []
+    for file_path, start, end in ranges:
+        if end - start <= shard_size:
+            shards.append((file_path, start, end))
+            continue
+        with open(file_path, 'rb') as infile:
+            while start < end:
+                shard_end = align_to_line(infile, start + shard_size, end)
+                shards.append((file_path, start, shard_end))
+                start = shard_end
+    return shards
+
+def split_into_shards(txt_files: List[Path], shard_size: int) -> List[Tuple[Path, int, int]]:
+    """将大文件按行对齐切分成不超过 shard_size 字节（单行超长时除外）的分片"""
+    return split_ranges([(file_path, 0, os.path.getsize(file_path)) for file_path in txt_files], shard_size)
+
+def take_calibration_shards(txt_files: List[Path], budget: int) -> Tuple[List[Tuple[Path, int, int]], List[Tuple[Path, int, int]]]:
+    """从最小的文件开始取出约 budget 字节按行对齐的分片，返回 (取出的分片, 剩余的字节范围)"""
+    taken = []
+    rest = []
+    taken_size = 0
+    for file_path in sorted(txt_files, key=os.path.getsize):
+        file_size = os.path.getsize(file_path)
+        if taken_size >= budget or file_size == 0:
+            rest.append((file_path, 0, file_size))
+            continue
+        end = file_size
+        if file_size > budget - taken_size:
+            with open(file_path, 'rb') as infile:
+                end = align_to_line(infile, budget - taken_size, file_size)
+        taken.append((file_path, 0, end))
+        taken_size += end
+        if end < file_size:
+            rest.append((file_path, end, file_size))
+    return taken, rest
+
+def split_into_batch(shards: List[Tuple[Path, int, int]], shard_size: int) -> List[List[Tuple[Path, int, int]]]:
+    """将分片按字节数装箱成任务，小文件合并到同一个任务中，返回按大小降序排列的任务列表"""
+    batches = []
+    current = []
+    current_size = 0
+    for shard in sorted(shards, key=lambda shard: shard[2] - shard[1], reverse=True):
+        size = shard[2] - shard[1]
+        if current and current_size + size > shard_size:
+            batches.append(current)
+            current = []
+            current_size = 0
+        current.append(shard)
+        current_size += size
+    if current:
+        batches.append(current)
+    return batches
+
+def load_shards(txt_files: List[Path], func, backend: str, workers: int, profiler: Profiler, executor: Executor = None) -> Iterator[List[Tuple[Tuple[Path, int, int], object, List[int]]]]:
+    """
+    对所有文件运行 func (load_batch_stores / load_batch_files)，按完成顺序产出每个任务的结果。
+
+    最小的文件先在主进程中处理约 CALIBRATION_BYTES 字节，用实测耗时校准每字节的成本，
+    再据此决定是否使用执行器以及分片的大小，剩余工作量很小时全部在主进程中完成。
+    executor 为已经启动的执行器（如 --watch 模式下常驻的进程池），不指定时按需创建。
+    """
+    planner = ChunkPlanner(workers, READ_SECONDS_PER_BYTE, LINE_ALIGN_CHUNK_SIZE)
+    calibration, rest = take_calibration_shards(txt_files, CALIBRATION_BYTES)
+    futures = [planner.calibrate(profiler, sum(end - start for _, start, end in calibration), func, calibration)]
+    rest_size = sum(end - start for _, start, end in rest)
+    backend = choose_backend(backend, workers, planner.estimated_seconds(rest_size))
+    shard_size = planner.chunk_size(rest_size)
+    shards = split_ranges(rest, shard_size)
+    batch_files = split_into_batch(shards, shard_size)
+    print(f"{len(txt_files)} 个文件切分为 {len(calibration) + len(shards)} 个分片，装箱为 {len(batch_files) + 1} 个任务，"
+          f"分片大小 {shard_size} 字节，每 MB 约 {planner.seconds_per_item * (1 << 20):.3f} s，使用 {backend} 执行")
+    with contextlib.ExitStack() as stack:
+        if backend == "serial":
+            executor = SerialExecutor()
+        elif executor is None:
+            executor = stack.enter_context(open_executor(backend, workers))
+        # 任务按大小降序提交，空闲的工作者会从队列中继续领取剩余任务
+        futures.extend(profiler.submit(executor, func, batch_file) for batch_file in batch_files)
+        for future in as_completed(futures):
+            yield profiler.result(future, count_loaded_lines)
+
+def compute_shard_size(txt_files: List[Path], worker_num: int) -> int:
+    """根据总字节数和进程数计算分片大小，每个进程分到若干个分片以便空闲进程继续领取任务"""
+    total_size = sum(os.path.getsize(file_path) for file_path in txt_files)
+    return max(MIN_SHARD_SIZE, -(-total_size // (worker_num * SHARDS_PER_WORKER)))
     
     
-def load_all_lines(input_dir: str) -> List[str]:
-    """合并文本文件""" 
-    global valid_time, set_time, read_time
+def print_statics(statics: List[int]):
+    """打印各类行的统计信息"""
+    (comment_lines_num, empty_lines_num, english_lines_num, japanese_lines_num, number_lines_num,
+     float_number_lines_num, english_and_number_lines_num, total_lines_num, total_long_sentence_num) = statics
+    print(f"注释行: {comment_lines_num}")
+    print(f"空行: {empty_lines_num}")
+    print(f"英文行: {english_lines_num}")
+    print(f"日文行: {japanese_lines_num}")
+    print(f"数字行: {number_lines_num}")
+    print(f"浮点数行: {float_number_lines_num}")
+    print(f"英文和数字行: {english_and_number_lines_num}")
+    print(f"长句行: {total_long_sentence_num}")
+
+def count_loaded_lines(results: List[Tuple[Tuple[Path, int, int], object, List[int]]]) -> int:
+    """load_batch_files / load_batch_stores 的结果对应的原始行数"""
+    return sum(shard_statics[7] for _, _, shard_statics in results)
+
+def file_category(input_dir: str, file_path: Path) -> Optional[str]:
+    """文件所属的分类，即其在 input_dir 下的一级子目录名，直接位于 input_dir 中的文件不属于任何分类"""
+    parts = Path(file_path).relative_to(input_dir).parts
+    return parts[0] if len(parts) > 1 else None
+
+def load_all_lines(input_dir: str, file_cache: FileCache = None, profiler: Profiler = None, exclude: ExcludeSet = None, categories: List[str] = None, backend: str = "auto", workers: int = None) -> Tuple[FrontCodedStore, Dict[str, FrontCodedStore]]:
+    """
+    合并文本文件，返回按序存放通过校验的不重复行及其出现次数的 FrontCodedStore，以及各分类的 FrontCodedStore。
+
+    工作进程把每个分片的行计数、校验、排序后编码为前缀压缩的 FrontCodedStore，
+    主进程只保存这些紧凑的字节串，全部读取完成后一次 k 路归并去重并累加次数，
+    去重阶段不再为每一行创建 Python 字符串对象，也不再重复校验。
+    exclude 中的行在去重时丢弃，每个不重复的行只检查一次，文件缓存中保存的仍是排除前的结果。
+
+    categories 不为 None 时按 file_category() 给每个分片标记分类，空列表表示所有分类。
+    这些分类的分片先各自归并，总的结果再由各分类的结果归并得到；分类的结果中不排除 exclude 中的行。
+    """
+    if profiler is None:
+        profiler = Profiler("merge_texts")
     print(f"开始处理目录: {input_dir}")
     txt_files = find_txt_files(input_dir)
     if not txt_files:
@@ -353,217 +449,568 @@ def load_all_lines(input_dir: str) -> List[str]:
     # for f in txt_files:
     #     print(f"  - {f}")
 
-    unique_lines = set()
-    unique_lines_list = []
-    
-    comment_lines_num = 0
-    empty_lines_num = 0
-    english_lines_num = 0
-    japanese_lines_num = 0
-    number_lines_num = 0
-    float_number_lines_num = 0
-    english_and_number_lines_num = 0
-    total_lines_num = 0
-    total_long_sentence_num = 0
-    
-    batch_files = split_into_batch(txt_files, os.cpu_count())
-    
-    total_batch_num = sum([len(batch_file) for batch_file in batch_files])
-    print(f"batch 之后的文件总数是: {total_batch_num} == {len(txt_files)}")
+    stores = []
     
-    batch_num = os.cpu_count()
-    
-    Executor = ProcessPoolExecutor
-    futures = {}
-    
-    # for batch_file in batch_files:
-    #     batch_unique_lines, return_statics = load_batch_files(batch_file)
-    #     unique_lines.update(batch_unique_lines)
-    #     comment_lines_num += return_statics[0]
-    #     empty_lines_num += return_statics[1]
-    #     english_lines_num += return_statics[2]
-    #     japanese_lines_num += return_statics[3]
-    #     number_lines_num += return_statics[4]
-    #     float_number_lines_num += return_statics[5]
-    #     english_and_number_lines_num += return_statics[6]
-    #     total_lines_num += return_statics[7]
-    #     total_long_sentence_num += return_statics[8]
-    
-    with Executor(max_workers=batch_num) as executor:
-        for batch_file in batch_files:
-            futures[executor.submit(load_batch_files, batch_file)] = batch_file
-            
-        for future in as_completed(futures):
-            batch_unique_lines, return_statics = future.result()
-            unique_lines_list.extend(batch_unique_lines)
-            comment_lines_num += return_statics[0]
-            empty_lines_num += return_statics[1]
-            english_lines_num += return_statics[2]
-            japanese_lines_num += return_statics[3]
-            number_lines_num += return_statics[4]
-            float_number_lines_num += return_statics[5]
-            english_and_number_lines_num += return_statics[6]
-            total_lines_num += return_statics[7]
-            total_long_sentence_num += return_statics[8]
-            
-    read_time = time.time()
-    print(f"读取文件时间: {read_time - start_time} s")
-    
-    unique_lines = set(unique_lines_list)
-    
-    set_time = time.time()
-    
-    print(f"合并set 时间: {set_time - read_time} s")
+    statics = [0] * 9
 
-    print(f"共找到 {len(unique_lines)} / {total_lines_num} 条不重复的行。")
-    print(f"注释行: {comment_lines_num}")
-    print(f"空行: {empty_lines_num}")
-    print(f"英文行: {english_lines_num}")
-    print(f"日文行: {japanese_lines_num}")
-    print(f"数字行: {number_lines_num}")
-    print(f"浮点数行: {float_number_lines_num}")
-    print(f"英文和数字行: {english_and_number_lines_num}")
-    print(f"长句行: {total_long_sentence_num}")
-    unique_lines = list(unique_lines)
-    unique_lines.sort()
-    unique_lines = [line.strip() for line in unique_lines if check_valid_line(line)]
-    valid_time = time.time()
-    print(f"check valid 时间 {valid_time - read_time} s")
-    return unique_lines
-
-def generate_ime_lines(lines_with_pinyin: List[Tuple[str, List[str]]]) -> List[str]:
-    """生成适用于 fcitx5输入法的行"""
-    output_lines = []
-    for line, pinyin_list in lines_with_pinyin:
-        pinyin_str = "'".join(pinyin_list)
-        output_lines.append(f"{line} {pinyin_str}")
-    return output_lines
-
-def generate_rime_lines(lines_with_pinyin: List[Tuple[str, List[str]]]) -> List[str]:
-    """生成适用于 rime 的行"""
-    output_lines = []
-    for line, pinyin_list in lines_with_pinyin:
-        if is_chinese_only(line):
-            pinyin_str = "".join(pinyin_list)
-            output_lines.append(f"{line} {pinyin_str}")
-    return output_lines
-
-def generate_only_text_lines(lines_with_pinyin: List[Tuple[str, List[str]]]) -> List[str]:
-    """单纯生成文本行"""
-    output_lines = []
-    for line, _ in lines_with_pinyin:
-        output_lines.append(line)
-    return output_lines
-
-def generate_shouxing_lines(lines_with_pinyin: List[Tuple[str, List[str]]]) -> List[str]:
-    """生成适用于手心的行"""
-    output_lines = []
-    for line, pinyin_list in lines_with_pinyin:
-        if is_chinese_only(line):
-            pinyin_str = "'".join(pinyin_list)
-            output_lines.append(f"{line} {pinyin_str} 1")
-    return output_lines
-
-def generate_qq_pinyin_lines(lines_with_pinyin: List[Tuple[str, List[str]]]) -> List[str]:
-    """生成适用于 QQ 拼音的行"""
-    output_lines = []
-    for line, pinyin_list in lines_with_pinyin:
-        if is_chinese_only(line):
-            pinyin_str = "'".join(pinyin_list)
-            output_lines.append(f"{pinyin_str} {line} 1")
-    return output_lines
-
-def generate_rime_flypy_lines(lines_with_pinyin: List[Tuple[str, List[str]]]) -> List[str]:
-    """生成适用于小鹤双拼的 rime 词库"""
-    output_lines = []
-    for line, pinyin_list in lines_with_pinyin:
-        if is_chinese_only(line):
-            pinyin_list = pinyin_to_xiaohe(pinyin_list)
-            pinyin_str = "".join(pinyin_list)
-            output_lines.append(f"{line} {pinyin_str}")
-    return output_lines
-
-
-def generate_batch_lines(lines: List[str], batch_num: int) -> List[List[str]]:
-    """生成批量行"""
-    batch_size = len(lines) // batch_num
-    if len(lines) % batch_num != 0:
-        batch_size += 1
+    with profiler.stage("read") as read_stage:
+        pending_files = txt_files
+        if file_cache is not None:
+            pending_files = []
+            for txt_file in txt_files:
+                entry = file_cache.lookup(txt_file)
+                if entry is None:
+                    pending_files.append(txt_file)
+                    continue
+                stores.append((txt_file, entry["store"]))
+                statics = [a + b for a, b in zip(statics, entry["statics"])]
+            print(f"缓存命中 {len(txt_files) - len(pending_files)} 个文件，需要处理 {len(pending_files)} 个文件")
+
+        if pending_files:
+            # 同一文件的多个分片需要全部完成后拼接，才能写入文件缓存，各分片的字节数之和等于文件大小时即已完成
+            file_shards = {}
+            for results in load_shards(pending_files, load_batch_stores, backend, workers or available_cpus(), profiler):
+                for (file_path, start, end), shard_store, return_statics in results:
+                    stores.append((file_path, shard_store))
+                    statics = [a + b for a, b in zip(statics, return_statics)]
+                    if file_cache is None:
+                        continue
+                    parts = file_shards.setdefault(file_path, [])
+                    parts.append((end - start, shard_store, return_statics))
+                    if sum(part[0] for part in parts) == os.path.getsize(file_path):
+                        file_statics = [0] * 9
+                        for _, _, part_statics in parts:
+                            file_statics = [a + b for a, b in zip(file_statics, part_statics)]
+                        file_store = shard_store if len(parts) == 1 else merge_stores([part[1] for part in parts])
+                        file_cache.record(file_path, file_store, file_statics)
+                        del file_shards[file_path]
+        read_stage.lines = statics[7]
+
+    print(f"读取文件时间: {read_stage.wall} s")
+    print_statics(statics)
+
+    excluded_num = 0
+
+    def keep(line: str) -> bool:
+        nonlocal excluded_num
+        if line in exclude:
+            excluded_num += 1
+            return False
+        return True
+
+    with profiler.stage("dedup") as dedup_stage:
+        dedup_stage.lines = sum(len(FrontCodedStore(store)) for _, store in stores)
+        category_stores = {}
+        if categories is not None:
+            groups = {}
+            for file_path, shard_store in stores:
+                groups.setdefault(file_category(input_dir, file_path), []).append(shard_store)
+            for category in categories:
+                if category not in groups:
+                    print(f"Warning：未找到分类 '{category}'")
+            wanted = {category for category in groups if category is not None and (not categories or category in categories)}
+            merged = {category: merge_stores(groups[category]) for category in sorted(wanted)}
+            category_stores = {category: FrontCodedStore(data) for category, data in merged.items()}
+            # 总的结果由各分类归并后的结果和其余分片归并，已经去重的行不再重复比较
+            buffers = list(merged.values())
+            buffers.extend(shard_store for category, group in groups.items() if category not in wanted for shard_store in group)
+        else:
+            buffers = [shard_store for _, shard_store in stores]
+        stores.clear()
+        store = FrontCodedStore(merge_stores(buffers, keep if exclude is not None else None))
+    if exclude is not None:
+        print(f"排除 {excluded_num} 条已在排除词库中的行")
+    print(f"共找到 {len(store)} / {statics[7]} 条不重复的行，占用 {store.nbytes} 字节。")
+    for category, category_store in category_stores.items():
+        print(f"分类 {category}: {len(category_store)} 条不重复的行")
+    print(f"去重时间 {dedup_stage.wall} s")
+    return store, category_stores
+
+def spill_batch_files(shards: List[Tuple[Path, int, int]], run_dir: str) -> Tuple[Optional[str], List[int]]:
+    """处理一批分片，将通过校验的行的出现次数按行排序后写入临时文件，返回临时文件路径和统计信息"""
+    batch_counts = Counter()
+    statics = [0] * 9
+    for shard in shards:
+        shard_lines, shard_statics = load_file_range(*shard)
+        batch_counts.update(shard_lines)
+        statics = [a + b for a, b in zip(statics, shard_statics)]
+    for line in [line for line in batch_counts if not check_valid_line(line)]:
+        del batch_counts[line]
+    run_path = write_run(batch_counts, run_dir) if batch_counts else None
+    return run_path, statics
+
+def load_all_lines_external(input_dir: str, run_dir: str, max_memory: int, profiler: Profiler = None, exclude: ExcludeSet = None, backend: str = "auto", workers: int = None) -> Tuple[List[str], int]:
+    """
+    外部排序模式下的 load_all_lines。
+
+    每个任务的分片大小按内存上限收紧，工作进程把 行 -> 出现次数 排序后写入 run_dir 下的临时文件，
+    主进程把临时文件预归并到可以一次打开的数量，返回临时文件列表和通过校验的行中最大的出现次数。
+    临时文件中只有通过校验的行，之后用 iter_valid_counts() 按序读取去重、计数后的行，结果与内存模式一致。
+    """
+    if profiler is None:
+        profiler = Profiler("merge_texts")
+    print(f"开始处理目录: {input_dir}")
+    txt_files = find_txt_files(input_dir)
+    if not txt_files:
+        print("错误：在指定目录下未找到 .txt 文件。")
+        sys.exit(1)
+
+    print(f"找到 {len(txt_files)} 个 .txt 文件:")
+
+    batch_num = workers or available_cpus()
+    worker_memory = max_memory // (batch_num + 1)
+    shard_size = max(LINE_ALIGN_CHUNK_SIZE,
+                     min(compute_shard_size(txt_files, batch_num), worker_memory // EXTERNAL_SHARD_MEMORY_FACTOR))
+    shards = split_into_shards(txt_files, shard_size)
+    batch_files = split_into_batch(shards, shard_size)
+    print(f"{len(txt_files)} 个文件切分为 {len(shards)} 个分片，装箱为 {len(batch_files)} 个任务，分片大小 {shard_size} 字节")
+
+    run_paths = []
+    statics = [0] * 9
+    with profiler.stage("read") as read_stage:
+        # 外部排序模式用于大语料，分片大小受内存限制，不再校准，只按工作者数选择后端
+        with open_executor(choose_backend(backend, batch_num), batch_num) as executor:
+            futures = [profiler.submit(executor, spill_batch_files, batch_file, run_dir) for batch_file in batch_files]
+            for future in as_completed(futures):
+                run_path, batch_statics = profiler.result(future, lambda result: result[1][7])
+                if run_path is not None:
+                    run_paths.append(run_path)
+                statics = [a + b for a, b in zip(statics, batch_statics)]
+        read_stage.lines = statics[7]
+
+    print(f"读取文件时间: {read_stage.wall} s")
+    print(f"共读取 {statics[7]} 行，写入 {len(run_paths)} 个临时文件")
+    print_statics(statics)
+
+    with profiler.stage("reduce_runs"):
+        run_paths = reduce_runs(run_paths, run_dir)
+    # 对数权重需要以最大出现次数归一化，多读一遍临时文件比在内存中保存全部计数更省内存
+    with profiler.stage("max_count"):
+        max_count = max((count for _, count in iter_valid_counts(run_paths, exclude)), default=1)
+    return run_paths, max_count
+
+def iter_valid_counts(run_paths: List[str], exclude: ExcludeSet = None) -> Iterator[Tuple[str, int]]:
+    """按序产出临时文件中不在 exclude 中的 (行, 出现次数)，校验已在工作进程中完成"""
+    if exclude is None:
+        return merge_runs(run_paths)
+    return ((line, count) for line, count in merge_runs(run_paths) if line not in exclude)
+
+def format_ime_line(line: str, pinyin_list: List[str], quoted_pinyin: str, weight: str) -> str:
+    """适用于 fcitx5 输入法的行"""
+    return f"{line} {quoted_pinyin} {weight}\n"
+
+def format_only_line(line: str, pinyin_list: List[str], quoted_pinyin: str, weight: str) -> str:
+    """纯汉字行"""
+    return f"{line}\n"
+
+def format_rime_line(line: str, pinyin_list: List[str], quoted_pinyin: str, weight: str) -> str:
+    """适用于 rime 的行"""
+    return f"{line} {''.join(pinyin_list)} {weight}\n"
+
+def make_rime_shuangpin_formatter(scheme: str):
+    """生成指定双拼方案的 rime 行格式化函数"""
+    table = SHUANGPIN_TABLES[scheme]
+
+    def format_rime_shuangpin_line(line: str, pinyin_list: List[str], quoted_pinyin: str, weight: str) -> str:
+        codes = [table.get(syllable) for syllable in pinyin_list]
+        if None in codes:
+            codes = pinyin_to_shuangpin(pinyin_list, scheme)
+        return f"{line} {''.join(codes)} {weight}\n"
+
+    format_rime_shuangpin_line.__doc__ = f"适用于{SCHEMES[scheme][0]}的 rime 行"
+    return format_rime_shuangpin_line
+
+def format_shouxing_line(line: str, pinyin_list: List[str], quoted_pinyin: str, weight: str) -> str:
+    """适用于手心的行"""
+    return f"{line} {quoted_pinyin} {weight}\n"
+
+def format_qq_pinyin_line(line: str, pinyin_list: List[str], quoted_pinyin: str, weight: str) -> str:
+    """适用于 QQ 拼音的行"""
+    return f"{quoted_pinyin} {line} {weight}\n"
+
+def count_weight(count: int, max_count: int) -> str:
+    """
+    以出现次数作为权重。
+
+    出现次数是规范化后的行在所有输入文件中出现的行数，不是语料中的使用频率：
+    text/从书籍中提取的 等目录下的文件是 extract_words.py 输出的去重词表，每个词在一个文件中只出现一次，
+    这些词的权重实际上是列出该词的文件数。
+    """
+    return str(count)
+
+def log10_weight(count: int, max_count: int) -> str:
+    """以相对最常见词的对数频率作为权重，最常见的词为 0，与 libime 文本词库的概率列一致"""
+    return f"{math.log10(count / max_count):.4f}"
+
+# 权重类型: 名称 -> 由 (出现次数, 最大出现次数) 计算权重字符串的函数，出现次数的含义见 count_weight()
+WEIGHT_FUNCS = {
+    "count": count_weight,
+    "log10": log10_weight,
+}
+
+# 输出格式: 名称 -> (文件后缀, 是否只输出纯中文行, 行格式化函数, 权重类型)
+OUTPUT_FORMATS = {
+    "ime": ("_ime.txt", False, format_ime_line, "log10"),
+    "only": ("_only.txt", True, format_only_line, None),
+    "rime": ("_rime.txt", True, format_rime_line, "count"),
+    "shouxing": ("_shouxing.txt", True, format_shouxing_line, "count"),
+    "qq": ("_qq.txt", True, format_qq_pinyin_line, "count"),
+}
+# 每个双拼方案对应一种 rime 输出，如 rime_flypy -> _rime_flypy.txt
+for _scheme in SCHEMES:
+    OUTPUT_FORMATS[f"rime_{_scheme}"] = (f"_rime_{_scheme}.txt", True, make_rime_shuangpin_formatter(_scheme), "count")
+
+# 写文件时每个输出格式累积多少行后落盘一次
+WRITE_FLUSH_LINES = 1 << 14
+
+def generate_batch_lines(lines: List[str], batch_size: int) -> List[List[str]]:
+    """按每批 batch_size 行生成批量行"""
     return [lines[i:i + batch_size] for i in range(0, len(lines), batch_size)]
 
-def generate_pinyin_list_batch(lines: List[str]) -> List[Tuple[str, List[str]]]:
-    """生成拼音列表"""
-    return [(line.strip(), string_to_pinyin_list(line.strip())) for line in lines]
-
-def write_ime_file(output_file_prefix: str, lines_with_pinyin) -> str:
-    """写入 ime 文件"""
-    ime_lines = generate_ime_lines(lines_with_pinyin)
-    ime_file = f"{output_file_prefix}_ime.txt"
-    with open(ime_file, 'w', encoding='utf-8') as f:
-        for line in ime_lines:
-            f.write(f"{line}\n")
-    return ime_file
-            
-def write_only_file(output_file_prefix: str, lines_with_pinyin) -> str:
-    """写入 纯汉字 文件"""
-    only_file = f"{output_file_prefix}_only.txt"
-    with open(only_file, 'w', encoding='utf-8') as f:
-        for line, _ in lines_with_pinyin:
-            if is_chinese_only(line):
-                f.write(f"{line}\n")
-    return only_file
-def write_rime_file(output_file_prefix: str, lines_with_pinyin) -> str:
-    """写入 rime 文件"""
-    rime_lines = generate_rime_lines(lines_with_pinyin)
-    rime_file = f"{output_file_prefix}_rime.txt"
-    with open(rime_file, 'w', encoding='utf-8') as f:
-        for line in rime_lines:
-            f.write(f"{line}\n")
-    return rime_file
-            
-def write_shouxing_file(output_file_prefix: str, lines_with_pinyin) -> str:
-    """写入 手心 文件"""
-    shouxing_lines = generate_shouxing_lines(lines_with_pinyin)
-    shouxing_file = f"{output_file_prefix}_shouxing.txt"
-    with open(shouxing_file, 'w', encoding='utf-8') as f:
-        for line in shouxing_lines:
-            f.write(f"{line}\n")
-    return shouxing_file
-def write_rime_flypy_file(output_file_prefix: str, lines_with_pinyin) -> str:
-    """写入适用于小鹤双拼的"""
-    rime_flypy_file = f"{output_file_prefix}_rime_flypy.txt"
-    rime_flypy_lines = generate_rime_flypy_lines(lines_with_pinyin)
-    with open(rime_flypy_file, 'w', encoding='utf-8') as f:
-        for line in rime_flypy_lines:
-            f.write(f"{line}\n")
-    return rime_flypy_file
-            
-def write_qq_pinyin_file(output_file_prefix: str, lines_with_pinyin) -> str:
-    """写入适用于 QQ 拼音的文件"""
-    qq_pinyin_file = f"{output_file_prefix}_qq.txt"
-    qq_pinyin_lines = generate_qq_pinyin_lines(lines_with_pinyin)
-    with open(qq_pinyin_file, 'w', encoding='utf-8') as f:
-        for line in qq_pinyin_lines:
-            f.write(f"{line}\n")
-    return qq_pinyin_file
-
-def merge_texts(input_dir, output_file_prefix, enable_rime, enable_rime_flypy, enable_rime_py, enable_shouxing, enable_qqpinyin) -> int:
+def generate_pinyin_list_batch(lines: List[str], pinyin_cache_path: str = None) -> List[Tuple[str, List[str]]]:
+    """生成拼音列表，指定拼音缓存时先查询缓存，只为未命中的行调用 pypinyin"""
+    cached = {}
+    if pinyin_cache_path:
+        conn = open_readonly(pinyin_cache_path)
+        try:
+            cached = lookup_many(conn, [line.strip() for line in lines])
+        finally:
+            conn.close()
+    results = []
+    for line in lines:
+        line = line.strip()
+        pinyin_list = cached.get(line)
+        if pinyin_list is None:
+            pinyin_list = string_to_pinyin_list(line)
+        results.append((line, pinyin_list))
+    return results
+
+def generate_pinyin_batch_shared(lines: List[str], pinyin_cache_path: str = None) -> SharedStrings:
+    """
+    在工作进程中计算一批行的拼音，按输入顺序把以 ' 分隔的拼音打包写入共享内存。
+
+    主进程已经持有这些行，不再传回；拼音也不再 pickle 成成千上万个小字符串和列表，
+    主进程用 receive_pinyin_batch() 整块解码。这只省掉了反序列化的开销，主进程收到后立即为每行生成拼音列表，
+    因为写文件、文件缓存和拼音缓存都需要它们。
+    """
+    return export_strings("'".join(pinyin_list) for _, pinyin_list in generate_pinyin_list_batch(lines, pinyin_cache_path))
+
+def receive_pinyin_batch(lines: List[str], handle: SharedStrings) -> List[Tuple[str, List[str]]]:
+    """读取 generate_pinyin_batch_shared() 的结果并释放共享内存，返回 (行, 拼音列表)"""
+    with PackedStrings(handle) as packed:
+        return [(line, quoted.split("'") if quoted else []) for line, quoted in zip(lines, packed.decode_all())]
+
+def shared_count(handle: SharedStrings) -> int:
+    return handle[1]
+
+def task_handle(value: Tuple[SharedStrings, Dict]) -> SharedStrings:
+    """profiler.submit() 提交的拼音任务的 future 结果为 (句柄, 任务指标)"""
+    return value[0]
+
+def compute_pinyin(lines: List[str], backend: str, workers: int, profiler: Profiler, pinyin_cache_path: str = None, executor: Executor = None) -> Dict[str, List[str]]:
+    """
+    计算一组行的拼音，返回 行 -> 拼音列表。
+
+    先在主进程中计算 CALIBRATION_LINES 行，用实测耗时校准每行的成本，
+    再据此决定是否使用执行器以及每批的行数，剩余的行很少时全部在主进程中完成。
+    executor 为已经启动的执行器（如 --watch 模式下常驻的进程池），不指定时按需创建。
+    """
+    pinyin_map = {}
+    if not lines:
+        return pinyin_map
+    planner = ChunkPlanner(workers, PINYIN_SECONDS_PER_LINE)
+    calibration, rest = lines[:CALIBRATION_LINES], lines[CALIBRATION_LINES:]
+    futures = {planner.calibrate(profiler, len(calibration), generate_pinyin_batch_shared, calibration, pinyin_cache_path): calibration}
+    with contextlib.ExitStack() as stack:
+        # 出错或按 Ctrl+C 中断时，在关闭执行器之前释放还没有读取的结果
+        try:
+            if rest:
+                backend = choose_backend(backend, workers, planner.estimated_seconds(len(rest)))
+                batch_size = planner.chunk_size(len(rest))
+                print(f"每批 {batch_size} 行，每行约 {planner.seconds_per_item * 1e6:.1f} 微秒，使用 {backend} 执行")
+                if backend == "serial":
+                    executor = SerialExecutor()
+                elif executor is None:
+                    executor = stack.enter_context(open_executor(backend, workers))
+                for batch_line in generate_batch_lines(rest, batch_size):
+                    futures[profiler.submit(executor, generate_pinyin_batch_shared, batch_line, pinyin_cache_path)] = batch_line
+            for future in as_completed(list(futures)):
+                handle = profiler.result(future, shared_count)
+                pinyin_map.update(receive_pinyin_batch(futures.pop(future), handle))
+        finally:
+            release_unread(futures, task_handle)
+    return pinyin_map
+
+def stream_pinyin(lines_with_counts: Iterable[Tuple[str, int]], executor, max_pending: int, pinyin_cache: PinyinCache = None, pinyin_cache_path: str = None, profiler: Profiler = None) -> Iterator[Tuple[str, List[str], int]]:
+    """
+    按批提交拼音任务并按提交顺序产出 (行, 拼音列表, 出现次数)，在途批次数不超过 max_pending，
+    内存占用与总行数无关。出现次数留在主进程中，不发送给工作进程。
+    """
+    if profiler is None:
+        profiler = Profiler("merge_texts")
+    pending = deque()
+
+    def drain():
+        future, batch, counts = pending[0]
+        handle = profiler.result(future, shared_count)
+        pending.popleft()
+        results = receive_pinyin_batch(batch, handle)
+        if pinyin_cache is not None:
+            pinyin_cache.update(results)
+        return [(line, pinyin_list, count) for (line, pinyin_list), count in zip(results, counts)]
+
+    def submit(batch, counts):
+        pending.append((profiler.submit(executor, generate_pinyin_batch_shared, batch, pinyin_cache_path), batch, counts))
+
+    batch = []
+    counts = []
+    # 出错、被中断或调用方提前关闭生成器时，释放还没有读取的结果
+    try:
+        for line, count in lines_with_counts:
+            batch.append(line)
+            counts.append(count)
+            if len(batch) >= PINYIN_STREAM_BATCH_LINES:
+                submit(batch, counts)
+                batch = []
+                counts = []
+                if len(pending) >= max_pending:
+                    yield from drain()
+        if batch:
+            submit(batch, counts)
+        while pending:
+            yield from drain()
+    finally:
+        release_unread((future for future, _, _ in pending), task_handle)
+
+def write_output_files(output_file_prefix: str, lines_with_pinyin: Iterable[Tuple[str, List[str], int]], formats: List[str], max_count: int = 1, compressions: Dict[str, str] = None) -> Dict[str, str]:
+    """
+    单遍写出所有启用的输出格式。
+
+    lines_with_pinyin 的每一项为 (行, 拼音列表, 出现次数)，max_count 为所有行中最大的出现次数，
+    用于计算对数权重。每行只判断一次是否为纯中文、只拼接一次带分隔符的拼音、每种权重只计算一次，
+    各格式的行先累积在内存缓冲中，每 WRITE_FLUSH_LINES 行批量写入对应文件。
+    compressions 为 格式名 -> 压缩格式，其中的格式直接写出压缩文件，每个文件由独立的线程压缩，未压缩的内容不落盘；
+    未列出的格式写出普通的文本文件。
+    返回 格式名 -> 文件路径。
+    """
+    paths = {name: f"{output_file_prefix}{OUTPUT_FORMATS[name][0]}" for name in formats}
+    all_lines_sinks = []
+    chinese_only_sinks = []
+    files = []
+    try:
+        for name in formats:
+            _, chinese_only, formatter, weight_kind = OUTPUT_FORMATS[name]
+            f, paths[name] = open_output(paths[name], (compressions or {}).get(name))
+            files.append(f)
+            sink = (formatter, [], f, weight_kind)
+            (chinese_only_sinks if chinese_only else all_lines_sinks).append(sink)
+        sinks = all_lines_sinks + chinese_only_sinks
+        weight_funcs = {kind: WEIGHT_FUNCS[kind] for *_, kind in sinks if kind is not None}
+
+        pending = 0
+        for line, pinyin_list, count in lines_with_pinyin:
+            quoted_pinyin = "'".join(pinyin_list)
+            weights = {kind: func(count, max_count) for kind, func in weight_funcs.items()}
+            for formatter, buffer, _, weight_kind in all_lines_sinks:
+                buffer.append(formatter(line, pinyin_list, quoted_pinyin, weights.get(weight_kind)))
+            if chinese_only_sinks and is_chinese_only(line):
+                for formatter, buffer, _, weight_kind in chinese_only_sinks:
+                    buffer.append(formatter(line, pinyin_list, quoted_pinyin, weights.get(weight_kind)))
+            pending += 1
+            if pending >= WRITE_FLUSH_LINES:
+                for _, buffer, f, _ in sinks:
+                    f.write("".join(buffer))
+                    buffer.clear()
+                pending = 0
+        for _, buffer, f, _ in sinks:
+            f.write("".join(buffer))
+            buffer.clear()
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+def write_query_index(index_builder: IndexBuilder, index_path: str, profiler: Profiler):
+    """写出查询索引，供 dict_index.py 按词、拼音和拼音前缀查询"""
+    with profiler.stage("query_index") as index_stage:
+        size = index_builder.write(index_path)
+        index_stage.lines = len(index_builder)
+    print(f"写入查询索引 {index_path} 成功，共 {len(index_builder)} 个词，{size} 字节")
+
+def write_all_outputs(output_file_prefix: str, lines_with_pinyin: List[Tuple[str, List[str], int]], formats: List[str], max_count: int, profiler: Profiler, compressions: Dict[str, str] = None, query_index: str = None):
+    """写出所有文本词库，以及指定时的查询索引"""
+    index_builder = IndexBuilder() if query_index else None
+    with profiler.stage("write") as write_stage:
+        output_lines = index_builder.tap(lines_with_pinyin) if index_builder is not None else lines_with_pinyin
+        for path in write_output_files(output_file_prefix, output_lines, formats, max_count, compressions).values():
+            print(f"写入 {path} 成功")
+        write_stage.lines = len(lines_with_pinyin)
+
+    print(f"写入时间: {write_stage.wall} s")
+
+    if index_builder is not None:
+        write_query_index(index_builder, query_index, profiler)
+
+def write_category_outputs(output_file_prefix: str, category_stores: Dict[str, FrontCodedStore], pinyin_map: Dict[str, List[str]], formats: List[str], profiler: Profiler, compressions: Dict[str, str] = None, exclude: ExcludeSet = None):
+    """
+    为每个分类写出 <输出前缀>_<分类> 的各格式词库，内容与单独对该分类目录运行一次相同。
+
+    拼音直接取自总的 pinyin_map，多个分类共有的行只计算一次拼音。
+    """
+    with profiler.stage("categories"):
+        for category, category_store in category_stores.items():
+            lines = [(line, count) for line, count in category_store if exclude is None or line not in exclude]
+            max_count = max((count for _, count in lines), default=0) or 1
+            lines_with_pinyin = [(line, pinyin_map[line], count) for line, count in lines if pinyin_map[line]]
+            print(f"分类 {category} 剩下 {len(lines_with_pinyin)} 行")
+            write_all_outputs(f"{output_file_prefix}_{category}", lines_with_pinyin, formats, max_count, profiler, compressions=compressions)
+
+def opencc_version() -> str:
+    """已安装的 OpenCC 实现及其版本，繁转简的结果取决于它"""
+    for dist in OPENCC_DISTRIBUTIONS:
+        try:
+            return f"{dist}:{importlib.metadata.version(dist)}"
+        except importlib.metadata.PackageNotFoundError:
+            continue
+    return "unknown"
+
+def cache_version() -> str:
+    """根据处理代码、pypinyin 和 OpenCC 的版本生成缓存版本号，任一变化都会使文件缓存失效"""
+    h = hashlib.sha256()
+    for name in CACHE_SOURCE_FILES:
+        h.update(Path(__file__).with_name(name).read_bytes())
+    h.update(pypinyin.__version__.encode('utf-8'))
+    h.update(opencc_version().encode('utf-8'))
+    return h.hexdigest()[:16]
+
+def close_pinyin_cache(pinyin_cache: PinyinCache):
+    """压缩并关闭拼音缓存"""
+    deleted = pinyin_cache.compact()
+    print(f"拼音缓存更新完成，共 {len(pinyin_cache)} 条，清理 {deleted} 条长期未使用的条目")
+    pinyin_cache.close()
+
+def merge_texts_external(input_dir, output_file_prefix, formats: List[str], max_memory: int, pinyin_cache: PinyinCache = None, pinyin_cache_path: str = None, profiler: Profiler = None, compressions: Dict[str, str] = None, index_builder: IndexBuilder = None, exclude: ExcludeSet = None, backend: str = "auto", workers: int = None) -> int:
+    """外部排序模式：去重、拼音和写文件全程流式进行，内存占用受 max_memory 字节限制"""
+    lines_num = 0
+
+    def non_empty(lines_with_pinyin):
+        nonlocal lines_num
+        for line, pinyin_list, count in lines_with_pinyin:
+            if pinyin_list:
+                lines_num += 1
+                yield line, pinyin_list, count
+
+    batch_num = workers or available_cpus()
+    if profiler is None:
+        profiler = Profiler("merge_texts")
+    with tempfile.TemporaryDirectory(prefix="merge_texts_") as run_dir:
+        run_paths, max_count = load_all_lines_external(input_dir, run_dir, max_memory, profiler, exclude, backend, batch_num)
+        # 归并、拼音和写文件交织进行，只能作为一个整体计时
+        with profiler.stage("merge_pinyin_write") as stream_stage:
+            # 拼音流先于执行器关闭，出错或被中断时在执行器关闭前释放还没有读取的结果
+            with open_executor(choose_backend(backend, batch_num), batch_num) as executor, \
+                    contextlib.closing(stream_pinyin(iter_valid_counts(run_paths, exclude), executor, 2 * batch_num, pinyin_cache, pinyin_cache_path, profiler)) as pinyin_stream:
+                lines_with_pinyin = non_empty(pinyin_stream)
+                if index_builder is not None:
+                    lines_with_pinyin = index_builder.tap(lines_with_pinyin)
+                for path in write_output_files(output_file_prefix, lines_with_pinyin, formats, max_count, compressions).values():
+                    print(f"写入 {path} 成功")
+            stream_stage.lines = lines_num
+
+    if pinyin_cache is not None:
+        with profiler.stage("pinyin_cache"):
+            close_pinyin_cache(pinyin_cache)
+
+    print(f"最后剩下 {lines_num} 行")
+    print(f"去重、拼音和写入时间: {stream_stage.wall} s")
+    return lines_num
+
+def merge_texts(input_dir, output_file_prefix, enable_rime, enable_rime_flypy, enable_rime_py, enable_shouxing, enable_qqpinyin, cache_dir=None, pinyin_cache_path=None, max_memory=None, shuangpin_schemes=(), profiler: Profiler = None, compression=None, query_index=None, exclude_dicts=(), exclude_cache=None, watch=False, watch_polling=False, split_by_category=None, executor_backend="auto", workers=None, uncompressed_formats=()) -> int:
+
+    formats = ["ime", "only"]
+    if enable_rime:
+        formats.append("rime")
+    if enable_rime_flypy:
+        formats.append("rime_flypy")
+    if enable_shouxing:
+        formats.append("shouxing")
+    if enable_qqpinyin:
+        formats.append("qq")
+    for scheme in shuangpin_schemes:
+        if f"rime_{scheme}" not in formats:
+            formats.append(f"rime_{scheme}")
+
+    if profiler is None:
+        profiler = Profiler("merge_texts")
+
+    if workers is None:
+        workers = available_cpus()
+        print(f"可用 CPU 数: {workers}")
+
+    if compression_error(compression):
+        print(f"错误：{compression_error(compression)}")
+        sys.exit(1)
+    # uncompressed_formats 中的格式即使指定了 compression 也写出文本文件，如交给 libime_pinyindict 的 ime 词库
+    compressions = {name: compression for name in formats if name not in uncompressed_formats} if compression else None
+
+    exclude = None
+    if exclude_dicts:
+        with profiler.stage("exclude") as exclude_stage:
+            exclude = ExcludeSet.from_files(exclude_dicts, exclude_cache, normalize_dict_word, cache_version())
+            exclude_stage.lines = len(exclude)
+        print(f"从 {len(exclude_dicts)} 个排除词库中读取 {len(exclude)} 个词，用时 {exclude_stage.wall} s")
+
+    pinyin_cache = PinyinCache(pinyin_cache_path) if pinyin_cache_path else None
+    if pinyin_cache is not None:
+        if pinyin_cache.invalidated:
+            print(f"pypinyin 版本或缓存格式变化，已清空拼音缓存 {pinyin_cache_path}")
+        print(f"拼音缓存中已有 {len(pinyin_cache)} 条")
+
+    if split_by_category is not None and (watch or max_memory is not None):
+        print("监视模式和外部排序模式下只生成总的词库，忽略 --split_by_category")
+
+    if watch:
+        if max_memory is not None or cache_dir:
+            print("监视模式下所有中间结果都保存在内存中，忽略 --max_memory 和 --cache_dir")
+        return watch_texts(input_dir, output_file_prefix, formats, profiler, pinyin_cache, pinyin_cache_path, compressions, query_index, exclude, watch_polling, executor_backend, workers)
+
+    if max_memory is not None:
+        if cache_dir:
+            print("外部排序模式下不使用文件缓存，忽略 --cache_dir")
+        # 查询索引暂存的拼音键与主进程中归并、拼音的数据流共用一份内存预算
+        index_builder = IndexBuilder(max_memory // (workers + 1)) if query_index else None
+        lines_num = merge_texts_external(input_dir, output_file_prefix, formats, max_memory, pinyin_cache, pinyin_cache_path, profiler, compressions, index_builder, exclude, executor_backend, workers)
+        if index_builder is not None:
+            write_query_index(index_builder, query_index, profiler)
+        return lines_num
+
+    file_cache = FileCache(cache_dir, cache_version()) if cache_dir else None
         
-    unique_lines = load_all_lines(input_dir)
+    line_store, category_stores = load_all_lines(input_dir, file_cache, profiler, exclude, split_by_category, executor_backend, workers)
     
-    batch_num = os.cpu_count()
-    batch_lines = generate_batch_lines(unique_lines, batch_num)
-    
-    futures = {}
-    pinyin_lines = []
-    with ProcessPoolExecutor(max_workers=batch_num) as executor:
-        for batch_line in batch_lines:
-            futures[executor.submit(generate_pinyin_list_batch, batch_line)] = 1
-        for future in as_completed(futures):
-            pinyin_lines.extend(future.result())
+    with profiler.stage("pinyin") as pinyin_stage:
+        # 命中缓存的行直接复用拼音，只为新出现的行计算拼音
+        pinyin_map = file_cache.known_pinyin() if file_cache is not None else {}
+        missing_lines = [line for line in line_store.keys() if line not in pinyin_map]
+        print(f"需要计算拼音的行: {len(missing_lines)} / {len(line_store)}")
+        pinyin_stage.lines = len(missing_lines)
+
+        pinyin_map.update(compute_pinyin(missing_lines, executor_backend, workers, profiler, pinyin_cache_path))
     
-    to_py_time = time.time()
-    print(f"to pinyin 时间 {to_py_time - valid_time} s")
+    print(f"to pinyin 时间 {pinyin_stage.wall} s")
+
+    if file_cache is not None:
+        with profiler.stage("file_cache"):
+            print(f"写入 {file_cache.save(pinyin_map)} 个文件缓存")
+            print(f"清理 {file_cache.sweep()} 个本次未用到的文件缓存")
+
+    if pinyin_cache is not None:
+        with profiler.stage("pinyin_cache"):
+            pinyin_cache.update((line, pinyin_map[line]) for line in line_store.keys())
+            close_pinyin_cache(pinyin_cache)
+
+    pinyin_lines = [(line, pinyin_map[line], count) for line, count in line_store]
+    max_count = line_store.max_count() or 1
     
     # lines_with_pinyin = map(lambda line, pinyin_list: (line, pinyin_list), unique_lines, pinyin_lines)
     lines_with_pinyin = pinyin_lines
@@ -574,86 +1021,104 @@ def merge_texts(input_dir, output_file_prefix, enable_rime, enable_rime_flypy, e
     
     print(f"最后剩下 {len(lines_with_pinyin)} 行")
     
-    task_num = 2
-    if enable_rime:
-        task_num += 1
-    if enable_rime_flypy:
-        task_num += 1
-    if enable_shouxing:
-        task_num += 1
-    if enable_qqpinyin:
-        task_num += 1
-
-
-    # output_ime_path = f"{output_file_prefix}_ime.txt"
-    
-    # ime_lines = generate_ime_lines(lines_with_pinyin)
-    # with open(output_ime_path, 'w', encoding='utf-8') as f:
-    #     for line in ime_lines:
-    #         f.write(line + "\n")
-    # print(f"生成 ime 词库文件 {output_ime_path} 成功")
-    
-    # # 纯汉字
-    # output_only_text_path = f"{output_file_prefix}_only.txt"
-    # only_text_lines = generate_only_text_lines(lines_with_pinyin)
-    # with open(output_only_text_path, 'w', encoding='utf-8') as f:
-    #     for line in only_text_lines:
-    #         if is_chinese_only(line):
-    #             f.write(line + "\n")
-    # print(f"生成 纯汉字 词库文件 {output_only_text_path} 成功")
-        
-    # if enable_rime:
-    #     output_rime_path = f"{output_file_prefix}_rime.txt"
-    #     rime_lines = generate_rime_lines(lines_with_pinyin)
-    #     with open(output_rime_path, 'w', encoding='utf-8') as f:
-    #         for line in rime_lines:
-    #             f.write(line + "\n")
-    #     print(f"生成 rime 词库文件 {output_rime_path} 成功")
-            
-    # if enable_shouxing:
-    #     output_shouxing_path = f"{output_file_prefix}_shouxing.txt"
-    #     shouxing_lines = generate_shouxing_lines(lines_with_pinyin)
-    #     with open(output_shouxing_path, 'w', encoding='utf-8') as f:
-    #         for line in shouxing_lines:
-    #             f.write(line + "\n")
-    #     print(f"生成 手心 词库文件 {output_shouxing_path} 成功")
-        
-    # if enable_rime_flypy:
-    #     output_rime_flypy_path = f"{output_file_prefix}_rime_flypy.txt"
-    #     rime_flypy_lines = generate_rime_flypy_lines(lines_with_pinyin)
-    #     with open(output_rime_flypy_path, 'w', encoding='utf-8') as f:
-    #         for line in rime_flypy_lines:
-    #             f.write(line + "\n")
-    #     print(f"生成使用于 rime 的小鹤双拼词库文件 {output_rime_flypy_path} 成功")
-    # if enable_qqpinyin:
-    #     output_qqpinyin_path = f"{output_file_prefix}_qq.txt"
-    #     qqpinyin_lines = generate_qq_pinyin_lines(lines_with_pinyin)
-    #     with open(output_qqpinyin_path, 'w', encoding='utf-8') as f:
-    #         for line in qqpinyin_lines:
-    #             f.write(line + "\n")
-    #     print(f"生成适用于 QQ 拼音的词库文件 {output_qqpinyin_path} 成功")
-    
-    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
-        futures = {}
-        futures[executor.submit(write_ime_file, output_file_prefix, lines_with_pinyin)] = 1
-        futures[executor.submit(write_only_file, output_file_prefix, lines_with_pinyin)] = 2
-        if enable_rime:
-            futures[executor.submit(write_rime_file, output_file_prefix, lines_with_pinyin)] = 3
-        if enable_rime_flypy:
-            futures[executor.submit(write_rime_flypy_file, output_file_prefix, lines_with_pinyin)] = 4
-        if enable_shouxing:
-            futures[executor.submit(write_shouxing_file, output_file_prefix, lines_with_pinyin)] = 5
-        if enable_qqpinyin:
-            futures[executor.submit(write_qq_pinyin_file, output_file_prefix, lines_with_pinyin)] = 6
-        for future in as_completed(futures):
-            print(f"写入 {future.result()} 成功")
-        
-        
-    write_time = time.time()
-    print(f"写入时间: {write_time - to_py_time} s")
+    write_all_outputs(output_file_prefix, lines_with_pinyin, formats, max_count, profiler, compressions, query_index)
+    if category_stores:
+        write_category_outputs(output_file_prefix, category_stores, pinyin_map, formats, profiler, compressions, exclude)
     return len(lines_with_pinyin)
             
 
+class IncrementalBuild:
+    """
+    --watch 模式下常驻内存的构建状态。
+
+    按文件保存规范化后的 行 -> 出现次数 的 FrontCodedStore 序列化数据，并保存所有行的拼音。
+    文件变化时只重新处理变化的文件，再把各文件的数据归并为总计数，只为新出现的行计算拼音，最后用总计数重写输出文件。
+    计数与完整构建一样保存在前缀压缩的字节串中，不再为每个文件和总计数各保存一份 Counter。
+    进程池在整个会话中保持运行，工作进程中已加载的 OpenCC 和 pypinyin 词典不会重复加载；
+    只改动了少量内容时预计的工作量很小，直接在主进程中处理，不经过进程池。
+    """
+
+    def __init__(self, executor, worker_num: int, profiler: Profiler, pinyin_cache_path: str = None, exclude: ExcludeSet = None, backend: str = "auto"):
+        self.executor = executor
+        self.worker_num = worker_num
+        self.backend = backend
+        self.profiler = profiler
+        self.pinyin_cache_path = pinyin_cache_path
+        self.exclude = exclude
+        self.file_stores: Dict[Path, bytes] = {}
+        self.file_statics: Dict[Path, List[int]] = {}
+        self.store = FrontCodedStore(build_store([]))
+        self.pinyin_map: Dict[str, List[str]] = {}
+
+    def _load_files(self, txt_files: List[Path]) -> Tuple[Dict[Path, bytes], Dict[Path, List[int]]]:
+        """在进程池中处理文件，大文件切分成多个分片，各分片的结果按文件归并"""
+        file_parts = {file_path: [] for file_path in txt_files}
+        file_statics = {file_path: [0] * 9 for file_path in txt_files}
+        for results in load_shards(txt_files, load_batch_stores, self.backend, self.worker_num, self.profiler, self.executor):
+            for (file_path, _, _), shard_store, shard_statics in results:
+                file_parts[file_path].append(shard_store)
+                file_statics[file_path] = [a + b for a, b in zip(file_statics[file_path], shard_statics)]
+        file_stores = {file_path: parts[0] if len(parts) == 1 else merge_stores(parts) for file_path, parts in file_parts.items()}
+        return file_stores, file_statics
+
+    def update(self, changed_files: Iterable[Path]) -> int:
+        """重新处理变化的文件，已删除的文件只移除其贡献，返回新计算拼音的行数"""
+        changed_files = set(changed_files)
+        existing = sorted(file_path for file_path in changed_files if file_path.is_file())
+        with self.profiler.stage("read"):
+            file_stores, file_statics = self._load_files(existing) if existing else ({}, {})
+        with self.profiler.stage("dedup"):
+            for file_path in changed_files:
+                self.file_stores.pop(file_path, None)
+                self.file_statics.pop(file_path, None)
+            self.file_stores.update(file_stores)
+            self.file_statics.update(file_statics)
+            keep = None if self.exclude is None else (lambda line: line not in self.exclude)
+            self.store = FrontCodedStore(merge_stores(list(self.file_stores.values()), keep))
+
+        with self.profiler.stage("pinyin") as pinyin_stage:
+            missing_lines = [line for line in self.store.keys() if line not in self.pinyin_map]
+            self.pinyin_map.update(compute_pinyin(missing_lines, self.backend, self.worker_num, self.profiler, self.pinyin_cache_path, self.executor))
+            pinyin_stage.lines = len(missing_lines)
+        return len(missing_lines)
+
+    def lines_with_pinyin(self) -> List[Tuple[str, List[str], int]]:
+        """按序排列的 (行, 拼音列表, 出现次数)，与完整构建的结果一致"""
+        return [(line, self.pinyin_map[line], count) for line, count in self.store if self.pinyin_map[line]]
+
+    def max_count(self) -> int:
+        return max(self.store.max_count(), 1)
+
+def watch_texts(input_dir, output_file_prefix, formats: List[str], profiler: Profiler, pinyin_cache: PinyinCache = None, pinyin_cache_path: str = None, compressions: Dict[str, str] = None, query_index: str = None, exclude: ExcludeSet = None, polling: bool = False, backend: str = "auto", workers: int = None) -> int:
+    """常驻进程：完整构建一次后监视 input_dir，每次有文件变化时增量更新并重写所有输出，按 Ctrl+C 退出"""
+    # 先开始监视再做首次构建，构建期间的修改不会丢失
+    watcher = open_watcher(input_dir, polling)
+    batch_num = workers or available_cpus()
+    lines_num = 0
+    with open_executor(choose_backend(backend, batch_num), batch_num) as executor:
+        build = IncrementalBuild(executor, batch_num, profiler, pinyin_cache_path, exclude, backend)
+        changed_files = find_txt_files(input_dir)
+        try:
+            while True:
+                start_time = time.time()
+                pinyin_num = build.update(changed_files)
+                lines_with_pinyin = build.lines_with_pinyin()
+                write_all_outputs(output_file_prefix, lines_with_pinyin, formats, build.max_count(), profiler, compressions, query_index)
+                lines_num = len(lines_with_pinyin)
+                print(f"处理 {len(changed_files)} 个文件，计算 {pinyin_num} 行拼音，共 {lines_num} 行，用时 {time.time() - start_time:.3f} s")
+                print(f"正在监视 {input_dir} 中的变化，按 Ctrl+C 退出")
+                changed_files = watcher.wait()
+        except KeyboardInterrupt:
+            print("停止监视")
+        finally:
+            watcher.close()
+
+    if pinyin_cache is not None:
+        pinyin_cache.update((line, build.pinyin_map[line]) for line in build.store.keys())
+        close_pinyin_cache(pinyin_cache)
+    return lines_num
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='递归合并目录下所有 txt 文件的行，去重并处理中英文标点。')
     parser.add_argument('input_dir', type=str, help='包含 txt 文件的输入目录路径')
@@ -663,6 +1128,27 @@ if __name__ == "__main__":
     parser.add_argument('--enable_rime_py', action='store_true', help='是否生成适用于拼音输入法的 rime 词库')
     parser.add_argument('--enable_shouxing', action='store_true', help='是否只生成适用于手心的 txt 文件')
     parser.add_argument('--enable_qqpinyin', action='store_true', help='是否只生成适用于 QQ 拼音的 txt 文件')
+    parser.add_argument('--enable_rime_shuangpin', nargs='+', default=[], choices=list(SCHEMES), metavar='SCHEME',
+                        help=f"生成指定双拼方案的 rime 词库，可选: {', '.join(f'{k} ({v[0]})' for k, v in SCHEMES.items())}")
+    parser.add_argument('--cache_dir', type=str, default=None, help='按文件内容哈希缓存处理结果的目录，未变化的文件直接复用缓存')
+    parser.add_argument('--pinyin_cache', type=str, default=None, help='持久化拼音缓存的 sqlite 文件路径，多次构建之间共享')
+    parser.add_argument('--max_memory', type=int, default=None, help='内存上限 (MB)，指定后使用外部排序模式，中间结果写入临时文件')
+    parser.add_argument('--compress', type=str, default=None, choices=list(COMPRESSIONS), help='直接写出压缩后的输出文件 (zip 为 deflate 压缩，zst 需要安装 zstandard)，不再生成未压缩的文本文件')
+    parser.add_argument('--uncompressed_formats', type=str, nargs='+', default=[], choices=list(OUTPUT_FORMATS), metavar='FORMAT',
+                        help='指定 --compress 时这些输出格式仍写出未压缩的文本文件，如交给 libime_pinyindict 的 ime')
+    parser.add_argument('--query_index', type=str, default=None, help='同时生成可用 mmap 打开的二进制查询索引的路径，用 dict_index.py 按词、拼音和拼音前缀查询')
+    parser.add_argument('--exclude_dict', type=str, nargs='+', default=[], metavar='DICT',
+                        help='排除这些词库中已有的词，支持 rime 词库 (*.dict.yaml)、fcitx5 等文本词库和每行一个词的词表')
+    parser.add_argument('--exclude_cache', type=str, default=None, help='排除词库解析结果的缓存目录，词库内容未变化时直接读取缓存')
+    parser.add_argument('--watch', action='store_true', help='常驻运行并监视输入目录，文件变化时只重新处理变化的文件并更新所有输出')
+    parser.add_argument('--watch_polling', action='store_true', help='监视模式下不使用 inotify，改为定期扫描文件的修改时间')
+    parser.add_argument('--split_by_category', type=str, nargs='*', default=None, metavar='CATEGORY',
+                        help='同时为输入目录下的每个一级子目录（分类）生成 <输出前缀>_<分类> 的词库，可以只列出需要的分类；拼音只计算一次，查询索引只为总的词库生成')
+    parser.add_argument('--executor', type=str, default="auto", choices=list(BACKENDS),
+                        help='执行后端: auto 按可用 CPU 数和实测的工作量自动选择，工作量很小时不启动进程池；serial 全部在主进程中执行；threads 使用线程池 (适用于 free-threaded 构建)；processes 使用进程池')
+    parser.add_argument('--workers', type=positive_int, default=None, help='工作者数，默认为可用的 CPU 数 (考虑 CPU 亲和性和 cgroup 配额)')
+    parser.add_argument('--profile', action='store_true', help='在每个工作进程中运行 cProfile，并把合并后的统计数据写入性能报告')
+    parser.add_argument('--report', type=str, default=None, help='性能报告 (JSON) 的输出路径，指定 --profile 时默认为 <输出前缀>_profile.json')
 
     args = parser.parse_args()
     
@@ -673,10 +1159,34 @@ if __name__ == "__main__":
         print(f"Warning：输出路径 '{dir_name}' 不是一个有效的目录。")
         os.makedirs(dir_name, exist_ok=True)
         
+    profiler = Profiler("merge_texts", args.profile)
     start_time = time.time()
     print(f"开始时间: {start_time}")
 
-    lines_num = merge_texts(args.input_dir, args.output_file_prefix, args.enable_rime, args.enable_rime_flypy, args.enable_rime_py, args.enable_shouxing, args.enable_qqpinyin)
+    lines_num = merge_texts(
+        args.input_dir,
+        args.output_file_prefix,
+        enable_rime=args.enable_rime,
+        enable_rime_flypy=args.enable_rime_flypy,
+        enable_rime_py=args.enable_rime_py,
+        enable_shouxing=args.enable_shouxing,
+        enable_qqpinyin=args.enable_qqpinyin,
+        cache_dir=args.cache_dir,
+        pinyin_cache_path=args.pinyin_cache,
+        max_memory=args.max_memory * 1024 * 1024 if args.max_memory else None,
+        shuangpin_schemes=args.enable_rime_shuangpin,
+        profiler=profiler,
+        compression=args.compress,
+        query_index=args.query_index,
+        exclude_dicts=args.exclude_dict,
+        exclude_cache=args.exclude_cache,
+        watch=args.watch,
+        watch_polling=args.watch_polling,
+        split_by_category=args.split_by_category,
+        executor_backend=args.executor,
+        workers=args.workers,
+        uncompressed_formats=args.uncompressed_formats,
+    )
     print(f"共处理 {lines_num} 行")
     end_time = time.time()
     print(f"结束时间: {end_time}")
@@ -684,4 +1194,8 @@ if __name__ == "__main__":
     print(f"总时间: {elapsed_time} s")
     if elapsed_time > 0:
         print(f"速度: {lines_num / elapsed_time} 行/秒")
-    
+
+    report_path = args.report or (f"{args.output_file_prefix}_profile.json" if args.profile else None)
+    if report_path:
+        for path in profiler.write(report_path):
+            print(f"写入性能报告 {path}")
@@ -0,0 +1,113 @@
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import pypinyin
+
+# 缓存格式版本，修改表结构或拼音生成方式时需要递增
+PINYIN_CACHE_FORMAT = "1"
+# 超过这么多次构建未被使用的条目会在压缩时删除
+PINYIN_CACHE_KEEP_GENERATIONS = 5
+# 被删除的条目超过总数的这个比例时执行 VACUUM 回收空间
+PINYIN_CACHE_VACUUM_RATIO = 0.25
+# 单条 SQL 中 IN (...) 的参数个数上限
+SQL_CHUNK_SIZE = 500
+# 拼音音节之间的分隔符，规范化后的行中不会出现空白字符
+SYLLABLE_SEP = " "
+
+
+def cache_stamp() -> str:
+    """缓存失效标记，pypinyin 版本或缓存格式变化时整个缓存作废"""
+    return f"{PINYIN_CACHE_FORMAT}:{pypinyin.__version__}"
+
+
+def encode_syllables(syllables: List[str]) -> str:
+    return SYLLABLE_SEP.join(syllables)
+
+
+def decode_syllables(value: str) -> List[str]:
+    return value.split(SYLLABLE_SEP) if value else []
+
+
+def chunked(items: List, size: int = SQL_CHUNK_SIZE) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def lookup_many(conn: sqlite3.Connection, words: List[str]) -> Dict[str, List[str]]:
+    """批量查询词语的拼音，返回命中的部分"""
+    found = {}
+    for chunk in chunked(words):
+        placeholders = ",".join("?" * len(chunk))
+        for word, syllables in conn.execute(
+                f"SELECT word, syllables FROM pinyin WHERE word IN ({placeholders})", chunk):
+            found[word] = decode_syllables(syllables)
+    return found
+
+
+def open_readonly(db_path: str) -> sqlite3.Connection:
+    """以只读方式打开缓存，供工作进程查询使用"""
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    return sqlite3.connect(uri, uri=True)
+
+
+class PinyinCache:
+    """
+    持久化的 词语 -> 拼音音节列表 缓存，基于 sqlite。
+
+    每次构建对应一个递增的 generation，本次构建用到的条目会被标记为当前 generation，
+    compact() 删除连续 PINYIN_CACHE_KEEP_GENERATIONS 次构建都没有用到的条目。
+    只有主进程通过本类写入，工作进程使用 open_readonly() 并发读取。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pinyin ("
+            "word TEXT PRIMARY KEY, syllables TEXT NOT NULL, generation INTEGER NOT NULL"
+            ") WITHOUT ROWID")
+        stamp = self._get_meta("stamp")
+        self.invalidated = stamp is not None and stamp != cache_stamp()
+        if stamp != cache_stamp():
+            self.conn.execute("DELETE FROM pinyin")
+            self._set_meta("stamp", cache_stamp())
+        self.generation = int(self._get_meta("generation") or 0) + 1
+        self._set_meta("generation", str(self.generation))
+        self.conn.commit()
+
+    def _get_meta(self, key: str):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM pinyin").fetchone()[0]
+
+    def update(self, items: Iterable[Tuple[str, List[str]]]):
+        """写入本次构建用到的全部拼音：新词插入，已有的词只刷新 generation"""
+        self.conn.executemany(
+            "INSERT INTO pinyin (word, syllables, generation) VALUES (?, ?, ?) "
+            "ON CONFLICT(word) DO UPDATE SET generation = excluded.generation",
+            ((word, encode_syllables(syllables), self.generation) for word, syllables in items))
+        self.conn.commit()
+
+    def compact(self) -> int:
+        """删除长期未使用的条目，必要时回收磁盘空间，返回删除的条目数"""
+        total = len(self)
+        deleted = self.conn.execute(
+            "DELETE FROM pinyin WHERE generation <= ?",
+            (self.generation - PINYIN_CACHE_KEEP_GENERATIONS,)).rowcount
+        self.conn.commit()
+        if total and deleted / total > PINYIN_CACHE_VACUUM_RATIO:
+            self.conn.execute("VACUUM")
+        return deleted
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+import contextlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows 下没有 resource 模块，不统计内存峰值
+    resource = None
+
+# 报告中列出的 cProfile 热点函数个数
+PROFILE_TOP_FUNCTIONS = 40
+
+
+def peak_rss_kb(children: bool = False) -> Optional[int]:
+    """当前进程（children 为 True 时为已回收的子进程）的内存峰值 (KB)，不支持的平台返回 None"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # macOS 上 ru_maxrss 的单位是字节，Linux 上是 KB
+    return usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+
+
+def run_task(func: Callable, submit_time: float, profile: bool, args: Tuple) -> Tuple[Any, Dict]:
+    """
+    在工作进程中执行任务，返回 (任务结果, 任务指标)。
+
+    任务指标包含进程号、排队等待时间、墙钟时间、CPU 时间和进程内存峰值，
+    profile 为 True 时用 cProfile 运行任务并附带原始统计数据，由主进程合并。
+    CPU 时间只统计执行任务的线程，任务在线程池或主进程中执行时不会算上其它线程。
+    """
+    start = time.time()
+    cpu_start = time.thread_time()
+    if profile:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func, *args)
+    else:
+        result = func(*args)
+    task = {
+        "pid": os.getpid(),
+        "func": func.__name__,
+        "queue_wait": max(0.0, start - submit_time),
+        "wall": time.time() - start,
+        "cpu": time.thread_time() - cpu_start,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+    if profile:
+        profiler.create_stats()
+        task["profile"] = profiler.stats
+    return result, task
+
+
+class _RawStats:
+    """把工作进程传回的原始 cProfile 数据包装成 pstats.Stats.add 可以接受的对象"""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class StageRecord:
+    """一个阶段的累计指标，同名阶段多次进入时累加"""
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.calls = 0
+        self.lines = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "calls": self.calls,
+            "lines": self.lines,
+            "lines_per_second": self.lines / self.wall if self.wall > 0 else None,
+        }
+
+
+class Profiler:
+    """
+    主进程中的性能记录器。
+
+    stage() 记录带层级的阶段耗时，submit()/result() 包装进程池（或其它执行器）的任务，
+    按 (阶段, 进程) 汇总工作进程的 CPU 时间、处理行数、排队等待时间和内存峰值。
+    profile 为 True 时在每个工作进程中运行 cProfile，并在主进程中合并统计数据。
+    write() 输出一份 JSON 报告，同时写出阶段的 folded 格式（可直接交给 flamegraph.pl）
+    和合并后的 .prof 文件（可用 snakeviz、flameprof 等工具查看）。
+    """
+
+    def __init__(self, name: str, profile: bool = False):
+        self.name = name
+        self.profile = profile
+        self.stages: Dict[str, StageRecord] = {}
+        self.workers: Dict[Tuple[str, int], Dict] = {}
+        self._stack = [name]
+        self._stats = pstats.Stats() if profile else None
+        self._start = time.time()
+        self._cpu_start = time.process_time()
+
+    @property
+    def current_stage(self) -> str:
+        return ";".join(self._stack)
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[StageRecord]:
+        """记录一个阶段的墙钟时间和主进程 CPU 时间，阶段可以嵌套，调用方可设置 record.lines"""
+        self._stack.append(name)
+        record = self.stages.setdefault(self.current_stage, StageRecord())
+        start = time.time()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall += time.time() - start
+            record.cpu += time.process_time() - cpu_start
+            record.calls += 1
+            self._stack.pop()
+
+    def submit(self, executor, func: Callable, *args):
+        """向进程池提交任务，结果需要通过 result() 取出"""
+        return executor.submit(run_task, func, time.time(), self.profile, args)
+
+    def result(self, future, count: Callable[[Any], int] = None) -> Any:
+        """取出 submit() 提交的任务结果并记录任务指标，count 用于从结果中计算处理的行数"""
+        return self.result_with_task(future, count)[0]
+
+    def result_with_task(self, future, count: Callable[[Any], int] = None) -> Tuple[Any, Dict]:
+        """与 result() 相同，同时返回任务指标，供调用方按任务的实际耗时调整之后的任务"""
+        result, task = future.result()
+        self.record_task(task, count(result) if count is not None else 0)
+        return result, task
+
+    def record_task(self, task: Dict, lines: int = 0):
+        """将一个任务的指标累加到当前阶段对应的工作进程上"""
+        worker = self.workers.setdefault((self.current_stage, task["pid"]), {
+            "tasks": 0, "wall": 0.0, "cpu": 0.0, "queue_wait": 0.0, "lines": 0, "peak_rss_kb": None,
+        })
+        worker["tasks"] += 1
+        worker["wall"] += task["wall"]
+        worker["cpu"] += task["cpu"]
+        worker["queue_wait"] += task["queue_wait"]
+        worker["lines"] += lines
+        if task["peak_rss_kb"] is not None:
+            worker["peak_rss_kb"] = max(worker["peak_rss_kb"] or 0, task["peak_rss_kb"])
+        if self._stats is not None and task.get("profile") is not None:
+            self._stats.add(_RawStats(task["profile"]))
+
+    def folded(self) -> List[str]:
+        """阶段的 folded 格式，每行为 阶段路径 + 自身耗时（微秒）"""
+        child_wall = {}
+        for path, record in self.stages.items():
+            parent = path.rpartition(";")[0]
+            child_wall[parent] = child_wall.get(parent, 0.0) + record.wall
+        total = time.time() - self._start
+        lines = []
+        root_self = total - child_wall.get(self.name, 0.0)
+        if root_self > 0:
+            lines.append(f"{self.name} {int(root_self * 1e6)}")
+        for path, record in self.stages.items():
+            self_wall = record.wall - child_wall.get(path, 0.0)
+            if self_wall > 0:
+                lines.append(f"{path} {int(self_wall * 1e6)}")
+        return lines
+
+    def top_functions(self, limit: int = PROFILE_TOP_FUNCTIONS) -> List[Dict]:
+        """合并后的 cProfile 数据中按累计时间排序的热点函数"""
+        if self._stats is None:
+            return []
+        rows = sorted(self._stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        return [{
+            "function": pstats.func_std_string(func),
+            "primitive_calls": cc,
+            "calls": nc,
+            "tottime": tt,
+            "cumtime": ct,
+        } for func, (cc, nc, tt, ct, _) in rows]
+
+    def report(self) -> Dict:
+        wall = time.time() - self._start
+        workers = []
+        for (stage, pid), worker in self.workers.items():
+            workers.append(dict(worker, stage=stage, pid=pid,
+                                lines_per_cpu_second=worker["lines"] / worker["cpu"] if worker["cpu"] > 0 else None))
+        worker_cpu = sum(worker["cpu"] for worker in self.workers.values())
+        return {
+            "name": self.name,
+            "pid": os.getpid(),
+            "wall": wall,
+            "main_cpu": time.process_time() - self._cpu_start,
+            "worker_cpu": worker_cpu,
+            "peak_rss_kb": peak_rss_kb(),
+            "children_peak_rss_kb": peak_rss_kb(children=True),
+            "stages": {path: record.to_dict() for path, record in self.stages.items()},
+            "workers": workers,
+            "folded": self.folded(),
+            "profile": self.top_functions(),
+        }
+
+    def write(self, report_path: str) -> List[str]:
+        """写出 JSON 报告、folded 文件以及（启用 profile 时）合并后的 .prof 文件，返回写出的文件路径"""
+        report_path = Path(report_path)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        report = self.report()
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        folded_path = report_path.with_suffix(".folded")
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            f.write("".join(line + "\n" for line in report["folded"]))
+        paths = [str(report_path), str(folded_path)]
+        if self._stats is not None:
+            prof_path = report_path.with_suffix(".prof")
+            self._stats.dump_stats(str(prof_path))
+            paths.append(str(prof_path))
+        return paths
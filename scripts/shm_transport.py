@@ -0,0 +1,124 @@
+import struct
+from array import array
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+from multiprocessing import resource_tracker, shared_memory
+
+# 共享内存块开头保存字符串个数，之后为 个数 + 1 个偏移量 (uint64)，最后为以 PACK_SEP 拼接的 UTF-8 数据
+PACK_HEADER = struct.Struct("<Q")
+OFFSET_TYPE = 'Q'
+# 字符串之间的分隔符，整块解码后一次 split 比按偏移量逐个解码快得多，打包的字符串中不能包含它
+PACK_SEP = "\n"
+
+# 工作进程返回给主进程的句柄: (共享内存名称, 字符串个数)，没有结果时名称为 None
+SharedStrings = Tuple[Optional[str], int]
+
+
+def export_strings(strings: Iterable[str]) -> SharedStrings:
+    """
+    在工作进程中把一组字符串打包写入新建的共享内存，返回可以廉价 pickle 的句柄。
+
+    共享内存的所有权交给主进程，由 PackedStrings 读取后释放，主进程放弃读取时必须用 release_unread() 释放；
+    这里取消 resource_tracker 的登记，避免工作进程退出时共享内存被提前回收。
+    """
+    strings = list(strings)
+    if not strings:
+        return None, 0
+    # 偏移量指向每个字符串的开头，最后一个偏移量为数据总长度加上一个分隔符
+    offsets = array(OFFSET_TYPE, [0])
+    total = 0
+    for string in strings:
+        total += len(string.encode('utf-8')) + 1
+        offsets.append(total)
+    data = PACK_SEP.join(strings).encode('utf-8')
+    offsets_start = PACK_HEADER.size
+    data_start = offsets_start + len(offsets) * offsets.itemsize
+    shm = shared_memory.SharedMemory(create=True, size=data_start + len(data))
+    try:
+        PACK_HEADER.pack_into(shm.buf, 0, len(strings))
+        shm.buf[offsets_start:data_start] = offsets.tobytes()
+        shm.buf[data_start:data_start + len(data)] = data
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    resource_tracker.unregister(shm._name, "shared_memory")
+    shm.close()
+    return shm.name, len(strings)
+
+
+class PackedStrings:
+    """
+    主进程中读取 export_strings() 的结果。
+
+    这是打包传输而不是零拷贝: 省掉的是 pickle 逐个反序列化成千上万个小对象的开销，
+    字符串本身仍要解码为 Python 对象。通过下标访问时只解码对应的字符串，
+    decode_all() 把整块数据一次解码并切分为全部字符串，两个脚本的主进程都在收到结果后立即这样做。
+    用完后调用 close()（或使用 with 语句）释放共享内存。
+    """
+
+    def __init__(self, handle: SharedStrings):
+        name, self._count = handle
+        self._shm = shared_memory.SharedMemory(name=name) if name is not None else None
+        if self._shm is None:
+            self._offsets = []
+            self._data = memoryview(b"")
+            return
+        buf = self._shm.buf
+        offsets_start = PACK_HEADER.size
+        data_start = offsets_start + (self._count + 1) * array(OFFSET_TYPE).itemsize
+        self._offsets = buf[offsets_start:data_start].cast(OFFSET_TYPE)
+        self._data = buf[data_start:data_start + self._offsets[self._count] - 1]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return str(self._data[self._offsets[index]:self._offsets[index + 1] - 1], 'utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.decode_all())
+
+    def decode_all(self) -> List[str]:
+        """一次解码全部字符串，比逐个按下标访问快得多"""
+        if self._count == 0:
+            return []
+        return str(self._data, 'utf-8').split(PACK_SEP)
+
+    def close(self):
+        """释放共享内存，之后不能再访问数据"""
+        if self._shm is None:
+            return
+        self._offsets.release()
+        self._data.release()
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def release_unread(futures: Iterable[Future], get_handle: Callable[[Any], SharedStrings]):
+    """
+    主进程出错或被中断、不再读取这些任务的结果时调用，通常放在 finally 中。
+
+    取消还没有开始的任务，等待已经开始的任务结束，释放它们写入的共享内存，
+    否则这些共享内存不属于任何进程，直到重启才会被回收。get_handle 从 future 的结果中取出句柄。
+    """
+    futures = list(futures)
+    for future in futures:
+        future.cancel()
+    for future in futures:
+        # 任务失败（包括工作进程同样收到 Ctrl+C）时没有写入共享内存
+        if future.cancelled() or future.exception() is not None:
+            continue
+        try:
+            PackedStrings(get_handle(future.result())).close()
+        except OSError:
+            continue
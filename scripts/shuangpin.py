@@ -0,0 +1,135 @@
+import re
+from typing import Dict, List, Tuple
+
+# pypinyin (Style.NORMAL) 可能输出的全部普通话音节，ü 写作 v
+SYLLABLES = """
+a ai an ang ao ba bai ban bang bao bei ben beng bi bian biang biao bie bin bing bo bong bu
+ca cai can cang cao ce cei cen ceng cha chai chan chang chao che chen cheng chi chong chou
+chu chua chuai chuan chuang chui chun chuo ci cong cou cu cuan cui cun cuo da dai dan dang
+dao de dei den deng di dia dian diao die din ding diu dong dou du duan dui dun duo e ei en
+eng er fa fan fang fei fen feng fiao fo fou fu ga gai gan gang gao ge gei gen geng gong gou
+gu gua guai guan guang gui gun guo ha hai han hang hao he hei hen heng hong hou hu hua huai
+huan huang hui hun huo ji jia jian jiang jiao jie jin jing jiong jiu ju juan jue jun ka kai
+kan kang kao ke kei ken keng kong kou ku kua kuai kuan kuang kui kun kuo la lai lan lang lao
+le lei len leng li lia lian liang liao lie lin ling liu lo long lou lu luan lun luo lv lve
+ma mai man mang mao me mei men meng mi mian miao mie min ming miu mo mou mu na nai nan nang
+nao ne nei nen neng ni nia nian niang niao nie nin ning niu nong nou nu nuan nun nuo nv nve
+o ou pa pai pan pang pao pei pen peng pi pian piao pie pin ping po pou pu qi qia qian qiang
+qiao qie qin qing qiong qiu qu quan que qun ran rang rao re ren reng ri rong rou ru rua ruan
+rui run ruo sa sai san sang sao se sen seng sha shai shan shang shao she shei shen sheng shi
+shou shu shua shuai shuan shuang shui shun shuo si song sou su suan sui sun suo ta tai tan
+tang tao te tei teng ti tian tiao tie ting tong tou tu tuan tui tun tuo wa wai wan wang wei
+wen weng wo wong wu xi xia xian xiang xiao xie xin xing xiong xiu xu xuan xue xun ya yan yang
+yao ye yi yin ying yo yong you yu yuan yue yun za zai zan zang zao ze zei zen zeng zha zhai
+zhan zhang zhao zhe zhei zhen zheng zhi zhong zhou zhu zhua zhuai zhuan zhuang zhui zhun zhuo
+zi zong zou zu zuan zui zun zuo
+""".split()
+
+SINGLE_INITIALS = "bpmfdtnlgkhjqxrzcsyw"
+
+# 双拼方案: 名称 -> (说明, 翘舌声母键位, 韵母键位, 零声母规则)
+# 零声母规则 "double": 单字母韵母双写，双字母韵母原样，其余为 首字母 + 韵母键 (小鹤、自然码)
+# 零声母规则 "o": 统一以 o 作为零声母键 (微软、搜狗)
+SCHEMES = {
+    "flypy": (
+        "小鹤双拼",
+        {"zh": "v", "ch": "i", "sh": "u"},
+        {
+            "a": "a", "o": "o", "e": "e", "i": "i", "u": "u", "v": "v",
+            "ai": "d", "ei": "w", "ao": "c", "ou": "z", "an": "j", "en": "f", "ang": "h", "eng": "g",
+            "ong": "s", "iong": "s", "er": "r",
+            "ia": "x", "ua": "x", "ie": "p", "iao": "n", "iu": "q", "ian": "m", "in": "b",
+            "iang": "l", "uang": "l", "ing": "k", "uai": "k",
+            "uo": "o", "ui": "v", "uan": "r", "un": "y", "ue": "t", "ve": "t",
+        },
+        "double",
+    ),
+    "ziranma": (
+        "自然码双拼",
+        {"zh": "v", "ch": "i", "sh": "u"},
+        {
+            "a": "a", "o": "o", "e": "e", "i": "i", "u": "u", "v": "v",
+            "ai": "l", "ei": "z", "ao": "k", "ou": "b", "an": "j", "en": "f", "ang": "h", "eng": "g",
+            "ong": "s", "iong": "s", "er": "r",
+            "ia": "w", "ua": "w", "ie": "x", "iao": "c", "iu": "q", "ian": "m", "in": "n",
+            "iang": "d", "uang": "d", "ing": "y", "uai": "y",
+            "uo": "o", "ui": "v", "uan": "r", "un": "p", "ue": "t", "ve": "t",
+        },
+        "double",
+    ),
+    "mspy": (
+        "微软双拼",
+        {"zh": "v", "ch": "i", "sh": "u"},
+        {
+            "a": "a", "o": "o", "e": "e", "i": "i", "u": "u", "v": "y",
+            "ai": "l", "ei": "z", "ao": "k", "ou": "b", "an": "j", "en": "f", "ang": "h", "eng": "g",
+            "ong": "s", "iong": "s", "er": "r",
+            "ia": "w", "ua": "w", "ie": "x", "iao": "c", "iu": "q", "ian": "m", "in": "n",
+            "iang": "d", "uang": "d", "ing": ";", "uai": "y",
+            "uo": "o", "ui": "v", "uan": "r", "un": "p", "ue": "t", "ve": "v",
+        },
+        "o",
+    ),
+    "sogou": (
+        "搜狗双拼",
+        {"zh": "v", "ch": "i", "sh": "u"},
+        {
+            "a": "a", "o": "o", "e": "e", "i": "i", "u": "u", "v": "y",
+            "ai": "l", "ei": "z", "ao": "k", "ou": "b", "an": "j", "en": "f", "ang": "h", "eng": "g",
+            "ong": "s", "iong": "s", "er": "r",
+            "ia": "w", "ua": "w", "ie": "x", "iao": "c", "iu": "q", "ian": "m", "in": "n",
+            "iang": "d", "uang": "d", "ing": ";", "uai": "y",
+            "uo": "o", "ui": "v", "uan": "r", "un": "p", "ue": "t", "ve": "t",
+        },
+        "o",
+    ),
+}
+
+# 英文、数字等非拼音内容原样保留
+PASSTHROUGH_RE = re.compile(r'[a-zA-Z0-9]+|[0-9]+\.[0-9]+')
+
+
+def split_syllable(syllable: str) -> Tuple[str, str]:
+    """将音节拆分为声母和韵母，y、w 按声母处理"""
+    if syllable[:2] in ("zh", "ch", "sh"):
+        return syllable[:2], syllable[2:]
+    if len(syllable) > 1 and syllable[0] in SINGLE_INITIALS:
+        return syllable[0], syllable[1:]
+    return "", syllable
+
+
+def encode_syllable(syllable: str, scheme: str) -> str:
+    """按方案编码单个音节，无法编码时抛出 KeyError"""
+    _, initial_keys, final_keys, zero_rule = SCHEMES[scheme]
+    initial, final = split_syllable(syllable)
+    if initial:
+        return initial_keys.get(initial, initial) + final_keys[final]
+    if zero_rule == "o":
+        return "o" + final_keys[final]
+    if len(final) == 1:
+        return final * 2
+    if len(final) == 2:
+        return final
+    return final[0] + final_keys[final]
+
+
+def build_table(scheme: str) -> Dict[str, str]:
+    """预先计算方案下全部音节的编码"""
+    return {syllable: encode_syllable(syllable, scheme) for syllable in SYLLABLES}
+
+
+SHUANGPIN_TABLES = {scheme: build_table(scheme) for scheme in SCHEMES}
+
+
+def pinyin_to_shuangpin(pinyins: List[str], scheme: str) -> List[str]:
+    """将拼音列表转换为双拼编码列表，英文和数字原样保留，其它无法编码的内容丢弃"""
+    table = SHUANGPIN_TABLES[scheme]
+    codes = []
+    for syllable in pinyins:
+        code = table.get(syllable)
+        if code is None:
+            if not PASSTHROUGH_RE.fullmatch(syllable):
+                continue
+            code = syllable
+        codes.append(code)
+    return codes
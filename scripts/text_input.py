@@ -0,0 +1,102 @@
+import os
+import re
+import mmap
+import contextlib
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+# 与文本模式读取后 split("\n\n") 等价的段落分隔符: 两个换行，\r\n 和单独的 \r 也算一个换行
+PARAGRAPH_SEP_RE = re.compile(rb"(?:\r\n|\r(?!\n)|\n){2}")
+# 只含 ASCII 空白的段落，分词后不会得到任何词，不必解码
+BLANK_RE = re.compile(rb"\s*")
+NEWLINE_BYTES = b"\r\n"
+
+# 一段文件内容: (文件路径, 起始字节, 结束字节)
+Span = Tuple[Union[str, Path], int, int]
+
+
+@contextlib.contextmanager
+def open_mapped(file_path: Union[str, Path]) -> Iterator[Union[mmap.mmap, bytes]]:
+    """只读 mmap 打开文件，空文件无法映射，产出 b"" """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mapped
+    finally:
+        mapped.close()
+
+
+def decode_span(buf, start: int, end: int) -> str:
+    """把 [start, end) 的字节直接解码为字符串，不先复制出中间的 bytes，换行的处理与文本模式一致"""
+    with memoryview(buf) as view, view[start:end] as part:
+        text = str(part, 'utf-8')
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def find_paragraph_break(buf, target: int) -> Optional[Tuple[int, int]]:
+    """
+    找到起点不早于 target 的第一个段落分隔符，返回其 [起点, 终点)。
+
+    连续多个换行时，对整个文件 split 会从这串换行的开头起两两配对，
+    这里同样回到开头重新配对，保证切出的块再各自 split 得到的段落与整体 split 完全一致。
+    """
+    match = PARAGRAPH_SEP_RE.search(buf, target)
+    if match is None:
+        return None
+    run_start = match.start()
+    while run_start > 0 and buf[run_start - 1] in NEWLINE_BYTES:
+        run_start -= 1
+    for match in PARAGRAPH_SEP_RE.finditer(buf, run_start):
+        if match.start() >= target:
+            return match.span()
+    return None
+
+
+def iter_paragraph_spans(buf, start: int, end: int) -> Iterator[Tuple[int, int]]:
+    """按序产出 [start, end) 中各段落的字节范围，与解码后 split("\\n\\n") 的结果一一对应"""
+    pos = start
+    for match in PARAGRAPH_SEP_RE.finditer(buf, start, end):
+        yield pos, match.start()
+        pos = match.end()
+    yield pos, end
+
+
+def read_span_paragraphs(span: Span) -> List[str]:
+    """
+    读取一段文件内容中的段落，每个段落直接从 mmap 解码，只复制一次。
+
+    只含空白的段落不解码，直接跳过。
+    """
+    file_path, start, end = span
+    paragraphs = []
+    with open_mapped(file_path) as buf:
+        for paragraph_start, paragraph_end in iter_paragraph_spans(buf, start, end):
+            if BLANK_RE.fullmatch(buf, paragraph_start, paragraph_end):
+                continue
+            paragraphs.append(decode_span(buf, paragraph_start, paragraph_end))
+    return paragraphs
+
+
+def iter_paragraph_split(file_path: Union[str, Path], next_chunk_bytes: Callable[[], int]) -> Iterator[Span]:
+    """
+    在段落边界处把文件依次切成若干段，每切一段前调用 next_chunk_bytes() 取得这一段的目标字节数，
+    调用方可以在迭代过程中根据已完成任务的实测耗时调整之后各段的大小，例如第一段用于补满上一个任务块。
+
+    只在 mmap 上查找分隔符，不解码文件内容；迭代结束前文件保持映射。
+    """
+    with open_mapped(file_path) as buf:
+        size = len(buf)
+        pos = 0
+        while pos < size:
+            budget = next_chunk_bytes()
+            found = find_paragraph_break(buf, pos + budget) if pos + budget < size else None
+            if found is None:
+                yield file_path, pos, size
+                break
+            yield file_path, pos, found[0]
+            pos = found[1]
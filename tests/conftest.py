@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 脚本都是 scripts/ 下的独立模块，按运行脚本时的方式导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
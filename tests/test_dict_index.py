@@ -0,0 +1,85 @@
+import os
+import heapq
+
+import pytest
+
+from dict_index import DictIndex, IndexBuilder
+
+SYLLABLES = ["ni", "hao", "zhong", "guo", "shi", "jie", "chun", "tian", "xia", "lv"]
+
+
+def make_entries(n: int = 150):
+    """按词排序的 (词, 拼音列表, 出现次数)，拼音有重复和共同前缀，数量跨越多个块"""
+    entries = []
+    for i in range(n):
+        word = chr(0x4e00 + i) + chr(0x4e00 + i % 7)
+        pinyin_list = [SYLLABLES[i % len(SYLLABLES)], SYLLABLES[(i * 3) % len(SYLLABLES)]]
+        entries.append((word, pinyin_list, (i * 31) % 97 + 1))
+    return entries
+
+
+def build_index(entries, max_memory=None) -> IndexBuilder:
+    builder = IndexBuilder(max_memory)
+    for word, pinyin_list, count in entries:
+        builder.add(word, pinyin_list, count)
+    return builder
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / "index.bin"
+    build_index(make_entries()).write(str(path))
+    with DictIndex(str(path)) as index:
+        yield index
+
+
+def expected_for(entries, predicate):
+    return [(word, "'".join(pinyin_list), count) for word, pinyin_list, count in entries if predicate("".join(pinyin_list))]
+
+
+def test_lookup_word(index):
+    entries = make_entries()
+    assert len(index) == len(entries)
+    for word, pinyin_list, count in entries:
+        assert word in index
+        assert index.lookup_word(word) == [(word, "'".join(pinyin_list), count)]
+    assert index.lookup_word("不存在") == []
+    assert "不存在" not in index
+    # 词的前缀不是词
+    assert entries[0][0][:1] not in index
+
+
+@pytest.mark.parametrize("query", ["nihao", "ni'hao", "ni hao", "NiHao", "lvzhong"])
+def test_lookup_pinyin(index, query):
+    normalized = query.replace("'", "").replace(" ", "").lower()
+    expected = expected_for(make_entries(), lambda pinyin: pinyin == normalized)
+    result = index.lookup_pinyin(query)
+    assert sorted(result) == sorted(expected)
+    assert [count for *_, count in result] == sorted((count for *_, count in expected), reverse=True)
+
+
+@pytest.mark.parametrize("prefix", ["", "n", "ni", "nih", "zh", "zhongg", "lv", "x", "q"])
+def test_complete_prefix(index, prefix):
+    entries = make_entries()
+    expected = expected_for(entries, lambda pinyin: pinyin.startswith(prefix))
+    assert sorted(index.complete(prefix, limit=None)) == sorted(expected)
+    top = index.complete(prefix, limit=5)
+    assert [count for *_, count in top] == [count for *_, count in heapq.nlargest(5, expected, key=lambda entry: entry[2])]
+
+
+@pytest.mark.parametrize("max_memory", [1, 2000, 20000])
+def test_spilled_build_matches_in_memory_build(max_memory):
+    entries = make_entries()
+    expected = build_index(entries).build()
+    spilled = build_index(entries, max_memory)
+    assert spilled._run_paths
+    run_dir = spilled._run_dir.name
+    assert spilled.build() == expected
+    assert not os.path.exists(run_dir)
+
+
+def test_tap_passes_lines_through():
+    entries = make_entries(40)
+    builder = IndexBuilder()
+    assert list(builder.tap(iter(entries))) == entries
+    assert builder.build() == build_index(entries).build()
@@ -0,0 +1,70 @@
+import pytest
+
+from exclude_dict import ExcludeSet, iter_dict_words
+from merge_texts import load_all_lines, normalize_dict_word
+
+RIME_DICT = """# Rime dictionary
+---
+name: test
+version: "1"
+...
+
+電腦\tdian nao\t100
+天氣\ttian qi
+# 注释
+"""
+
+
+def write_text(path, text: str) -> str:
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_rime_dict_skips_yaml_header(tmp_path):
+    path = write_text(tmp_path / "test.dict.yaml", RIME_DICT)
+    assert list(iter_dict_words(path)) == ["電腦", "天氣"]
+
+
+def test_yaml_without_header_end_is_parsed_from_start(tmp_path, capsys):
+    path = write_text(tmp_path / "bare.dict.yaml", "你好\tni hao\t1\n世界\tshi jie\n")
+    assert list(iter_dict_words(path)) == ["你好", "世界"]
+    assert "Warning" in capsys.readouterr().out
+
+
+def test_text_dict_formats(tmp_path):
+    path = write_text(tmp_path / "words.txt", "你好 ni'hao 1\nshi'jie 世界 2\n春天\n\n# 注释\n")
+    assert list(iter_dict_words(path)) == ["你好", "世界", "春天"]
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_traditional_dict_matches_normalized_lines(tmp_path, cache):
+    path = write_text(tmp_path / "test.dict.yaml", RIME_DICT)
+    cache_dir = str(tmp_path / "cache") if cache else None
+    for _ in range(2):
+        exclude = ExcludeSet.from_files([path], cache_dir, normalize_dict_word, "v1")
+        assert "电脑" in exclude
+        assert "天气" in exclude
+        assert "電腦" not in exclude
+    # 规范化规则的版本变化时不复用缓存
+    assert "電腦" in ExcludeSet.from_files([path], cache_dir, None, "v2")
+
+
+def test_load_all_lines_excludes_traditional_dict_words(tmp_path):
+    corpus = tmp_path / "text"
+    corpus.mkdir()
+    write_text(corpus / "a.txt", "电脑\n天氣\n春暖花开\n")
+    path = write_text(tmp_path / "test.dict.yaml", RIME_DICT)
+    exclude = ExcludeSet.from_files([path], normalize=normalize_dict_word)
+    store, _ = load_all_lines(str(corpus), exclude=exclude, backend="serial", workers=1)
+    assert list(store.keys()) == ["春暖花开"]
+
+
+def test_multiple_dicts_are_merged(tmp_path):
+    first = write_text(tmp_path / "a.txt", "你好\n世界\n")
+    second = write_text(tmp_path / "b.txt", "世界\n春天\n")
+    exclude = ExcludeSet.from_files([first, second])
+    assert len(exclude) == 3
+    assert all(word in exclude for word in ["你好", "世界", "春天"])
+    assert "夏天" not in exclude
+    assert list(exclude._digests) == sorted(exclude._digests)
+    assert len(ExcludeSet.from_files([])) == 0
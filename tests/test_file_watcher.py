@@ -0,0 +1,77 @@
+import sys
+import shutil
+from pathlib import Path
+
+import pytest
+
+from file_watcher import InotifyWatcher
+from executor_backend import SerialExecutor
+from merge_texts import IncrementalBuild, find_txt_files
+from profiling import Profiler
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify 只在 Linux 上可用")
+
+# 等待事件的超时（秒），正常情况下事件在几十毫秒内到达
+WAIT_SECONDS = 2.0
+
+
+def write_text(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "text"
+    write_text(root / "a" / "x.txt", "你好世界\n春暖花开\n")
+    write_text(root / "a" / "deep" / "y.txt", "春暖花开\n")
+    write_text(root / "b" / "z.txt", "天气晴朗\n")
+    write_text(root / "top.txt", "你好世界\n")
+    return root
+
+
+@pytest.fixture
+def watcher(tree):
+    watcher = InotifyWatcher(str(tree))
+    yield watcher
+    watcher.close()
+
+
+def test_renamed_directory_reports_old_and_new_files(tree, watcher):
+    (tree / "a").rename(tree / "c")
+    assert watcher.wait(WAIT_SECONDS) == {
+        tree / "a" / "x.txt", tree / "a" / "deep" / "y.txt",
+        tree / "c" / "x.txt", tree / "c" / "deep" / "y.txt",
+    }
+    # 新路径下的修改按新路径报告
+    write_text(tree / "c" / "deep" / "y.txt", "天气晴朗\n")
+    assert watcher.wait(WAIT_SECONDS) == {tree / "c" / "deep" / "y.txt"}
+
+
+def test_directory_moved_out_reports_its_files(tree, watcher):
+    outside = tree.parent / "outside"
+    shutil.move(str(tree / "b"), str(outside))
+    assert watcher.wait(WAIT_SECONDS) == {tree / "b" / "z.txt"}
+    # 移出目录树后不再监视
+    write_text(outside / "z.txt", "你好世界\n")
+    assert watcher.wait(0.5) == set()
+
+
+def test_deleted_directory_reports_its_files(tree, watcher):
+    shutil.rmtree(tree / "a")
+    assert watcher.wait(WAIT_SECONDS) == {tree / "a" / "x.txt", tree / "a" / "deep" / "y.txt"}
+
+
+def test_incremental_build_matches_fresh_build_after_directory_moves(tree, watcher):
+    profiler = Profiler("test")
+    build = IncrementalBuild(SerialExecutor(), 1, profiler, backend="serial")
+    build.update(find_txt_files(str(tree)))
+
+    (tree / "a").rename(tree / "c")
+    shutil.move(str(tree / "b"), str(tree.parent / "outside"))
+    build.update(watcher.wait(WAIT_SECONDS))
+
+    fresh = IncrementalBuild(SerialExecutor(), 1, profiler, backend="serial")
+    fresh.update(find_txt_files(str(tree)))
+    assert build.lines_with_pinyin() == fresh.lines_with_pinyin()
+    assert set(build.file_stores) == set(find_txt_files(str(tree)))
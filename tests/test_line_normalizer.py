@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from benchmark import LINE_KINDS, make_line, make_vocabulary, normalizer_mismatches, reference_normalize
+from merge_texts import LINE_NORMALIZER, T2S_TRIGGER_CHARS, LineCategory, classify_line
+
+# 覆盖符号删除、标点分割、oo 删除、繁转简和 KEEP_REGEX 过滤的行
+EDGE_CASES = [
+    "你好世界",
+    "《三体》",
+    "【置顶】春暖花开",
+    "（注）天气晴朗",
+    "你好，世界。再见！",
+    "hello, 世界",
+    "中 文 空 格",
+    "fooo你好",
+    "oo你好oo",
+    "電腦軟體",
+    "iPhone手机",
+    "3.14圆周率",
+    "♂男♀女",
+    "标点结尾，",
+    "，",
+    "《》",
+    "半角,逗号.句号",
+    "一·二",
+    "日本語テキスト",
+]
+
+
+def valid(lines):
+    return [line.strip() for line in lines if classify_line(line.strip()) is LineCategory.VALID]
+
+
+@pytest.mark.parametrize("line", valid(EDGE_CASES))
+def test_matches_reference_on_edge_cases(line):
+    assert LINE_NORMALIZER.normalize(line) == reference_normalize(line)
+
+
+def test_matches_reference_on_synthetic_lines():
+    rng = random.Random(1)
+    vocabulary = make_vocabulary(rng, 2000)
+    traditional_chars = sorted(T2S_TRIGGER_CHARS or []) or vocabulary
+    kinds = [kind for kind, _ in LINE_KINDS]
+    weights = [weight for _, weight in LINE_KINDS]
+    lines = valid(make_line(rng, kind, vocabulary, traditional_chars) for kind in rng.choices(kinds, weights, k=5000))
+    assert lines
+    assert normalizer_mismatches(lines) == []
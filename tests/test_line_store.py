@@ -0,0 +1,108 @@
+import pytest
+
+from line_store import (STORE_BLOCK_SIZE, FrontCodedStore, StoreBuilder, build_store, decode_varint,
+                        encode_varint, merge_stores, store_from_lines)
+
+
+def make_items(n: int):
+    """n 个按序排列、相邻条目共享前缀的 (字符串, 次数)，次数覆盖单字节和多字节的 varint"""
+    keys = sorted({f"春暖花开{i // 10}的{i}" for i in range(n)})
+    return [(key, (i * 37) % 300 + 1) for i, key in enumerate(keys)]
+
+
+@pytest.mark.parametrize("value", [0, 1, 0x7f, 0x80, 300, 1 << 14, (1 << 35) + 7])
+def test_varint_round_trip(value):
+    data = b"x" + encode_varint(value) + b"y"
+    assert decode_varint(data, 1) == (value, len(data) - 1)
+
+
+# 块边界: 空、不满一块、正好一块、多一个条目、正好两块、跨越多块
+@pytest.mark.parametrize("n", [0, 1, STORE_BLOCK_SIZE - 1, STORE_BLOCK_SIZE, STORE_BLOCK_SIZE + 1,
+                               2 * STORE_BLOCK_SIZE, 2 * STORE_BLOCK_SIZE + 1, 5 * STORE_BLOCK_SIZE + 3])
+def test_round_trip_across_block_boundaries(n):
+    items = make_items(n)
+    store = FrontCodedStore(build_store(items))
+    assert len(store) == n
+    assert list(store) == items
+    assert list(store.keys()) == [key for key, _ in items]
+    assert store.max_count() == max((count for _, count in items), default=0)
+    for key, count in items:
+        assert store.get(key) == count
+        assert key in store
+
+
+@pytest.mark.parametrize("n", [1, STORE_BLOCK_SIZE, STORE_BLOCK_SIZE + 1, 3 * STORE_BLOCK_SIZE])
+def test_missing_keys(n):
+    items = make_items(n)
+    store = FrontCodedStore(build_store(items))
+    keys = [key for key, _ in items]
+    # 比所有键小、比所有键大，以及夹在相邻键之间（包括块头前后）的字符串
+    missing = ["", "\u0001", keys[0][:-1], keys[-1] + "￿"]
+    missing.extend(key + "\u0001" for key in keys)
+    for key in missing:
+        assert key not in keys
+        assert store.get(key) is None
+        assert store.get(key, 0) == 0
+        assert key not in store
+
+
+def test_long_common_prefix_and_non_ascii():
+    long_prefix = "长" * 200
+    items = [(long_prefix + "a", 1), (long_prefix + "b", 2), (long_prefix + "b🀄", 3), ("😀", 1 << 20)]
+    store = FrontCodedStore(build_store(items))
+    assert list(store) == items
+    assert store.get(long_prefix + "b🀄") == 3
+
+
+def test_iter_prefix():
+    items = make_items(4 * STORE_BLOCK_SIZE)
+    store = FrontCodedStore(build_store(items))
+    for prefix in ["", "春暖花开1", "春暖花开3的3", "春暖花开9", "夏"]:
+        expected = [(key, count) for key, count in items if key.startswith(prefix)]
+        assert list(store.iter_prefix(prefix)) == expected
+
+
+def test_store_inside_larger_buffer():
+    items = make_items(STORE_BLOCK_SIZE + 5)
+    data = build_store(items)
+    buffer = b"\0" * 16 + data + b"tail"
+    store = FrontCodedStore(buffer, 16)
+    assert list(store) == items
+    assert store.nbytes == len(data)
+    assert store.get(items[-1][0]) == items[-1][1]
+
+
+def test_builder_requires_increasing_keys():
+    builder = StoreBuilder()
+    builder.add("b", 1)
+    with pytest.raises(ValueError):
+        builder.add("b", 1)
+    with pytest.raises(ValueError):
+        builder.add("a", 1)
+
+
+def test_rejects_invalid_data():
+    with pytest.raises(ValueError):
+        FrontCodedStore(b"\0" * 64)
+
+
+def test_store_from_lines_counts_and_filters():
+    lines = ["你好", "世界", "你好", "天气", "你好", "世界"]
+    assert list(FrontCodedStore(store_from_lines(lines))) == [("世界", 2), ("你好", 3), ("天气", 1)]
+    kept = FrontCodedStore(store_from_lines(lines, lambda line: line != "世界"))
+    assert list(kept) == [("你好", 3), ("天气", 1)]
+
+
+def test_merge_stores_sums_counts():
+    first = make_items(2 * STORE_BLOCK_SIZE)
+    second = [(key, 5) for key, _ in first[::3]] + [("夏天", 2)]
+    second.sort()
+    merged = FrontCodedStore(merge_stores([build_store(first), build_store(second), build_store([])]))
+    expected = dict(first)
+    for key, count in second:
+        expected[key] = expected.get(key, 0) + count
+    assert list(merged) == sorted(expected.items())
+
+    kept = FrontCodedStore(merge_stores([build_store(first), build_store(second)], lambda key: key != "夏天"))
+    assert "夏天" not in kept
+    assert len(kept) == len(expected) - 1
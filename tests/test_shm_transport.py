@@ -0,0 +1,35 @@
+from concurrent.futures import Future
+
+import pytest
+
+from shm_transport import PackedStrings, export_strings, release_unread
+
+STRINGS = ["ni'hao", "", "chun'nuan'hua'kai", "🀄", "shi'jie"]
+
+
+def test_round_trip():
+    with PackedStrings(export_strings(STRINGS)) as packed:
+        assert len(packed) == len(STRINGS)
+        assert packed.decode_all() == STRINGS
+        assert [packed[i] for i in range(len(STRINGS))] == STRINGS
+        with pytest.raises(IndexError):
+            packed[len(STRINGS)]
+
+
+def test_empty():
+    handle = export_strings([])
+    assert handle == (None, 0)
+    with PackedStrings(handle) as packed:
+        assert packed.decode_all() == []
+
+
+def test_release_unread_unlinks_finished_results():
+    done = Future()
+    done.set_result(export_strings(STRINGS))
+    failed = Future()
+    failed.set_exception(RuntimeError("worker failed"))
+    pending = Future()
+    release_unread([done, failed, pending], lambda handle: handle)
+    assert pending.cancelled()
+    with pytest.raises(FileNotFoundError):
+        PackedStrings(done.result())
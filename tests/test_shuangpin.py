@@ -0,0 +1,54 @@
+import pytest
+
+from shuangpin import SCHEMES, SHUANGPIN_TABLES, pinyin_to_shuangpin
+
+# 各方案的期望编码: 方案 -> {音节: 编码}
+# 覆盖零声母音节、翘舌声母以及 lve/nve（üe）等容易出错的情况
+EXPECTED = {
+    "flypy": {
+        "a": "aa", "o": "oo", "e": "ee", "ang": "ah", "er": "er", "ai": "ai", "eng": "eg",
+        "zhi": "vi", "chi": "ii", "shi": "ui", "zhang": "vh", "chuang": "il", "shuo": "uo",
+        "lv": "lv", "lve": "lt", "nve": "nt", "jue": "jt", "xiong": "xs",
+    },
+    "ziranma": {
+        "a": "aa", "o": "oo", "e": "ee", "ang": "ah", "er": "er", "ai": "ai", "eng": "eg",
+        "zhi": "vi", "chi": "ii", "shi": "ui", "zhang": "vh", "chuang": "id", "shuo": "uo",
+        "lv": "lv", "lve": "lt", "nve": "nt", "jue": "jt", "xiong": "xs",
+    },
+    "mspy": {
+        "a": "oa", "o": "oo", "e": "oe", "ang": "oh", "er": "or", "ai": "ol", "eng": "og",
+        "zhi": "vi", "chi": "ii", "shi": "ui", "zhang": "vh", "chuang": "id", "shuo": "uo",
+        "lv": "ly", "lve": "lv", "nve": "nv", "jue": "jt", "xiong": "xs",
+    },
+    "sogou": {
+        "a": "oa", "o": "oo", "e": "oe", "ang": "oh", "er": "or", "ai": "ol", "eng": "og",
+        "zhi": "vi", "chi": "ii", "shi": "ui", "zhang": "vh", "chuang": "id", "shuo": "uo",
+        "lv": "ly", "lve": "lt", "nve": "nt", "jue": "jt", "xiong": "xs",
+    },
+}
+
+CASES = [
+    (scheme, syllable, code)
+    for scheme, table in EXPECTED.items()
+    for syllable, code in table.items()
+]
+
+
+def test_every_scheme_has_expectations():
+    assert set(EXPECTED) == set(SCHEMES)
+
+
+@pytest.mark.parametrize("scheme, syllable, code", CASES)
+def test_encode_syllable(scheme, syllable, code):
+    assert SHUANGPIN_TABLES[scheme][syllable] == code
+
+
+@pytest.mark.parametrize("scheme", sorted(SCHEMES))
+def test_codes_are_two_keys(scheme):
+    assert all(len(code) == 2 for code in SHUANGPIN_TABLES[scheme].values())
+
+
+@pytest.mark.parametrize("scheme", sorted(SCHEMES))
+def test_passthrough_and_unknown(scheme):
+    assert pinyin_to_shuangpin(["ni", "hao", "abc", "3", "，"], scheme) == [
+        SHUANGPIN_TABLES[scheme]["ni"], SHUANGPIN_TABLES[scheme]["hao"], "abc", "3"]